@@ -15,6 +15,7 @@ from app import db
 from app.auth.utils import login_required
 from app.challenges import challenges
 from app.main.form import BattleForm
+from app.main.tags import set_tags
 from app.models import Battle, BattleComment, BattleVote
 
 
@@ -68,6 +69,7 @@ def create_battle():
 
         try:
             db.session.add(new_battle)
+            set_tags(new_battle, clean_tags)
             db.session.commit()
             current_app.logger.info(
                 f"User {session['user_id']} created battle '{new_battle.title}' (ID: {new_battle.id})"
@@ -0,0 +1,146 @@
+"""
+Per-user affinity profiles of the recommended feed: how much each user
+cares about each language and tag.
+
+Every post, comment and reaction adds its weight to the language and tags
+of the post it is on (``UserAffinity`` rows, moved by ``UPDATE ... SET
+weight = weight + n`` in the transaction of the write itself), and takes it
+back when it is deleted; activity on a deleted post keeps its weight, the
+interest it showed stays. The languages a user lists on their profile
+(``User.languages``) count as if they had posted in them.
+
+The feed reads a profile from one indexed lookup of the user's rows, sized
+by how many languages and tags they use rather than how much they wrote,
+and caches it per worker for ``RECOMMEND_PROFILE_CACHE_TTL`` seconds; this
+worker's writes drop the user's entry at once.
+"""
+
+from flask import current_app
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.main.search import QueryCache
+from app.main.tags import split_tags
+from app.models import UserAffinity
+
+# weight of each kind of activity on a post
+POST_WEIGHT = 3
+COMMENT_WEIGHT = 2
+REACTION_WEIGHT = 1
+# weight of each language listed in User.languages
+SEED_WEIGHT = POST_WEIGHT
+# tags of a profile the feed matches, heaviest first
+PROFILE_TAGS = 20
+# longest language name kept (tags: TAG_LENGTH)
+NAME_LENGTH = 50
+
+LANGUAGE = "language"
+TAG = "tag"
+
+
+def _names(language: str | None, tags: str | None) -> list[tuple[str, str]]:
+    names = [(TAG, tag) for tag in split_tags(tags)]
+    language = (language or "").strip().lower()
+    if language and len(language) <= NAME_LENGTH:
+        names.insert(0, (LANGUAGE, language))
+    return names
+
+
+class Affinity:
+    """A user's ``{name: weight}`` of ``languages`` and ``tags``, heaviest first."""
+
+    def __init__(self, languages: dict[str, int], tags: dict[str, int]):
+        self.languages = languages
+        self.tags = tags
+
+
+def record(user_id: int, post, weight: int) -> None:
+    """
+    Add ``weight`` to the affinities of ``user_id`` for the language and tags
+    of ``post``; a negative weight takes it back.
+    """
+    names = _names(post.language, post.tags)
+    if not names or not weight:
+        return
+    table = UserAffinity.__table__
+    mine = table.c.user_id == user_id
+    key = tuple_(table.c.kind, table.c.name)
+
+    def add(names):
+        db.session.execute(
+            table.update()
+            .where(mine, key.in_(names))
+            .values(weight=table.c.weight + weight)
+        )
+
+    existing = {
+        tuple(row)
+        for row in db.session.execute(
+            select(table.c.kind, table.c.name).where(mine, key.in_(names))
+        )
+    }
+    if existing:
+        add(list(existing))
+    missing = [name for name in names if name not in existing]
+    if missing and weight > 0:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    table.insert(),
+                    [
+                        {
+                            "user_id": user_id,
+                            "kind": kind,
+                            "name": name,
+                            "weight": weight,
+                        }
+                        for kind, name in missing
+                    ],
+                )
+        except IntegrityError:
+            # another request of this user inserted them first
+            add(missing)
+    get_cache().discard(user_id)
+
+
+def profile_of(user) -> Affinity:
+    """The affinity profile of ``user``, from the cache when it is there."""
+    cache = get_cache()
+    # one version for every profile: writes discard their user's entry
+    cached = cache.get(user.id, 0)
+    if cached is not None:
+        return cached
+
+    table = UserAffinity.__table__
+    languages: dict[str, int] = {}
+    tags: dict[str, int] = {}
+    for kind, name, weight in db.session.execute(
+        select(table.c.kind, table.c.name, table.c.weight)
+        .where(table.c.user_id == user.id, table.c.weight > 0)
+        .order_by(table.c.weight.desc(), table.c.name)
+    ):
+        if kind == LANGUAGE:
+            languages[name] = weight
+        elif len(tags) < PROFILE_TAGS:
+            tags[name] = weight
+    for name in split_tags(user.languages):
+        languages[name] = languages.get(name, 0) + SEED_WEIGHT
+    languages = dict(sorted(languages.items(), key=lambda item: -item[1]))
+
+    affinity = Affinity(languages, tags)
+    cache.put(user.id, 0, affinity)
+    return affinity
+
+
+_CACHE: QueryCache | None = None
+
+
+def get_cache() -> QueryCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = QueryCache(
+            maxsize=current_app.config.get("RECOMMEND_PROFILE_CACHE_SIZE", 4096),
+            ttl=current_app.config.get("RECOMMEND_PROFILE_CACHE_TTL", 60),
+        )
+    return _CACHE
@@ -0,0 +1,191 @@
+"""
+Denormalized engagement counters of posts (``Post.reaction_count`` and
+``Post.comment_count``).
+
+A counter moves by an ``UPDATE ... SET n = n + 1`` in the transaction that
+adds or deletes the reaction or comment, so both commit or roll back
+together and concurrent writers never lose an increment. A deletion is only
+counted if this transaction's ``DELETE`` removed the row: two requests
+deleting the same comment decrement it once.
+
+The statements go through the tables rather than the ORM, so a count
+changing is not an edit of the post (no ``PostChange``, no search reindex).
+A deleted post takes its counters with it.
+
+Pages of posts load their reactions and comments here too, a fixed number
+of queries for the whole page rather than a few per post. Only the first
+``PREVIEW_COMMENTS`` comments of a post come with it; the rest are read on
+demand, ``COMMENTS_PAGE`` at a time, from the cursor after the last shown.
+"""
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.main.keyset import Cursor
+from app.models import Comment, Post, Reaction
+
+# posts recounted per UPDATE
+RECOUNT_CHUNK = 1000
+# comments rendered with a post
+PREVIEW_COMMENTS = 3
+# comments per page of the comments API
+COMMENTS_PAGE = 20
+# the list cursors of comments belong to
+COMMENTS_SALT = "comments"
+
+# bump() argument of each counted model
+_COUNTED = {Reaction: "reactions", Comment: "comments"}
+
+
+def bump(post_id: int, reactions: int = 0, comments: int = 0) -> bool:
+    """Move the counters of a post; False if there is no such post."""
+    posts = Post.__table__
+    result = db.session.execute(
+        posts.update()
+        .where(posts.c.id == post_id)
+        .values(
+            reaction_count=posts.c.reaction_count + reactions,
+            comment_count=posts.c.comment_count + comments,
+        )
+    )
+    return result.rowcount == 1
+
+
+def delete_counted(row) -> bool:
+    """
+    Delete a ``Reaction`` or ``Comment`` and uncount it from its post; False
+    if another transaction deleted it first.
+    """
+    table = type(row).__table__
+    result = db.session.execute(table.delete().where(table.c.id == row.id))
+    db.session.expunge(row)
+    if result.rowcount != 1:
+        return False
+    bump(row.post_id, **{_COUNTED[type(row)]: -1})
+    return True
+
+
+def drifted() -> list[tuple[int, int, int, int, int]]:
+    """
+    ``(post id, reaction_count, reactions, comment_count, comments)`` of the
+    posts whose counters differ from the rows they count.
+    """
+    reactions = (
+        select(Reaction.post_id, func.count().label("n"))
+        .group_by(Reaction.post_id)
+        .subquery()
+    )
+    comments = (
+        select(Comment.post_id, func.count().label("n"))
+        .group_by(Comment.post_id)
+        .subquery()
+    )
+    n_reactions = func.coalesce(reactions.c.n, 0)
+    n_comments = func.coalesce(comments.c.n, 0)
+    query = (
+        select(
+            Post.id, Post.reaction_count, n_reactions, Post.comment_count, n_comments
+        )
+        .outerjoin(reactions, reactions.c.post_id == Post.id)
+        .outerjoin(comments, comments.c.post_id == Post.id)
+        .where(
+            or_(Post.reaction_count != n_reactions, Post.comment_count != n_comments)
+        )
+        .order_by(Post.id)
+    )
+    return [tuple(row) for row in db.session.execute(query)]
+
+
+def recount(post_ids) -> None:
+    """
+    Set the counters of ``post_ids`` from the rows they count, counted by the
+    UPDATE itself so writes racing with the recount are not missed.
+    """
+    posts = Post.__table__
+    reactions = (
+        select(func.count())
+        .where(Reaction.__table__.c.post_id == posts.c.id)
+        .scalar_subquery()
+    )
+    comments = (
+        select(func.count())
+        .where(Comment.__table__.c.post_id == posts.c.id)
+        .scalar_subquery()
+    )
+    post_ids = list(post_ids)
+    for i in range(0, len(post_ids), RECOUNT_CHUNK):
+        db.session.execute(
+            posts.update()
+            .where(posts.c.id.in_(post_ids[i : i + RECOUNT_CHUNK]))
+            .values(reaction_count=reactions, comment_count=comments)
+        )
+
+
+def reaction_summaries(post_ids: list[int], user_id: int | None) -> dict:
+    """
+    ``{post id: {emoji: {"count": n, "reacted": bool}}}`` of a page of posts
+    in one query: how many reacted with each emoji, and whether ``user_id``
+    did, emojis in the order they were first used.
+    """
+    if not post_ids:
+        return {}
+    reacted = func.max(case((Reaction.user_id == user_id, 1), else_=0))
+    rows = db.session.execute(
+        select(Reaction.post_id, Reaction.emoji, func.count(), reacted)
+        .where(Reaction.post_id.in_(post_ids))
+        .group_by(Reaction.post_id, Reaction.emoji)
+        .order_by(func.min(Reaction.id))
+    )
+    summaries: dict[int, dict] = {}
+    for post_id, emoji, count, mine in rows:
+        summaries.setdefault(post_id, {})[emoji] = {
+            "count": count,
+            "reacted": bool(mine),
+        }
+    return summaries
+
+
+def comment_keys() -> list:
+    """Comments read oldest first, ties by id."""
+    return [Comment.created_at, Comment.id]
+
+
+def comments_by_post(
+    post_ids: list[int], limit: int = PREVIEW_COMMENTS
+) -> dict[int, list[Comment]]:
+    """
+    The first ``limit`` comments of each of a page of posts, oldest first,
+    with their authors, in one query.
+    """
+    if not post_ids:
+        return {}
+    rank = (
+        func.row_number()
+        .over(partition_by=Comment.post_id, order_by=comment_keys())
+        .label("rank")
+    )
+    ranked = select(Comment.id, rank).where(Comment.post_id.in_(post_ids)).subquery()
+    comments: dict[int, list[Comment]] = {}
+    for comment in (
+        Comment.query.join(ranked, ranked.c.id == Comment.id)
+        .filter(ranked.c.rank <= limit)
+        .options(joinedload(Comment.author))
+        .order_by(*comment_keys())
+    ):
+        comments.setdefault(comment.post_id, []).append(comment)
+    return comments
+
+
+def more_comments(posts: list[Post], comments: dict) -> dict[int, str]:
+    """
+    ``{post id: cursor}`` of the comments after those shown, for the posts
+    that have more than ``comments`` holds.
+    """
+    cursors = {}
+    for post in posts:
+        shown = comments.get(post.id, [])
+        if shown and post.comment_count > len(shown):
+            last = shown[-1]
+            cursors[post.id] = Cursor([last.created_at, last.id]).dumps(COMMENTS_SALT)
+    return cursors
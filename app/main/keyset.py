@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination.
+
+A page is the ``per_page`` rows that sort after the last row of the page
+before it, found with ``WHERE (k1, k2, ..., id) < (last row's keys)`` in
+the list's own order. Unlike ``OFFSET``, the database does not read the
+pages it skips, and nothing counts the whole list, so page N costs what
+page 1 does; a row inserted meanwhile does not shift the rest of the list
+by one either.
+
+The keys of a page's first and last rows travel as opaque cursors, signed
+so they cannot be forged into arbitrary filters. Lists sort in one
+direction on every key, and the last key must be unique (the primary key).
+"""
+
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import tuple_
+
+
+def _serializer(salt: str) -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt=salt)
+
+
+def _dump(value):
+    return {"t": value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _load(value):
+    return datetime.fromisoformat(value["t"]) if isinstance(value, dict) else value
+
+
+class Cursor:
+    """Where a page starts: after (or, going back, before) a row's keys."""
+
+    def __init__(
+        self, keys: list, backwards: bool = False, context: dict | None = None
+    ):
+        self.keys = keys
+        self.backwards = backwards
+        # anything the list's order depends on that must not change between
+        # pages, e.g. the time scores are computed for
+        self.context = context or {}
+
+    def dumps(self, salt: str) -> str:
+        return _serializer(salt).dumps(
+            {
+                "k": [_dump(v) for v in self.keys],
+                "b": self.backwards,
+                "c": {name: _dump(v) for name, v in self.context.items()},
+            }
+        )
+
+    @classmethod
+    def loads(cls, token: str | None, salt: str) -> "Cursor | None":
+        """The cursor of ``token``, or None (the first page) if it is not valid."""
+        if not token:
+            return None
+        try:
+            data = _serializer(salt).loads(token)
+            return cls(
+                [_load(v) for v in data["k"]],
+                bool(data["b"]),
+                {name: _load(v) for name, v in data["c"].items()},
+            )
+        except (BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+
+class KeysetPagination:
+    """
+    One page of a list: ``items``, and the cursors of the pages before and
+    after it (``prev_cursor``, ``next_cursor``), None at either end.
+    """
+
+    def __init__(self, items: list, per_page: int, prev_cursor, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def paginate(
+    query,
+    keys: list,
+    cursor: Cursor | None,
+    *,
+    per_page: int,
+    salt: str,
+    context: dict | None = None,
+    ascending: bool = False,
+) -> KeysetPagination:
+    """
+    The page of ``query`` at ``cursor``, ordered by the SQL expressions
+    ``keys``, all descending (or all ``ascending``). ``query`` selects one
+    entity; ``salt`` names the list, so cursors of one list are not accepted
+    by another, and ``context`` is carried by the cursors of its pages.
+    """
+    rows = query.add_columns(*keys)
+    if cursor is None or len(cursor.keys) != len(keys):
+        cursor = None
+    backwards = cursor is not None and cursor.backwards
+    # the order rows are read in, away from the cursor
+    up = ascending != backwards
+    if cursor is not None:
+        if up:
+            rows = rows.filter(tuple_(*keys) > tuple(cursor.keys))
+        else:
+            rows = rows.filter(tuple_(*keys) < tuple(cursor.keys))
+    order = [k.asc() if up else k.desc() for k in keys]
+    rows = rows.order_by(*order).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        if not more:
+            # back at the start: the first page is full, this might not be
+            return paginate(
+                query,
+                keys,
+                None,
+                per_page=per_page,
+                salt=salt,
+                context=context,
+                ascending=ascending,
+            )
+
+    has_prev = more if backwards else cursor is not None
+    has_next = True if backwards else more
+    prev_cursor = next_cursor = None
+    if has_prev:
+        # past the end (its rows were deleted): back to the rows before it
+        first = list(rows[0][1:]) if rows else cursor.keys
+        prev_cursor = Cursor(first, True, context).dumps(salt)
+    if rows and has_next:
+        next_cursor = Cursor(list(rows[-1][1:]), False, context).dumps(salt)
+    return KeysetPagination(
+        [row[0] for row in rows], per_page, prev_cursor, next_cursor
+    )
+
+
+def paginate_rows(
+    rows: list,
+    cursor: Cursor | None,
+    *,
+    per_page: int,
+    salt: str,
+    context: dict | None = None,
+) -> KeysetPagination:
+    """
+    ``paginate`` over a list ranked in Python: ``(item, keys)`` pairs, sorted
+    by ``keys`` descending.
+    """
+    keys = [tuple(row[1]) for row in rows]
+    if cursor is not None and keys and len(cursor.keys) != len(keys[0]):
+        cursor = None
+    if cursor is None:
+        start, end = 0, per_page
+    else:
+        # rows sort descending: those before the cursor have greater keys
+        before = sum(1 for k in keys if k > tuple(cursor.keys))
+        if cursor.backwards:
+            if before <= per_page:
+                # back at the start
+                return paginate_rows(
+                    rows, None, per_page=per_page, salt=salt, context=context
+                )
+            start, end = before - per_page, before
+        else:
+            start = before + sum(1 for k in keys if k == tuple(cursor.keys))
+            end = start + per_page
+    page = rows[start:end]
+
+    prev_cursor = next_cursor = None
+    if cursor is not None:
+        # past the end (its rows were dropped): back to the rows before it
+        first = list(page[0][1]) if page else cursor.keys
+        prev_cursor = Cursor(first, True, context).dumps(salt)
+    if page and end < len(rows):
+        next_cursor = Cursor(list(page[-1][1]), False, context).dumps(salt)
+    return KeysetPagination(
+        [row[0] for row in page], per_page, prev_cursor, next_cursor
+    )
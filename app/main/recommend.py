@@ -0,0 +1,148 @@
+"""
+The recommended feed, in two stages.
+
+Candidates: the ids of a bounded set of public posts, each source read
+from an index in one UNION ALL query: the newest posts, the most engaged
+(``ix_posts_engagement``), the most engaged of the newest few thousand,
+the newest in each of the user's languages
+(``ix_posts_visibility_language_created_at``) and with each of their tags
+(``post_tags``). ``RECOMMEND_CANDIDATES`` posts per source, however many
+posts there are.
+
+Ranking: the candidates are loaded and scored in Python with the
+``RECOMMEND_WEIGHTS`` signals, against the user's affinity profile
+(``app.main.affinity``) and the time of the first page, so every page of
+one feed scores posts alike.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, select, union_all
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.main.affinity import Affinity, profile_of
+from app.main.tags import split_tags, tagged_posts
+from app.models import Post
+
+# languages of a profile the candidates are drawn from, heaviest first
+CANDIDATE_LANGUAGES = 5
+# fewest candidates drawn for one language or tag
+MIN_PER_KEY = 10
+# posts this recent get the "recent_3d" weight
+RECENT_DAYS = 3
+# newest posts of those days ranked by engagement, per candidate
+TRENDING_POOL = 10
+
+
+def _public():
+    return select(Post.id.label("id")).where(Post.visibility == "public")
+
+
+def candidates(affinity: Affinity, now: datetime, limit: int, cap: float) -> list[int]:
+    """Ids of the candidate posts for ``affinity``, ``limit`` per source."""
+    # the newest posts of the last few days, by engagement up to the cap:
+    # recent and engaged, the two signals that add up the most
+    newest = (
+        select(Post.id, Post.engagement.label("engagement"), Post.created_at)
+        .where(
+            Post.visibility == "public",
+            Post.created_at >= now - timedelta(days=RECENT_DAYS),
+        )
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(limit * TRENDING_POOL)
+        .subquery()
+    )
+    capped = case((newest.c.engagement > cap, cap), else_=newest.c.engagement)
+    sources = [
+        _public().order_by(Post.created_at.desc(), Post.id.desc()).limit(limit),
+        _public()
+        .order_by(Post.engagement.desc(), Post.created_at.desc(), Post.id.desc())
+        .limit(limit),
+        select(newest.c.id)
+        .order_by(capped.desc(), newest.c.created_at.desc(), newest.c.id.desc())
+        .limit(limit),
+    ]
+    languages = list(affinity.languages)[:CANDIDATE_LANGUAGES]
+    for language in languages:
+        sources.append(
+            _public()
+            .where(Post.language == language)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(max(limit // len(languages), MIN_PER_KEY))
+        )
+    for tag in affinity.tags:
+        sources.append(tagged_posts(tag, max(limit // len(affinity.tags), MIN_PER_KEY)))
+
+    # each source in a subquery: ORDER BY and LIMIT inside a UNION member
+    # are not portable
+    query = union_all(*(select(s.subquery().c.id) for s in sources))
+    return list(dict.fromkeys(db.session.execute(query).scalars()))
+
+
+def score(
+    post, affinity: Affinity, user_id: int, now: datetime, weights: dict
+) -> float:
+    """
+    The recommended-feed score for the user of ``post``, a ``Post`` or a row
+    with its language, tags, engagement, created_at and user_id.
+    """
+    total = min(post.engagement, weights["engagement_cap"])
+    if post.language.strip().lower() in affinity.languages:
+        total += weights["language"]
+    if affinity.tags and any(tag in affinity.tags for tag in split_tags(post.tags)):
+        total += weights["tags"]
+    if post.created_at >= now - timedelta(days=RECENT_DAYS):
+        total += weights["recent_3d"]
+    elif post.created_at >= now - timedelta(days=7):
+        total += weights["recent_7d"]
+    if post.user_id == user_id:
+        total += weights["own_post"]
+    return total
+
+
+def recommended(user, now: datetime) -> list[tuple[int, list]]:
+    """
+    The candidate posts for ``user`` as ``(post id, [score, created_at, id])``,
+    best first, as of ``now``. Only the columns the score needs are read;
+    ``load_posts`` loads the page shown.
+    """
+    affinity = profile_of(user)
+    weights = current_app.config["RECOMMEND_WEIGHTS"]
+    ids = candidates(
+        affinity,
+        now,
+        current_app.config.get("RECOMMEND_CANDIDATES", 200),
+        weights["engagement_cap"],
+    )
+    if not ids:
+        return []
+    posts = db.session.execute(
+        select(
+            Post.id,
+            Post.language,
+            Post.tags,
+            Post.engagement.label("engagement"),
+            Post.created_at,
+            Post.user_id,
+        ).where(Post.id.in_(ids))
+    )
+    rows = [
+        (
+            post.id,
+            [score(post, affinity, user.id, now, weights), post.created_at, post.id],
+        )
+        for post in posts
+    ]
+    rows.sort(key=lambda row: tuple(row[1]), reverse=True)
+    return rows
+
+
+def load_posts(ids: list[int]) -> list[Post]:
+    """The posts of ``ids`` with their authors, in that order."""
+    posts = {
+        post.id: post
+        for post in Post.query.options(joinedload(Post.author)).filter(Post.id.in_(ids))
+    }
+    return [posts[i] for i in ids if i in posts]
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from flask import (
     Blueprint,
@@ -14,18 +14,49 @@ from flask import (
     url_for,
 )
 from itsdangerous import URLSafeSerializer
-from sqlalchemy import case, desc, func, or_
+from sqlalchemy import desc, func, or_
 from sqlalchemy.orm import joinedload
 
 from app import db
 from app.auth.utils import login_required
+from app.main.affinity import (
+    COMMENT_WEIGHT,
+    POST_WEIGHT,
+    REACTION_WEIGHT,
+    record,
+)
+from app.main.engagement import (
+    COMMENTS_PAGE,
+    COMMENTS_SALT,
+    bump,
+    comment_keys,
+    comments_by_post,
+    delete_counted,
+    more_comments,
+    reaction_summaries,
+)
 from app.main.form import PostForm
+from app.main.keyset import Cursor, paginate, paginate_rows
 
 # from app.main.search import search_posts, search_users
 from app.main.profile import count_battles, count_reactions
-from app.main.search import search_post_ids
+from app.main.recommend import load_posts, recommended
+from app.main.search import (
+    complete,
+    search_snippets,
+    search_with_facets,
+    suggest_query,
+    sync_search,
+)
+from app.main.search_query import (
+    filter_key,
+    parse_query,
+    without_field,
+    without_filter,
+)
+from app.main.tags import set_tags
 from app.main.utils import save_profile_picture
-from app.models import Battle, Comment, Post, Reaction, User
+from app.models import Battle, Comment, Post, Reaction, RelatedPost, User
 
 
 def _user_image_url(user):
@@ -39,6 +70,21 @@ def _user_image_url(user):
     )
 
 
+def _comment_json(comment, viewer=None) -> dict:
+    """A comment as the comment scripts render it."""
+    author = comment.author
+    return {
+        "id": comment.id,
+        "content": comment.content,
+        "author": author.username,
+        "created_at": comment.created_at.strftime("%b %d"),
+        "avatar_letter": author.username[:2],
+        "image_url": _user_image_url(author),
+        "can_delete": bool(viewer)
+        and (viewer.id == comment.user_id or bool(viewer.is_admin)),
+    }
+
+
 main = Blueprint("main", __name__)
 
 
@@ -73,20 +119,104 @@ def settings_page():
 def search_page():
     q = (request.args.get("q") or "").strip()
 
-    posts = []
-    post_ids = []
+    found = []
+    facets = {}
+    suggestion = None
+    snippets = {}
     if q:
-        post_ids = search_post_ids(q, limit=50)
-    if post_ids:
-        fetch_posts = (
-            Post.query.filter(Post.id.in_(post_ids))
-            .options(joinedload(Post.author))
-            .all()
-        )
-        posts_by_id = {post.id: post for post in fetch_posts}
-        posts = [posts_by_id[pid] for pid in post_ids if pid in posts_by_id]
-    # MVP page: just show ids in order (UI later)
-    return render_template("main/search.html", q=q, posts=posts)
+        # one sync for the whole page: each helper would check for changes
+        version = sync_search()
+        found, facets = search_with_facets(q, limit=50, version=version)
+        suggestion = suggest_query(q, version=version)
+        # highlighted from the index's word offsets, not re-tokenized here
+        snippets = search_snippets(q, found, version=version)
+    # one query per type found
+    rows = {}
+    for kind, model in (("post", Post), ("battle", Battle)):
+        ids = [doc_id for doc_type, doc_id in found if doc_type == kind]
+        if ids:
+            fetched = (
+                model.query.filter(model.id.in_(ids))
+                .options(joinedload(model.author))
+                .all()
+            )
+            rows.update(((kind, row.id), row) for row in fetched)
+    results = [
+        (kind, rows[kind, doc_id], snippets.get((kind, doc_id)))
+        for kind, doc_id in found
+        if (kind, doc_id) in rows
+    ]
+    return render_template(
+        "main/search.html",
+        q=q,
+        results=results,
+        facets=_facet_links(q, facets),
+        suggestion=suggestion,
+    )
+
+
+@main.route("/search/complete")
+def search_complete():
+    """Usernames and tags starting with ``q``, most popular first, as JSON."""
+    prefix = (request.args.get("q") or "").strip().lstrip("@")
+    kinds = [k for k in request.args.getlist("type") if k in ("users", "tags")]
+    limit = max(1, min(request.args.get("limit", 8, type=int), 20))
+    found = complete(prefix, kinds=kinds or ("users", "tags"), limit=limit)
+
+    result = {}
+    if "users" in found:
+        result["users"] = [
+            {
+                "username": username,
+                "points": points,
+                "posts": posts,
+                "url": url_for("main.user_profile", username=username),
+            }
+            for username, points, posts in found["users"]
+        ]
+    if "tags" in found:
+        result["tags"] = [
+            {
+                "tag": tag,
+                "posts": posts,
+                "url": url_for(
+                    "main.search_page",
+                    q=f'tag:"{tag}"' if " " in tag else f"tag:{tag}",
+                ),
+            }
+            for tag, posts in found["tags"]
+        ]
+    return jsonify(result)
+
+
+def _facet_links(q: str, facets: dict) -> dict:
+    """
+    Facet counts with the query each one links to: the current query
+    narrowed to that value, or without it if it is already applied. A type
+    replaces the types asked for, since a document has only one.
+    """
+    parsed = parse_query(q)
+    applied = {
+        group[0].key
+        for group in parsed.groups
+        if len(group) == 1 and group[0].kind == "filter"
+    }
+    links = {}
+    for field, values in facets.items():
+        links[field] = []
+        for value, count in values:
+            key = filter_key(field, value)
+            active = key in applied
+            if active:
+                link = without_filter(q, key)
+            elif field == "type":
+                link = f"{without_field(q, 'type')} {key}"
+            else:
+                link = f"{q} {key}"
+            links[field].append(
+                {"value": value, "count": count, "active": active, "q": link}
+            )
+    return links
 
 
 @main.route("/terms")
@@ -116,7 +246,9 @@ def feed_page():
     if sort not in ("latest", "top", "recommended"):
         sort = "recommended"
 
-    page = request.args.get("page", 1, type=int)
+    # keyset pagination: one cursor per sort, so page N costs what page 1 does
+    salt = f"feed:{sort}"
+    cursor = Cursor.loads(request.args.get("cursor"), salt)
     per_page = 10
 
     base_query = Post.query.options(joinedload(Post.author)).filter(
@@ -124,154 +256,62 @@ def feed_page():
     )
 
     if sort == "latest":
-        pagination = base_query.order_by(Post.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        pagination = paginate(
+            base_query,
+            [Post.created_at, Post.id],
+            cursor,
+            per_page=per_page,
+            salt=salt,
         )
 
     elif sort == "top":
-        # Rank by total engagement: reactions + comments (all time)
-        reaction_count = (
-            db.session.query(
-                Reaction.post_id,
-                func.count(Reaction.id).label("r_count"),
-            )
-            .group_by(Reaction.post_id)
-            .subquery()
-        )
-        comment_count = (
-            db.session.query(
-                Comment.post_id,
-                func.count(Comment.id).label("c_count"),
-            )
-            .group_by(Comment.post_id)
-            .subquery()
-        )
-
-        engagement = (
-            func.coalesce(reaction_count.c.r_count, 0) * 5
-            + func.coalesce(comment_count.c.c_count, 0) * 10
-        )
-
-        pagination = (
-            base_query.outerjoin(reaction_count, Post.id == reaction_count.c.post_id)
-            .outerjoin(comment_count, Post.id == comment_count.c.post_id)
-            .order_by(desc(engagement), Post.created_at.desc())
-            .paginate(page=page, per_page=per_page, error_out=False)
+        # Rank by total engagement: reactions + comments (all time), kept on
+        # the post and indexed (ix_posts_engagement)
+        pagination = paginate(
+            base_query,
+            [Post.engagement, Post.created_at, Post.id],
+            cursor,
+            per_page=per_page,
+            salt=salt,
         )
 
     else:
         # --- Recommended algorithm ---
-        # Signals combined into a single score:
-        #   1. Language affinity  – posts in languages the user writes get +40
-        #   2. Tag overlap        – posts sharing tags with user's posts get +30
+        # Signals combined into a single score (RECOMMEND_WEIGHTS):
+        #   1. Language affinity  – posts in the user's languages get +40
+        #   2. Tag overlap        – posts sharing the user's tags get +30
         #   3. Engagement quality – (reactions*5 + comments*10), capped contribution
         #   4. Recency boost      – posts from the last 3 days get +25, last 7 days +10
         #   5. Slight penalty for user's own posts so others' work surfaces first
-
-        # Gather user's languages
-        user_languages = (
-            db.session.query(Post.language)
-            .filter_by(user_id=session["user_id"])
-            .distinct()
-            .all()
-        )
-        user_languages = [lang[0] for lang in user_languages]
-
-        # Gather user's tags for tag-overlap signal
-        user_tags_raw = (
-            db.session.query(Post.tags).filter_by(user_id=session["user_id"]).all()
-        )
-        user_tags = set()
-        for (tags_str,) in user_tags_raw:
-            if tags_str:
-                for t in tags_str.split(","):
-                    stripped = t.strip().lower()
-                    if stripped:
-                        user_tags.add(stripped)
-
-        # Language affinity score
-        if user_languages:
-            lang_score = case(
-                (Post.language.in_(user_languages), 40),
-                else_=0,
-            )
-        else:
-            lang_score = 0
-
-        # Tag overlap score – match any of the user's tags
-        if user_tags:
-            # Escape LIKE wildcards so user-controlled tag values are matched literally
-            def _escape_like(s: str) -> str:
-                return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-
-            tag_conditions = [
-                Post.tags.ilike(f"%{_escape_like(tag)}%", escape="\\")
-                for tag in list(user_tags)[:20]
-            ]
-            # OR across all tag patterns; if any match → +30
-            tag_score = case(
-                (or_(*tag_conditions), 30),
-                else_=0,
-            )
-        else:
-            tag_score = 0
-
-        # Engagement sub-queries
-        reaction_count = (
-            db.session.query(
-                Reaction.post_id,
-                func.count(Reaction.id).label("r_count"),
-            )
-            .group_by(Reaction.post_id)
-            .subquery()
-        )
-        comment_count = (
-            db.session.query(
-                Comment.post_id,
-                func.count(Comment.id).label("c_count"),
-            )
-            .group_by(Comment.post_id)
-            .subquery()
-        )
-
-        # Engagement score (cap at 50 so viral posts don't completely dominate)
-        raw_engagement = (
-            func.coalesce(reaction_count.c.r_count, 0) * 5
-            + func.coalesce(comment_count.c.c_count, 0) * 10
-        )
-        engagement_score = case(
-            (raw_engagement > 50, 50),
-            else_=raw_engagement,
-        )
-
-        # Recency boost
-        now = datetime.utcnow()
-        recency_score = case(
-            (Post.created_at >= now - timedelta(days=3), 25),
-            (Post.created_at >= now - timedelta(days=7), 10),
-            else_=0,
+        # over a bounded set of candidates from indexes, ranked in Python
+        # (app.main.recommend), so the cost does not grow with the posts table
+
+        # Scored as of the first page (recency): scores must not change
+        # under the cursors of the next ones
+        now = cursor.context.get("now") if cursor else None
+        now = now or datetime.utcnow()
+
+        pagination = paginate_rows(
+            recommended(current_user, now),
+            cursor,
+            per_page=per_page,
+            salt=salt,
+            context={"now": now},
         )
+        pagination.items = load_posts(pagination.items)
 
-        # Small penalty for own posts so discovery of others is prioritised
-        own_post_penalty = case(
-            (Post.user_id == session["user_id"], -15),
-            else_=0,
-        )
-
-        total_score = (
-            lang_score + tag_score + engagement_score + recency_score + own_post_penalty
-        )
-
-        pagination = (
-            base_query.outerjoin(reaction_count, Post.id == reaction_count.c.post_id)
-            .outerjoin(comment_count, Post.id == comment_count.c.post_id)
-            .order_by(desc(total_score), Post.created_at.desc())
-            .paginate(page=page, per_page=per_page, error_out=False)
-        )
+    # reactions and the first comments of the whole page: a fixed number of
+    # queries, however many posts and comments it has; the rest of a thread
+    # loads on expand (post_comments)
+    post_ids = [p.id for p in pagination.items]
+    comments = comments_by_post(post_ids)
 
     return render_template(
         "feed.html",
         posts=pagination.items,
+        reactions=reaction_summaries(post_ids, session["user_id"]),
+        comments=comments,
+        more_comments=more_comments(pagination.items, comments),
         pagination=pagination,
         post_count=post_count,
         current_user=current_user,
@@ -306,6 +346,8 @@ def post():
 
         try:
             db.session.add(new_post)
+            set_tags(new_post, clean_tags)
+            record(session["user_id"], new_post, POST_WEIGHT)
 
             user = User.query.get(session["user_id"])
             if user:
@@ -339,9 +381,14 @@ def toggle_reaction(post_id):
 
     status = ""
     if existing_reaction:
-        db.session.delete(existing_reaction)
+        post = existing_reaction.post
+        if delete_counted(existing_reaction):
+            record(session["user_id"], post, -REACTION_WEIGHT)
         status = "removed"
     else:
+        if not bump(post_id, reactions=1):
+            return jsonify({"error": "Post not found"}), 404
+        record(session["user_id"], db.session.get(Post, post_id), REACTION_WEIGHT)
         new_reaction = Reaction(
             user_id=session["user_id"], post_id=post_id, emoji=emoji
         )
@@ -362,9 +409,12 @@ def add_comment(post_id):
     if not content or not content.strip():
         return jsonify({"error": "Comment can't be empty"}), 400
 
+    if not bump(post_id, comments=1):
+        return jsonify({"error": "Post not found"}), 404
     new_comment = Comment(
         content=content.strip(), user_id=session["user_id"], post_id=post_id
     )
+    record(session["user_id"], db.session.get(Post, post_id), COMMENT_WEIGHT)
 
     db.session.add(new_comment)
     db.session.commit()
@@ -373,16 +423,32 @@ def add_comment(post_id):
         f"New comment added to post_id {post_id} by user_id {session['user_id']}"
     )
 
-    author = User.query.get(session["user_id"])
+    return jsonify(_comment_json(new_comment, new_comment.author))
 
+
+@main.route("/post/<int:post_id>/comments", methods=["GET"])
+def post_comments(post_id):
+    """
+    Comments of a post, oldest first, ``COMMENTS_PAGE`` at a time: the page
+    after ``cursor`` (from the feed, the post page or the previous page).
+    """
+    post = Post.query.get_or_404(post_id)
+    viewer = User.query.get(session["user_id"]) if session.get("user_id") else None
+    page = paginate(
+        Comment.query.options(joinedload(Comment.author)).filter(
+            Comment.post_id == post.id
+        ),
+        comment_keys(),
+        Cursor.loads(request.args.get("cursor"), COMMENTS_SALT),
+        per_page=COMMENTS_PAGE,
+        salt=COMMENTS_SALT,
+        ascending=True,
+    )
     return jsonify(
         {
-            "id": new_comment.id,
-            "content": new_comment.content,
-            "author": author.username,
-            "created_at": new_comment.created_at.strftime("%b %d"),
-            "avatar_letter": author.username[:2],
-            "image_url": _user_image_url(author),
+            "comments": [_comment_json(c, viewer) for c in page.items],
+            "next_cursor": page.next_cursor,
+            "count": post.comment_count,
         }
     )
 
@@ -455,6 +521,7 @@ def delete_post(post_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     try:
+        record(post.user_id, post, -POST_WEIGHT)
         db.session.delete(post)
         db.session.commit()
         current_app.logger.info(
@@ -469,7 +536,24 @@ def delete_post(post_id):
 @main.route("/post/<int:post_id>", methods=["GET"])
 def view_post(post_id):
     post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
-    return render_template("main/view_post.html", post=post)
+    # precomputed by `flask build-related-posts`: one lookup by primary key
+    related = (
+        Post.query.join(RelatedPost, RelatedPost.related_id == Post.id)
+        .filter(RelatedPost.post_id == post.id, Post.visibility == "public")
+        .options(joinedload(Post.author))
+        .order_by(RelatedPost.score.desc())
+        .all()
+    )
+    comments = comments_by_post([post.id])
+    viewer = User.query.get(session["user_id"]) if session.get("user_id") else None
+    return render_template(
+        "main/view_post.html",
+        post=post,
+        related=related,
+        comments=comments.get(post.id, []),
+        more_comments=more_comments([post], comments).get(post.id),
+        current_user=viewer,
+    )
 
 
 @main.route("/comment/<int:comment_id>", methods=["DELETE"])
@@ -484,11 +568,13 @@ def delete_comment(comment_id):
 
     try:
         post_id = comment.post_id
+        post = comment.post
 
-        db.session.delete(comment)
+        if delete_counted(comment):
+            record(comment.user_id, post, -COMMENT_WEIGHT)
         db.session.commit()
 
-        count = Comment.query.filter_by(post_id=post_id).count()
+        count = db.session.query(Post.comment_count).filter_by(id=post_id).scalar()
         return jsonify({"success": True, "count": count, "post_id": post_id})
     except Exception as e:
         db.session.rollback()
@@ -500,14 +586,14 @@ def delete_comment(comment_id):
 def battles():
     user_id = session.get("user_id")
 
-    page = request.args.get("page", 1, type=int)
-    per_page = 10
-
-    pagination = (
-        Battle.query.options(joinedload(Battle.author))
-        .filter(Battle.visibility == "public")
-        .order_by(Battle.created_at.desc())
-        .paginate(page=page, per_page=per_page, error_out=False)
+    pagination = paginate(
+        Battle.query.options(joinedload(Battle.author)).filter(
+            Battle.visibility == "public"
+        ),
+        [Battle.created_at, Battle.id],
+        Cursor.loads(request.args.get("cursor"), "battles"),
+        per_page=10,
+        salt="battles",
     )
 
     battles_won = Battle.query.filter(Battle.winner_id == user_id).count()
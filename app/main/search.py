@@ -4,11 +4,52 @@ Helping search service file
 
 from __future__ import annotations
 
+import calendar
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Callable
 
-from app.main import search_engine
-from app.models import Post
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm import defer, joinedload
+
+from app import db
+from app.main import search_engine, search_postgres, search_snapshot
+from app.main.search_complete import PrefixIndex
+from app.main.search_engine import tokenize
+from app.main.search_index import DEFAULT_PARAMS, SearchIndex, build_snapshot
+from app.main.search_query import (
+    DOC_TYPES,
+    FACET_FIELDS,
+    filter_key,
+    parse_query,
+    query_types,
+    without_field,
+)
+from app.main.search_related import related_posts
+from app.main.search_snapshot import IndexSnapshot
+from app.models import (
+    Battle,
+    BattleChange,
+    Post,
+    PostChange,
+    RelatedPost,
+    User,
+    UserChange,
+)
+
+# Posts kept in the mutable layer on top of a snapshot before it is rebuilt
+_MAX_DELTA = 20000
+# Posts read from the database at a time while building a snapshot
+_CHUNK = 1000
+# Snapshots tried when the one CURRENT named is pruned before it is opened
+_OPEN_ATTEMPTS = 3
+# Seconds a skipped change id is looked for again (_Cursor), and how many
+_GAP_SECONDS = 300
+_MAX_GAPS = 1000
 
 
 def _tags_to_list(tags: str | None) -> list[str]:
@@ -18,6 +59,70 @@ def _tags_to_list(tags: str | None) -> list[str]:
     return [t.strip() for t in tags.split(",") if t.strip()]
 
 
+def _post_to_doc(p: Post, code: bool = False) -> dict:
+    doc = {
+        "type": "post",
+        "title": p.title or "",
+        "description": p.description or "",
+        "tags": _tags_to_list(p.tags),
+        # filter fields only, not searched as text
+        "language": p.language or "",
+        "user": p.author.username if p.author else "",
+        "feedback": _tags_to_list(p.feedback_type),
+        # Unix seconds, for age filters; created_at is naive UTC
+        "created": calendar.timegm(p.created_at.timetuple()) if p.created_at else 0,
+    }
+    if code:
+        doc["code"] = p.code or ""
+    return doc
+
+
+def _post_options(code: bool) -> list:
+    options = [joinedload(Post.author)]
+    if not code:
+        # the largest column; skip it unless it is indexed
+        options.append(defer(Post.code))
+    return options
+
+
+def _battle_to_doc(b: Battle, code: bool = False) -> dict:
+    # battles have no code of their own until someone plays them
+    return {
+        "type": "battle",
+        "title": b.title or "",
+        "description": b.description or "",
+        "tags": _tags_to_list(b.tags),
+        "language": b.language or "",
+        "user": b.author.username if b.author else "",
+        "difficulty": b.difficulty or "",
+        "created": calendar.timegm(b.created_at.timetuple()) if b.created_at else 0,
+    }
+
+
+def _battle_options(code: bool) -> list:
+    return [joinedload(Battle.author)]
+
+
+@dataclass(frozen=True)
+class _Source:
+    """Where the documents of one type come from and how they change."""
+
+    model: type
+    # append-only log of writes, and its column naming the written row
+    changes: type
+    changed_id: object
+    to_doc: Callable
+    options: Callable
+
+
+_SOURCES = {
+    "post": _Source(Post, PostChange, PostChange.post_id, _post_to_doc, _post_options),
+    "battle": _Source(
+        Battle, BattleChange, BattleChange.battle_id, _battle_to_doc, _battle_options
+    ),
+}
+
+
 def _load_posts_for_index() -> dict[str, dict]:
     """
     Convert DB posts into the dict format your search_engine expects:
@@ -25,62 +130,905 @@ def _load_posts_for_index() -> dict[str, dict]:
       "12": {"title": "...", "description": "...", "tags": ["a","b"]}
     }
     """
-    posts = Post.query.filter(Post.visibility == "public").all()
+    posts = (
+        Post.query.filter(Post.visibility == "public")
+        .options(*_post_options(code=False))
+        .all()
+    )
 
     posts_by_id: dict[str, dict] = {}
     for p in posts:
-        posts_by_id[str(p.id)] = {
-            "title": p.title or "",
-            "description": p.description or "",
-            "tags": _tags_to_list(p.tags),
-        }
+        posts_by_id[str(p.id)] = _post_to_doc(p)
     return posts_by_id
 
 
+def _stream_docs_for_index(kind: str, code: bool):
+    """
+    ``(id, document)`` of every public row of ``kind`` in id order, read
+    ``_CHUNK`` rows at a time, so the rows (and post code) are never all in
+    memory.
+    """
+    source = _SOURCES[kind]
+    model = source.model
+    query = (
+        model.query.filter(model.visibility == "public")
+        .options(*source.options(code))
+        .order_by(model.id)
+        .yield_per(_CHUNK)
+    )
+    for row in query:
+        yield str(row.id), source.to_doc(row, code)
+
+
+class _Cursor:
+    """
+    How far a change log (``PostChange``, ``BattleChange``, ``UserChange``)
+    was read: every change up to ``version``, except the ``gaps``.
+
+    Change ids are taken when a transaction writes, not when it commits, so
+    a lower id can commit after a higher one was read. The ids skipped over
+    are looked for again on every read for ``_GAP_SECONDS``, by when their
+    transaction has committed or rolled back; replaying a change re-reads
+    its row, so one found late is applied like any other.
+    """
+
+    def __init__(self, version: int = 0, gaps=()):
+        self.version = version
+        # change id -> time.monotonic() it was first skipped
+        now = time.monotonic()
+        self.gaps: dict[int, float] = {change_id: now for change_id in gaps}
+
+    def advance(self, changes: list[tuple[int, int]]) -> None:
+        """Move past ``changes``, read by ``_changes_after`` and applied."""
+        now = time.monotonic()
+        seen = {change_id for change_id, _row_id in changes}
+        top = max([self.version, *seen])
+        gaps = {
+            change_id: skipped
+            for change_id, skipped in self.gaps.items()
+            if change_id not in seen and now - skipped < _GAP_SECONDS
+        }
+        for change_id in range(max(self.version + 1, top - _MAX_GAPS), top):
+            if change_id not in seen:
+                gaps[change_id] = now
+        # the most recent ones, when a burst of rollbacks left more
+        self.gaps = dict(sorted(gaps.items())[-_MAX_GAPS:])
+        self.version = top
+
+
+def _read_cursor(changes: type) -> _Cursor:
+    """
+    The ``_Cursor`` of the ``changes`` log as of now: its last change, and
+    the ids below it not committed yet (or rolled back).
+    """
+    ids = (
+        db.session.query(changes.id).order_by(changes.id.desc()).limit(_MAX_GAPS).all()
+    )
+    if not ids:
+        return _Cursor()
+    ids = [change_id for (change_id,) in ids]
+    version = ids[0]
+    # below the last _MAX_GAPS changes, only if there are that many
+    low = ids[-1] if len(ids) == _MAX_GAPS else 1
+    low = max(low, version - _MAX_GAPS)
+    return _Cursor(version, set(range(low, version)) - set(ids))
+
+
+def _changes_after(cursor: _Cursor, changes: type, changed_id) -> list[tuple[int, int]]:
+    """
+    ``(change id, row id)`` of the ``changes`` not read yet by ``cursor``,
+    in order; at most ``_MAX_DELTA`` + 1, enough to tell that there are too
+    many to replay, so a worker idle for long does not load them all.
+    """
+    pending = changes.id > cursor.version
+    if cursor.gaps:
+        pending = or_(pending, changes.id.in_(list(cursor.gaps)))
+    return (
+        db.session.query(changes.id, changed_id)
+        .filter(pending)
+        .order_by(changes.id)
+        .limit(_MAX_DELTA + 1)
+        .all()
+    )
+
+
+def _current_cursor(kind: str = "post") -> _Cursor:
+    return _read_cursor(_SOURCES[kind].changes)
+
+
+def _pending_changes(cursor: _Cursor, kind: str = "post") -> list[tuple[int, int]]:
+    source = _SOURCES[kind]
+    return _changes_after(cursor, source.changes, source.changed_id)
+
+
+# Bumped whenever a search index of this worker changes: the version of its
+# cached results (QueryCache). Not the last change id, which a change
+# committed late does not move.
+_REVISION = 0
+
+
+def _changed() -> None:
+    global _REVISION
+    _REVISION += 1
+
+
 @dataclass
 class _Index:
+    index: SearchIndex
+    # the changes (PostChange, BattleChange) applied to `index`
+    cursor: _Cursor
+    # name of the snapshot `index` is layered on, if any
+    snapshot: str | None = None
+
+
+# Simple module-level: one index per document type, so a query only scores
+# the types it asks for
+_INDEXES: dict[str, _Index] = {}
+
+
+def _index_params() -> dict:
+    config = current_app.config
+    weights = dict(config.get("SEARCH_FIELD_WEIGHTS", DEFAULT_PARAMS["weights"]))
+    # code is only indexed with a weight
+    if config.get("SEARCH_WEIGHT_CODE"):
+        weights["code"] = float(config["SEARCH_WEIGHT_CODE"])
+    return {
+        "scoring": config.get("SEARCH_SCORING", DEFAULT_PARAMS["scoring"]),
+        "weights": weights,
+    }
+
+
+def _indexes_code() -> bool:
+    return "code" in _index_params()["weights"]
+
+
+def snapshot_report(snap: IndexSnapshot, kind: str = "post") -> str:
+    """One line on the size and build time of ``snap``, for logs and the CLI."""
+    meta = snap.meta
+    postings = meta.get("field_postings", {})
+    total = sum(postings.values()) or 1
+    shares = ", ".join(f"{f} {n / total:.0%}" for f, n in postings.items())
+    return (
+        f"{meta['n_docs']} {kind}s, {snap.nbytes() / 2**20:.1f} MB, "
+        f"built in {meta.get('build_seconds', 0):.1f}s; postings: {shares}"
+    )
+
+
+def _build_snapshot(kind: str = "post") -> IndexSnapshot:
+    # Read the cursor first: writes racing with the load, or committed later
+    # under a lower id (its gaps), are replayed, and replaying an already
+    # indexed row is a harmless re-add.
+    cursor = _current_cursor(kind)
+    snap = build_snapshot(
+        _stream_docs_for_index(kind, _indexes_code()),
+        version=cursor.version,
+        gaps=cursor.gaps,
+        workers=current_app.config.get("SEARCH_BUILD_WORKERS", 1),
+        **_index_params(),
+    )
+    current_app.logger.info(f"Search snapshot built: {snapshot_report(snap, kind)}")
+    return snap
+
+
+def rebuild_related_posts() -> int:
+    """
+    Replace the related posts of every public post with those of a fresh
+    snapshot, in one transaction. Returns the number of rows written.
+    """
+    post_ids, related, scores = related_posts(_build_snapshot())
+    rows = [
+        {"post_id": int(pid), "related_id": int(rid), "score": float(score)}
+        for pid, rids, row_scores in zip(post_ids, related, scores)
+        for rid, score in zip(rids, row_scores)
+        if rid >= 0
+    ]
+    db.session.execute(RelatedPost.__table__.delete())
+    for start in range(0, len(rows), _CHUNK):
+        db.session.execute(RelatedPost.__table__.insert(), rows[start : start + _CHUNK])
+    db.session.commit()
+    return len(rows)
+
+
+def _is_configured(snap: IndexSnapshot) -> bool:
+    params = snap.meta["params"]
+    return all(params.get(k) == v for k, v in _index_params().items())
+
+
+def _publish(root: str, kind: str) -> str:
+    return search_snapshot.publish_snapshot(root, _build_snapshot(kind))
+
+
+def _open_current(root: str, name: str) -> tuple[IndexSnapshot, str]:
+    """
+    Open snapshot ``name``, or the one published after it if it is gone:
+    between reading CURRENT and opening it, other workers can publish twice
+    and prune it (``search_snapshot.KEEP``).
+    """
+    for _attempt in range(_OPEN_ATTEMPTS - 1):
+        try:
+            return search_snapshot.open_snapshot(root, name), name
+        except OSError:
+            newer = search_snapshot.current_snapshot(root)
+            if newer is None or newer == name:
+                raise
+            name = newer
+    return search_snapshot.open_snapshot(root, name), name
+
+
+def _layered(snap: IndexSnapshot, name: str | None = None) -> _Index:
+    """An index of the changes made on top of ``snap``, snapshot ``name``."""
+    return _Index(
+        index=SearchIndex(base=snap),
+        cursor=_Cursor(snap.version, snap.gaps),
+        snapshot=name,
+    )
+
+
+def _empty_index(kind: str) -> _Index:
+    """An index of no documents, served until the first snapshot is built."""
+    cursor = _current_cursor(kind)
+    snap = build_snapshot(
+        [], version=cursor.version, gaps=cursor.gaps, **_index_params()
+    )
+    return _layered(snap)
+
+
+def _sync_snapshot(root: str, kind: str, force_rebuild: bool = False) -> _Index:
+    """
+    Open the published snapshot. Only ``force_rebuild`` (the
+    ``build-search-index`` command) builds one here: when there is none yet,
+    or it is of another format or configuration, the request keeps what it
+    has and a background thread republishes it (``_rebuild_later``).
+    """
+    if force_rebuild:
+        with search_snapshot.build_lock(root):
+            _publish(root, kind)
+
+    idx = _INDEXES.get(kind)
+    name = search_snapshot.current_snapshot(root)
+    if name is None:
+        _rebuild_later(root, kind, None, "no snapshot published yet")
+        return idx or _empty_index(kind)
+    if idx is not None and idx.snapshot == name:
+        return idx
+
+    try:
+        snap, name = _open_current(root, name)
+    except ValueError:
+        # published by an older release with another format
+        _rebuild_later(root, kind, name, "snapshot of another format")
+        return idx or _empty_index(kind)
+    if not _is_configured(snap):
+        # still better than nothing until it is replaced
+        _rebuild_later(root, kind, name, "snapshot built with other settings")
+    return _layered(snap, name)
+
+
+# kind -> thread rebuilding its index, at most one per kind in this worker
+_REBUILDS: dict[str, threading.Thread] = {}
+
+
+def _rebuild_later(root: str | None, kind: str, name: str | None, reason: str) -> None:
+    """
+    Rebuild the index of ``kind`` in a background thread, unless this worker
+    already is: a full build takes longer than a request may (gunicorn's
+    timeout), and a worker killed mid-build would leave it to the next
+    request to start over. With ``root``, the snapshot is republished for
+    every worker, unless another one replaced ``name`` meanwhile; without,
+    it replaces this worker's own index.
+    """
+    thread = _REBUILDS.get(kind)
+    if thread is not None and thread.is_alive():
+        return
+    current_app.logger.warning(
+        f"Search index of {kind}s is due for a rebuild ({reason}); "
+        "rebuilding it in the background"
+    )
+    thread = threading.Thread(
+        target=_rebuild,
+        args=(current_app._get_current_object(), root, kind, name),
+        name=f"search-rebuild-{kind}",
+        daemon=True,
+    )
+    _REBUILDS[kind] = thread
+    thread.start()
+
+
+def _rebuild(app, root: str | None, kind: str, name: str | None) -> None:
+    with app.app_context():
+        try:
+            if not root:
+                _INDEXES[kind] = _layered(_build_snapshot(kind))
+                _changed()
+                return
+            with search_snapshot.build_lock(root):
+                if search_snapshot.current_snapshot(root) == name:
+                    _publish(root, kind)
+        except Exception:
+            app.logger.exception(f"Rebuilding the search index of {kind}s failed")
+        finally:
+            db.session.remove()
+
+
+def _apply_changes(idx: _Index, kind: str, changes: list[tuple[int, int]]) -> None:
+    source = _SOURCES[kind]
+    model = source.model
+    row_ids = {row_id for _change_id, row_id in changes}
+    # what the index was built with, whatever the config says now
+    code = "code" in idx.index.params["weights"]
+    rows = model.query.filter(model.id.in_(row_ids)).options(*source.options(code))
+    rows_by_id = {row.id: row for row in rows}
+
+    for row_id in row_ids:
+        row = rows_by_id.get(row_id)
+        # deleted or no longer public -> drop it; otherwise (re)index
+        if row is None or row.visibility != "public":
+            idx.index.remove(str(row_id))
+        else:
+            idx.index.add(str(row_id), source.to_doc(row, code))
+
+
+def get_index(force_rebuild: bool = False, kind: str = "post") -> SearchIndex:
+    """
+    The index of the documents of ``kind`` (a ``DOC_TYPES`` value).
+
+    With ``SEARCH_INDEX_DIR`` set, every worker maps the same published
+    snapshot (one directory per type) and keeps only the rows changed since
+    then in memory; once that delta grows too large, one worker publishes a
+    fresh snapshot for all, in the background. Without it, each worker
+    builds its own snapshot in memory on first use, and rebuilds it in the
+    background once the delta grows too large.
+    """
+    before = _INDEXES.get(kind)
+    root = current_app.config.get("SEARCH_INDEX_DIR")
+    if root:
+        root = os.path.join(root, kind)
+        _INDEXES[kind] = _sync_snapshot(root, kind, force_rebuild)
+    elif force_rebuild or kind not in _INDEXES:
+        _INDEXES[kind] = _layered(_build_snapshot(kind))
+
+    idx = _INDEXES[kind]
+    changes = _pending_changes(idx.cursor, kind)
+    if idx.index.delta_size + len(changes) > _MAX_DELTA:
+        # keeps serving the delta until the rebuild is in, catching up
+        # ``_MAX_DELTA`` + 1 changes per sync
+        _rebuild_later(root, kind, idx.snapshot, "too many changes since its build")
+
+    if changes:
+        _apply_changes(idx, kind, changes)
+    idx.cursor.advance(changes)
+    if changes or idx is not before:
+        _changed()
+
+    return idx.index
+
+
+@dataclass
+class _OkapiIndex:
     ids: list[str]
     posts: list[dict]
     tag_sets: list[set[str]]
     bm25: object
+    cursor: _Cursor
+
+
+_OKAPI: _OkapiIndex | None = None
 
 
-# Simple module-level
-_INDEX: _Index | None = None
-_INDEX_SIZE: int = -1
-
-
-def get_index(force_rebuild: bool = False) -> _Index:
-    global _INDEX, _INDEX_SIZE
-
-    if force_rebuild or _INDEX is None:
-        posts_by_id = _load_posts_for_index()
-        size = len(posts_by_id)
-        ids, posts, tag_sets, bm25 = search_engine.build_index(posts_by_id)
-        _INDEX = _Index(ids=ids, posts=posts, tag_sets=tag_sets, bm25=bm25)
-        _INDEX_SIZE = size
-    else:
-        current_size = Post.query.filter(Post.visibility == "public").count()
-        if current_size != _INDEX_SIZE:
-            posts_by_id = _load_posts_for_index()
-            size = len(posts_by_id)
-            ids, posts, tag_sets, bm25 = search_engine.build_index(posts_by_id)
-            _INDEX = _Index(ids=ids, posts=posts, tag_sets=tag_sets, bm25=bm25)
-            _INDEX_SIZE = size
-
-    return _INDEX
-
-
-def search_post_ids(query: str, limit: int = 30) -> list[int]:
-    idx = get_index()
-    results: list[Tuple[str, float]] = search_engine.search(
-        query=query,
-        ids=idx.ids,
-        posts=idx.posts,
-        tag_sets=idx.tag_sets,
-        bm25=idx.bm25,
-        top_k=limit,
-        detailed=False,
+def _okapi_index() -> _OkapiIndex:
+    """rank_bm25 reference engine: immutable, rebuilt whenever posts change."""
+    global _OKAPI
+
+    if _OKAPI is not None:
+        changes = _pending_changes(_OKAPI.cursor)
+        _OKAPI.cursor.advance(changes)
+        if not changes:
+            return _OKAPI
+
+    cursor = _current_cursor()
+    ids, posts, tag_sets, bm25 = search_engine.build_index(
+        _load_posts_for_index()
+    )
+    _OKAPI = _OkapiIndex(ids, posts, tag_sets, bm25, cursor)
+    _changed()
+    return _OKAPI
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of search results with a TTL, for one index version at
+    a time: the first lookup with a newer version drops every entry, so a
+    result computed before a reindex is never served after it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expires at, value), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync(self, version: int) -> None:
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key, version: int):
+        with self._lock:
+            self._sync(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version: int, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            # computed against an index older than the one already seen
+            if self.version is not None and version < self.version:
+                return
+            self._sync(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_CACHE: QueryCache | None = None
+
+
+def get_cache() -> QueryCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = QueryCache(
+            maxsize=current_app.config.get("SEARCH_CACHE_SIZE", 1024),
+            ttl=current_app.config.get("SEARCH_CACHE_TTL", 300),
+        )
+    return _CACHE
+
+
+class SearchProvider:
+    """
+    Backend of the search helpers below (``search_with_facets``,
+    ``suggest_query``, ``search_snippets``), chosen by the ``SEARCH_ENGINE``
+    setting.
+
+    ``sync`` brings the backend up to date with the posts and returns a
+    version that moves whenever it changes (``_REVISION``); results for one
+    version are cached until posts change. ``search`` returns
+    ``(post id, score)`` pairs, best first; ``search_facets`` returns
+    ``(type, id, score)`` triples of every document type the query asks for
+    (``search_query.query_types``), plus the number of matching documents
+    per facet value, or nothing if the backend cannot count them.
+    ``suggest`` returns a spelling-corrected query, if any, and
+    ``snippets`` the highlighted title and description excerpt of results
+    (``SearchIndex.snippets``), or nothing for results it has none of.
+    """
+
+    name = ""
+
+    def sync(self) -> int:
+        raise NotImplementedError
+
+    def search(self, query: str, limit: int) -> list[tuple]:
+        raise NotImplementedError
+
+    def search_facets(self, query: str, limit: int) -> tuple[list[tuple], dict]:
+        return [("post", pid, score) for pid, score in self.search(query, limit)], {}
+
+    def suggest(self, query: str) -> str | None:
+        return None
+
+    def snippets(self, query: str, kind: str, ids: list[int]) -> dict:
+        return {}
+
+
+def _add_counts(total: dict, counts: dict) -> None:
+    """Add the facet counts of one index to those of the others."""
+    for field, values in counts.items():
+        merged = total.setdefault(field, {})
+        for value, n in values:
+            merged[value] = merged.get(value, 0) + n
+
+
+class BM25Provider(SearchProvider):
+    """
+    In-house BM25F index, shared through snapshots (``get_index``): one per
+    document type, all built with the same tokenizer and parameters, so
+    their scores compare and the results of several merge by score.
+    """
+
+    name = "bm25"
+
+    def sync(self) -> int:
+        for kind in DOC_TYPES:
+            get_index(kind=kind)
+        return _REVISION
+
+    def search(self, query: str, limit: int) -> list[tuple]:
+        return _INDEXES["post"].index.search(query, top_k=limit, detailed=False)
+
+    def search_facets(self, query: str, limit: int) -> tuple[list[tuple], dict]:
+        """
+        Only the types the query asks for are scored. The type facet counts
+        the others too, as the query without its type filters would match
+        them, which costs a pass over their postings but no scoring.
+        """
+        types = query_types(parse_query(query))
+        any_type = without_field(query, "type")
+        results, counts = [], {}
+        for kind in DOC_TYPES:
+            index = _INDEXES[kind].index
+            if kind in types:
+                found, kind_counts = index.search_facets(query, top_k=limit)
+                results.extend((kind, pid, score) for pid, score in found)
+            else:
+                _found, kind_counts = index.search_facets(
+                    any_type, top_k=0, facets=("type",)
+                )
+            _add_counts(counts, kind_counts)
+
+        # stable: equal scores (filters alone) keep DOC_TYPES order
+        results.sort(key=lambda r: -r[2])
+        facets = {}
+        for field in FACET_FIELDS:
+            values = counts.get(field, {})
+            if field == "age":
+                facets[field] = list(values.items())
+            else:
+                facets[field] = sorted(values.items(), key=lambda v: (-v[1], v[0]))
+        return results[:limit], facets
+
+    def suggest(self, query: str) -> str | None:
+        return _INDEXES["post"].index.suggest(query)
+
+    def snippets(self, query: str, kind: str, ids: list[int]) -> dict:
+        found = _INDEXES[kind].index.snippets(query, [str(i) for i in ids])
+        return {int(pid): snippet for pid, snippet in found.items()}
+
+
+class OkapiProvider(SearchProvider):
+    """rank_bm25 reference engine."""
+
+    name = "okapi"
+
+    def sync(self) -> int:
+        _okapi_index()
+        return _REVISION
+
+    def search(self, query: str, limit: int) -> list[tuple]:
+        return search_engine.search(
+            query,
+            ids=_OKAPI.ids,
+            posts=_OKAPI.posts,
+            tag_sets=_OKAPI.tag_sets,
+            bm25=_OKAPI.bm25,
+            top_k=limit,
+            detailed=False,
+        )
+
+
+class PostgresProvider(SearchProvider):
+    """Full-text search in the database (``search_postgres``)."""
+
+    name = "postgres"
+    _cursor: _Cursor | None = None
+
+    def sync(self) -> int:
+        if not search_postgres.is_available():
+            raise RuntimeError("SEARCH_ENGINE=postgres needs a PostgreSQL database")
+        # the database is up to date, only the cached results need not be
+        if self._cursor is None:
+            self._cursor = _current_cursor()
+            _changed()
+        else:
+            changes = _pending_changes(self._cursor)
+            self._cursor.advance(changes)
+            if changes:
+                _changed()
+        return _REVISION
+
+    def search(self, query: str, limit: int) -> list[tuple]:
+        return search_postgres.search(query, limit)
+
+    def search_facets(self, query: str, limit: int) -> tuple[list[tuple], dict]:
+        # posts only: battles are not in the posts table's search vector
+        results = [
+            ("post", pid, score) for pid, score in search_postgres.search(query, limit)
+        ]
+        return results, search_postgres.facets(query)
+
+
+PROVIDERS = {p.name: p for p in (BM25Provider(), OkapiProvider(), PostgresProvider())}
+
+
+def get_provider() -> SearchProvider:
+    name = current_app.config.get("SEARCH_ENGINE", "bm25")
+    try:
+        return PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown SEARCH_ENGINE: {name}") from None
+
+
+def sync_search() -> int:
+    """
+    Bring the search backend up to date; the version it returns is passed
+    to the helpers below, so a page that calls several syncs once.
+    """
+    return get_provider().sync()
+
+
+def search_with_facets(
+    query: str, limit: int = 30, version: int | None = None
+) -> tuple[list[tuple[str, int]], dict]:
+    """
+    ``(type, id)`` of the best documents of the types ``query`` asks for
+    (posts unless it has a ``type:`` filter), plus the facet counts of every
+    matching document: ``{"type": [("post", 40), ("battle", 3)],
+    "lang": [("rust", 12), ...], "feedback": [...], "age": [...]}``.
+    """
+    provider = get_provider()
+    if version is None:
+        version = provider.sync()
+
+    if not tokenize(query):
+        return [], {}
+    # Key on the query as typed rather than its tokens: the phrase bonus
+    # matches its text, so "py" and "py!" rank differently, and operators
+    # such as OR or quotes change the results.
+    key = (provider.name, "facets", query, limit)
+
+    cache = get_cache()
+    entry = cache.get(key, version)
+    if entry is None:
+        results, facets = provider.search_facets(query, limit)
+        entry = (tuple((kind, int(pid)) for kind, pid, _score in results), facets)
+        cache.put(key, version, entry)
+    results, facets = entry
+    return list(results), facets
+
+
+def suggest_query(query: str, version: int | None = None) -> str | None:
+    """Spelling-corrected ``query`` ("did you mean"), or None."""
+    provider = get_provider()
+    if version is None:
+        version = provider.sync()
+
+    if not tokenize(query):
+        return None
+    key = (provider.name, "suggest", query)
+
+    cache = get_cache()
+    # cached as "" when there is nothing to suggest
+    suggestion = cache.get(key, version)
+    if suggestion is None:
+        suggestion = provider.suggest(query) or ""
+        cache.put(key, version, suggestion)
+    return suggestion or None
+
+
+def search_snippets(
+    query: str, results: list[tuple[str, int]], version: int | None = None
+) -> dict:
+    """
+    ``{(type, id): {"title": segments, "description": segments}}`` for the
+    ``results`` of ``search_with_facets``: ``(text, matched)`` segments of
+    the title and of an excerpt of the description, for the template to
+    mark up. Results the backend has no snippet for are left out.
+    """
+    provider = get_provider()
+    if version is None:
+        version = provider.sync()
+
+    if not results:
+        return {}
+    key = (provider.name, "snippets", query, tuple(results))
+
+    cache = get_cache()
+    found = cache.get(key, version)
+    if found is None:
+        found = {}
+        for kind in DOC_TYPES:
+            ids = [i for k, i in results if k == kind]
+            if ids:
+                for i, snippet in provider.snippets(query, kind, ids).items():
+                    found[(kind, i)] = snippet
+        cache.put(key, version, found)
+    return found
+
+
+@dataclass
+class _Completions:
+    # user id -> username, ranked by (points, public posts)
+    users: PrefixIndex
+    # tag -> tag, ranked by public posts
+    tags: PrefixIndex
+    # public post id -> (author id, tags): what to take back when it changes
+    posts: dict[int, tuple[int, tuple[str, ...]]]
+    user_posts: Counter
+    tag_posts: Counter
+    # the PostChange and UserChange rows applied
+    post_cursor: _Cursor
+    user_cursor: _Cursor
+    # time.monotonic() of the last look at the change logs
+    checked: float = 0.0
+
+
+_COMPLETIONS: _Completions | None = None
+_COMPLETIONS_LOCK = threading.Lock()
+
+
+def _completion_tags(tags: str | None) -> tuple[str, ...]:
+    # as the tag: filter spells them ("#Rust" -> "rust")
+    tags = {filter_key("tag", t)[len("tag:") :] for t in _tags_to_list(tags)}
+    return tuple(sorted(tags - {""}))
+
+
+def _current_user_cursor() -> _Cursor:
+    return _read_cursor(UserChange)
+
+
+def _count_post(c: _Completions, entry: tuple[int, tuple[str, ...]], n: int) -> None:
+    user_id, tags = entry
+    c.user_posts[user_id] += n
+    for tag in tags:
+        c.tag_posts[tag] += n
+
+
+def _rank(c: _Completions, user_ids, tags) -> None:
+    for tag in tags:
+        if c.tag_posts[tag] > 0:
+            c.tags.set(tag, tag, c.tag_posts[tag])
+        else:
+            del c.tag_posts[tag]
+            c.tags.remove(tag)
+    for user_id in user_ids:
+        entry = c.users.get(user_id)
+        if entry is not None:
+            username, (points, _posts) = entry
+            c.users.set(user_id, username, (points, c.user_posts[user_id]))
+
+
+def _build_completions() -> _Completions:
+    c = _Completions(
+        users=PrefixIndex(),
+        tags=PrefixIndex(),
+        posts={},
+        user_posts=Counter(),
+        tag_posts=Counter(),
+        post_cursor=_current_cursor(),
+        user_cursor=_current_user_cursor(),
+    )
+    posts = db.session.query(Post.id, Post.user_id, Post.tags).filter(
+        Post.visibility == "public"
+    )
+    for post_id, user_id, tags in posts:
+        c.posts[post_id] = (user_id, _completion_tags(tags))
+        _count_post(c, c.posts[post_id], 1)
+    for user_id, username, points in db.session.query(
+        User.id, User.username, User.points
+    ):
+        c.users.set(user_id, username, (points or 0, c.user_posts[user_id]))
+    _rank(c, (), list(c.tag_posts))
+    return c
+
+
+def _apply_completion_changes(c: _Completions, post_changes, user_changes) -> None:
+    user_ids = {user_id for _change_id, user_id in user_changes}
+    users = db.session.query(User.id, User.username, User.points).filter(
+        User.id.in_(user_ids)
     )
-    # convert "12" -> 12
-    return [int(pid) for pid, _score in results]
+    found = {user_id: (username, points) for user_id, username, points in users}
+    for user_id in user_ids:
+        if user_id in found:
+            username, points = found[user_id]
+            c.users.set(user_id, username, (points or 0, c.user_posts[user_id]))
+        else:
+            c.users.remove(user_id)
+
+    post_ids = {post_id for _change_id, post_id in post_changes}
+    posts = db.session.query(Post.id, Post.user_id, Post.tags).filter(
+        Post.id.in_(post_ids), Post.visibility == "public"
+    )
+    found = {
+        post_id: (user_id, _completion_tags(tags)) for post_id, user_id, tags in posts
+    }
+    touched_users, touched_tags = set(), set()
+    for post_id in post_ids:
+        for entry, n in ((c.posts.pop(post_id, None), -1), (found.get(post_id), 1)):
+            if entry is not None:
+                _count_post(c, entry, n)
+                touched_users.add(entry[0])
+                touched_tags.update(entry[1])
+        if post_id in found:
+            c.posts[post_id] = found[post_id]
+    _rank(c, touched_users, touched_tags)
+
+
+def _pending_user_changes(cursor: _Cursor) -> list[tuple[int, int]]:
+    return _changes_after(cursor, UserChange, UserChange.user_id)
+
+
+def get_completions() -> _Completions:
+    """
+    The autocomplete index of this worker, built on first use and brought
+    up to date from the post and user change logs at most once every
+    ``SEARCH_COMPLETE_SYNC`` seconds, so keystrokes in between cost no query.
+    """
+    global _COMPLETIONS
+    now = time.monotonic()
+    if _COMPLETIONS is None:
+        _COMPLETIONS = _build_completions()
+        _COMPLETIONS.checked = now
+        return _COMPLETIONS
+    if now - _COMPLETIONS.checked < current_app.config.get("SEARCH_COMPLETE_SYNC", 1):
+        return _COMPLETIONS
+
+    _COMPLETIONS.checked = now
+    post_changes = _pending_changes(_COMPLETIONS.post_cursor)
+    user_changes = _pending_user_changes(_COMPLETIONS.user_cursor)
+    if len(post_changes) + len(user_changes) > _MAX_DELTA:
+        # cheaper to start over than to replay
+        _COMPLETIONS = _build_completions()
+        _COMPLETIONS.checked = now
+        return _COMPLETIONS
+    if post_changes or user_changes:
+        _apply_completion_changes(_COMPLETIONS, post_changes, user_changes)
+    _COMPLETIONS.post_cursor.advance(post_changes)
+    _COMPLETIONS.user_cursor.advance(user_changes)
+    return _COMPLETIONS
+
+
+def complete(prefix: str, kinds=("users", "tags"), limit: int = 8) -> dict:
+    """
+    Most popular usernames and tags starting with ``prefix``:
+    ``{"users": [(username, points, posts)], "tags": [(tag, posts)]}``.
+    """
+    prefix = " ".join(prefix.split())
+    if not prefix:
+        return {kind: [] for kind in kinds}
+    with _COMPLETIONS_LOCK:
+        c = get_completions()
+        found = {}
+        if "users" in kinds:
+            found["users"] = [
+                (username, points, posts)
+                for username, (points, posts) in c.users.complete(prefix, limit)
+            ]
+        if "tags" in kinds:
+            found["tags"] = c.tags.complete(prefix.lstrip("#"), limit)
+    return found
@@ -0,0 +1,128 @@
+"""
+Prefix index for autocomplete of usernames and tags.
+
+Entries are kept in a list of keys sorted by their lowercased label, so the
+entries starting with a prefix are one contiguous range found by bisection.
+Ranges of a few hundred entries are ranked on the spot. The top entries of
+wider ranges (the first keystrokes) are ranked once and cached per prefix,
+a few times deeper than a lookup needs; a change to an entry only moves it in
+or out of the cached lists of its prefixes, which are re-ranked from scratch
+only once removals leave fewer than ``MAX_LIMIT`` of them. Adding,
+re-ranking or removing an entry costs one insertion into the sorted list, so
+the index is kept current change by change instead of being rebuilt.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from heapq import nlargest
+
+# entries ranked by scanning them; wider ranges are cached
+SCAN_LIMIT = 256
+# most completions returned for one prefix
+MAX_LIMIT = 20
+# entries cached per wide prefix, so removals rarely empty the cache
+CACHE_DEPTH = 4 * MAX_LIMIT
+
+
+def _key(label: str, entry_id) -> str:
+    # the id keeps equal labels apart ("Bob" and "bob") and sorts after them
+    return f"{label.lower()}\x00{entry_id}"
+
+
+class PrefixIndex:
+    """Labels by id, each with a popularity score (any comparable value)."""
+
+    def __init__(self):
+        self._keys: list[str] = []
+        # entry id -> (key, label, score)
+        self._entries: dict = {}
+        # key -> entry id
+        self._ids: dict[str, object] = {}
+        # prefix -> its top keys, most popular first, for ranges wider than
+        # SCAN_LIMIT: exactly the top len(list) keys of the range
+        self._top: dict[str, list[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, entry_id) -> bool:
+        return entry_id in self._entries
+
+    def get(self, entry_id) -> tuple[str, object] | None:
+        """``(label, score)`` of an entry."""
+        entry = self._entries.get(entry_id)
+        return entry[1:] if entry else None
+
+    def set(self, entry_id, label: str, score) -> None:
+        """Add an entry, or update its label and score."""
+        old = self._entries.get(entry_id)
+        if old is not None and old[1:] == (label, score):
+            return
+        self.remove(entry_id)
+        key = _key(label, entry_id)
+        insort(self._keys, key)
+        self._entries[entry_id] = (key, label, score)
+        self._ids[key] = entry_id
+        for _prefix, top in self._cached(key):
+            # behind the last cached key, it is not in the top len(top)
+            if self._before(key, top[-1]):
+                top.append(key)
+                self._sort(top)
+                del top[CACHE_DEPTH:]
+
+    def remove(self, entry_id) -> None:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return
+        key = entry[0]
+        for prefix, top in list(self._cached(key)):
+            if key in top:
+                top.remove(key)
+                # the next best keys are unknown
+                if len(top) < MAX_LIMIT:
+                    del self._top[prefix]
+        del self._entries[entry_id]
+        del self._keys[bisect_left(self._keys, key)]
+        del self._ids[key]
+
+    def _cached(self, key: str):
+        """``(prefix, top keys)`` of the cached prefixes of ``key``."""
+        label = key.split("\x00", 1)[0]
+        for i in range(1, len(label) + 1):
+            top = self._top.get(label[:i])
+            if top is not None:
+                yield label[:i], top
+
+    def _before(self, a: str, b: str) -> bool:
+        # more popular first; on equal scores the first label wins
+        score_a, score_b = self._score(a), self._score(b)
+        return score_a > score_b or (score_a == score_b and a < b)
+
+    def _sort(self, keys: list[str]) -> None:
+        # same order as nlargest: score descending, then key ascending
+        keys.sort()
+        keys.sort(key=self._score, reverse=True)
+
+    def _score(self, key: str):
+        return self._entries[self._ids[key]][2]
+
+    def complete(self, prefix: str, limit: int = 8) -> list[tuple[str, object]]:
+        """``(label, score)`` of the most popular entries starting with ``prefix``."""
+        prefix = prefix.lower()
+        limit = min(limit, MAX_LIMIT)
+        if not prefix or limit <= 0:
+            return []
+        lo = bisect_left(self._keys, prefix)
+        # every key starting with the prefix sorts before prefix + U+10FFFF
+        hi = bisect_left(self._keys, prefix + "\U0010ffff", lo)
+        if hi - lo <= SCAN_LIMIT:
+            # ties keep label order: nlargest is stable
+            top = nlargest(limit, self._keys[lo:hi], key=self._score)
+        else:
+            top = self._top.get(prefix)
+            if top is None:
+                top = nlargest(CACHE_DEPTH, self._keys[lo:hi], key=self._score)
+                self._top[prefix] = top
+            top = top[:limit]
+        return [self._entries[self._ids[key]][1:] for key in top]
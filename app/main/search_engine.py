@@ -4,6 +4,8 @@ Docstring for SearchEngine
 
 import re
 import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
 
 import numpy as np
 from rank_bm25 import BM25Okapi
@@ -180,6 +182,11 @@ STOPWORDS = {
 # Unicode-friendly token pattern (letters+digits, no underscores)
 TOKEN_RE = re.compile(r"[^\W_]+", flags=re.UNICODE)
 
+# field bonuses added on top of BM25
+TAG_BONUS_CAP = 0.8
+TITLE_BONUS = 0.8
+DESCRIPTION_BONUS = 0.3
+
 
 def _normalize_text(s: str) -> str:
     s = unicodedata.normalize("NFKC", s or "")
@@ -218,14 +225,112 @@ def tokenize(s: str, lang: str = "en") -> list[str]:
             t = _stem_en_simple(t)
         out.append(t)
 
+    return _with_bigrams(out)
+
+
+def _with_bigrams(words: list[str]) -> list[str]:
     # Add “joined bigrams” to help with compounds:
     # "tim sort" produces "timsort" so it matches "TimSort"/"timsort"
-    if len(out) >= 2:
-        out += [out[i] + out[i + 1] for i in range(len(out) - 1)]
+    if len(words) >= 2:
+        return words + [words[i] + words[i + 1] for i in range(len(words) - 1)]
+    return words
+
+
+# where _normalize_text puts a space inside a run of letters and digits
+_SPLIT_RE = re.compile(
+    r"(?<=[a-z])(?=[A-Z])"
+    r"|(?<=[A-Za-zА-Яа-яІіЇїЄєҐґ])(?=\d)"
+    r"|(?<=\d)(?=[A-Za-zА-Яа-яІіЇїЄєҐґ])"
+)
+
+
+def _mapped(pieces) -> tuple[str, list[int], list[int]]:
+    """
+    Join ``(text, a, b)`` pieces, each made from characters ``[a, b)`` of
+    another text; every character of the result gets the ``a`` and ``b`` of
+    its piece.
+    """
+    starts: list[int] = []
+    ends: list[int] = []
+    for text, a, b in pieces:
+        starts.extend([a] * len(text))
+        ends.extend([b] * len(text))
+    return "".join(text for text, _a, _b in pieces), starts, ends
+
+
+def _lowered(run: str, offset: int) -> list[tuple[str, int, int]]:
+    return [(c, offset + i, offset + i + 1) for i, c in enumerate(run.lower())]
+
+
+def tokenize_spans(s: str, lang: str = "en") -> list[tuple[str, int, int]]:
+    """
+    The words ``tokenize`` gives ``s`` (not the joined bigrams), each with
+    the ``[start, end)`` character offsets in ``s`` of the text it comes
+    from, so a match can be highlighted without tokenizing ``s`` again.
+
+    Characters that normalizing turns into others map back to what they came
+    from: the offsets of "ﬁle" cover all of it. (Only a final sigma right
+    after a letter whose lowercase is longer, as in "İΣ", may lower unlike
+    it does in ``tokenize``.)
+    """
+    s = s or ""
+    nfkc = None
+    if not unicodedata.is_normalized("NFKC", s):
+        # every character with its combining marks apart
+        bounds = [i for i, c in enumerate(s) if i == 0 or not unicodedata.combining(c)]
+        bounds.append(len(s))
+        s, *nfkc = _mapped(
+            [
+                (unicodedata.normalize("NFKC", s[a:b]), a, b)
+                for a, b in zip(bounds, bounds[1:])
+            ]
+        )
 
+    # the spaces _normalize_text inserts, at these offsets of `spaced`
+    cuts = [m.start() for m in _SPLIT_RE.finditer(s)]
+    spaced = " ".join(s[a:b] for a, b in zip([0] + cuts, cuts + [len(s)]))
+    spaces = [cut + k for k, cut in enumerate(cuts)]
+
+    low = spaced.lower()
+    lower = None
+    if len(low) != len(spaced):
+        # lowering changes a length ("İ"): lower those characters apart and
+        # the runs between them whole, as the final sigma depends on them
+        pieces, run = [], 0
+        for i, c in enumerate(spaced):
+            if len(c.lower()) != 1:
+                pieces += _lowered(spaced[run:i], run)
+                pieces.append((c.lower(), i, i + 1))
+                run = i + 1
+        pieces += _lowered(spaced[run:], run)
+        low, *lower = _mapped(pieces)
+
+    stop = STOPWORDS.get(lang, STOPWORDS["en"])
+    out: list[tuple[str, int, int]] = []
+    for m in TOKEN_RE.finditer(low):
+        tok = m.group(0)
+        if tok in stop:
+            continue
+        if lang == "en":
+            tok = _stem_en_simple(tok)
+        start, end = m.start(), m.end()
+        if lower:
+            start, end = lower[0][start], lower[1][end - 1]
+        if spaces:
+            start -= bisect_left(spaces, start)
+            end -= bisect_left(spaces, end)
+        if nfkc:
+            start, end = nfkc[0][start], nfkc[1][end - 1]
+        out.append((tok, start, end))
     return out
 
 
+def _words(tokens: list[str]) -> list[str]:
+    """The words of ``tokenize`` output, without the joined bigrams after them."""
+    # n words are followed by n - 1 bigrams
+    return tokens[: (len(tokens) + 1) // 2]
+
+
 def _tags_to_list(tags) -> list[str]:
     # Accept list[str], set[str], tuple[str], or "a, b, c"
     if not tags:
@@ -243,6 +348,313 @@ def tokenize_tag(tag: str, lang: str = "en") -> list[str]:
     return tokenize(tag, lang=lang)
 
 
+# Reserved words (and receiver names) per Post.language: in every snippet of
+# the language, so they say nothing about what a post is about
+CODE_KEYWORDS = {
+    "python": """
+        false none true and as assert async await break class continue def del
+        elif else except finally for from global if import in is lambda
+        nonlocal not or pass raise return try while with yield self cls
+    """,
+    "javascript": """
+        break case catch class const continue debugger default delete do else
+        export extends finally for function if import in instanceof let new
+        return super switch this throw try typeof var void while with yield
+        async await of null undefined true false static get set
+    """,
+    "typescript": """
+        break case catch class const continue debugger default delete do else
+        export extends finally for function if import in instanceof let new
+        return super switch this throw try typeof var void while with yield
+        async await of null undefined true false static get set interface
+        type enum implements public private protected readonly declare
+        namespace abstract as any keyof
+    """,
+    "rust": """
+        as async await break const continue crate dyn else enum extern false fn
+        for if impl in let loop match mod move mut pub ref return self static
+        struct super trait true type unsafe use where while
+    """,
+    "go": """
+        break case chan const continue default defer else fallthrough for func
+        go goto if import interface map package range return select struct
+        switch type var nil true false
+    """,
+    "java": """
+        abstract assert boolean break byte case catch char class const continue
+        default do double else enum extends final finally float for goto if
+        implements import instanceof int interface long native new package
+        private protected public return short static strictfp super switch
+        synchronized this throw throws transient try void volatile while true
+        false null var
+    """,
+    "cpp": """
+        alignas alignof and asm auto bool break case catch char class const
+        constexpr const_cast continue decltype default delete do double
+        dynamic_cast else enum explicit export extern false float for friend
+        goto if inline int long mutable namespace new noexcept not nullptr
+        operator or private protected public register reinterpret_cast return
+        short signed sizeof static static_assert static_cast struct switch
+        template this throw true try typedef typeid typename union unsigned
+        using virtual void volatile while include define ifdef ifndef endif
+        pragma std
+    """,
+    "csharp": """
+        abstract as base bool break byte case catch char checked class const
+        continue decimal default delegate do double else enum event explicit
+        extern false finally fixed float for foreach goto if implicit in int
+        interface internal is lock long namespace new null object operator out
+        override params private protected public readonly ref return sbyte
+        sealed short sizeof stackalloc static string struct switch this throw
+        true try typeof uint ulong unchecked unsafe ushort using virtual void
+        volatile while var async await get set
+    """,
+}
+CODE_KEYWORDS = {
+    lang: frozenset(words.split()) for lang, words in CODE_KEYWORDS.items()
+}
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# words of an identifier: "parseHTTPHeader_v2" -> parse, HTTP, Header, v, 2
+IDENTIFIER_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+@lru_cache(maxsize=65536)
+def _identifier_tokens(ident: str, lang: str) -> tuple[str, ...]:
+    """The words of ``ident`` stemmed like ``tokenize``, plus joined bigrams."""
+    stop = STOPWORDS.get(lang, STOPWORDS["en"])
+    words = []
+    for part in IDENTIFIER_PART_RE.findall(ident):
+        word = part.lower()
+        # loop counters and numbers match nothing useful
+        if len(word) <= 1 or word.isdigit() or word in stop:
+            continue
+        words.append(_stem_en_simple(word) if lang == "en" else word)
+    return tuple(words + [a + b for a, b in zip(words, words[1:])])
+
+
+def tokenize_code(code: str, language: str = "", lang: str = "en") -> list[str]:
+    """
+    Tokens of the identifiers (and comment words) of a snippet: keywords of
+    ``language`` dropped, snake_case, camelCase and acronyms split into words
+    that are then tokenized like prose, so "parseJSON" and "parse_json" both
+    give "parse", "json" and "parsejson". Single characters and numbers are
+    dropped. Identifiers repeat across snippets, so their tokens are cached.
+    """
+    keywords = CODE_KEYWORDS.get((language or "").lower(), frozenset())
+    counts: dict[str, int] = {}
+    for ident in IDENTIFIER_RE.findall(code or ""):
+        counts[ident] = counts.get(ident, 0) + 1
+
+    out: list[str] = []
+    for ident, n in counts.items():
+        if ident.lower() in keywords:
+            continue
+        out.extend(_identifier_tokens(ident, lang) * n)
+    return out
+
+
+class FieldMatcher:
+    """
+    Per-document data for the tag boost and the phrase/substring bonus,
+    precomputed once per document instead of once per document per query.
+
+    Tag tokens form a token-id -> slots sparse matrix, so the tag boost is a
+    single ``np.bincount`` over the postings of the query tokens. Normalized
+    titles and descriptions are joined into NUL-separated blobs (one per chunk
+    of slots), so the phrase bonus is a ``str.find`` scan in C with Python
+    work only per match. Slots can be set and cleared one at a time; only the
+    touched chunk's blob is rebuilt, lazily, on the next query.
+    """
+
+    CHUNK = 2048
+
+    def __init__(self):
+        self._tag_ids: dict[str, int] = {}
+        self._tag_slots: list[set[int]] = []
+        # token id -> slots array, dropped whenever that token changes
+        self._tag_arrays: dict[int, np.ndarray] = {}
+        self._slot_tags: list[list[int]] = []
+        self._texts: dict[str, list[str]] = {"title": [], "description": []}
+        # (field, chunk) -> (blob, start offset of every slot in the blob)
+        self._blobs: dict[tuple[str, int], tuple[str, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_tags)
+
+    def _invalidate(self, slot: int) -> None:
+        chunk = slot // self.CHUNK
+        for field in self._texts:
+            self._blobs.pop((field, chunk), None)
+
+    def set(self, slot: int, title: str, description: str, tag_tokens) -> None:
+        while len(self._slot_tags) <= slot:
+            self._slot_tags.append([])
+            for texts in self._texts.values():
+                texts.append("")
+        self.clear(slot)
+
+        self._texts["title"][slot] = _normalize_text(title)
+        self._texts["description"][slot] = _normalize_text(description)
+
+        tids = []
+        for tok in set(tag_tokens):
+            tid = self._tag_ids.get(tok)
+            if tid is None:
+                tid = self._tag_ids[tok] = len(self._tag_slots)
+                self._tag_slots.append(set())
+            self._tag_slots[tid].add(slot)
+            self._tag_arrays.pop(tid, None)
+            tids.append(tid)
+        self._slot_tags[slot] = tids
+
+    def clear(self, slot: int) -> None:
+        if slot >= len(self._slot_tags):
+            return
+        for tid in self._slot_tags[slot]:
+            self._tag_slots[tid].discard(slot)
+            self._tag_arrays.pop(tid, None)
+        self._slot_tags[slot] = []
+        for texts in self._texts.values():
+            texts[slot] = ""
+        self._invalidate(slot)
+
+    def tag_hits(self, tokens) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Slots sharing tag tokens with ``tokens`` and, for each, the number of
+        distinct shared tokens.
+        """
+        arrays = []
+        for tok in set(tokens):
+            tid = self._tag_ids.get(tok)
+            if tid is None:
+                continue
+            arr = self._tag_arrays.get(tid)
+            if arr is None:
+                slots = self._tag_slots[tid]
+                arr = np.fromiter(slots, dtype=np.int64, count=len(slots))
+                self._tag_arrays[tid] = arr
+            arrays.append(arr)
+        return _count_slots(arrays)
+
+    def _blob(self, field: str, chunk: int) -> tuple[str, np.ndarray]:
+        cached = self._blobs.get((field, chunk))
+        if cached is None:
+            part = self._texts[field][chunk * self.CHUNK : (chunk + 1) * self.CHUNK]
+            lens = np.array([len(t) + 1 for t in part], dtype=np.int64)
+            starts = np.concatenate(([0], np.cumsum(lens)[:-1]))
+            cached = self._blobs[(field, chunk)] = ("\x00".join(part), starts)
+        return cached
+
+    def contains(self, slots: np.ndarray, q_norm: str, field: str) -> np.ndarray:
+        """Mask of ``slots`` whose normalized ``field`` contains ``q_norm``."""
+        texts = self._texts[field]
+        return np.fromiter(
+            (q_norm in texts[s] for s in slots), dtype=bool, count=len(slots)
+        )
+
+    def phrase_hits(self, q_norm: str, field: str) -> np.ndarray:
+        """Ascending slots whose normalized ``field`` contains ``q_norm``."""
+        hits: list[int] = []
+        # a NUL in the query could match across two documents of a blob
+        if not q_norm or "\x00" in q_norm:
+            return np.zeros(0, dtype=np.int64)
+
+        n_chunks = -(-len(self._texts[field]) // self.CHUNK)
+        for chunk in range(n_chunks):
+            blob, starts = self._blob(field, chunk)
+            _find_all(blob, starts, q_norm, hits, chunk * self.CHUNK)
+        return np.array(hits, dtype=np.int64)
+
+
+def _count_slots(arrays) -> tuple[np.ndarray, np.ndarray]:
+    if not arrays:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.unique(np.concatenate(arrays), return_counts=True)
+
+
+def _find_all(blob, starts, needle, hits: list[int], offset: int) -> None:
+    """
+    Append ``offset + i`` to ``hits`` for every document ``i`` of a NUL-joined
+    blob (str, bytes or mmap) that contains ``needle``; ``starts`` holds each
+    document's start offset in the blob.
+    """
+    pos = blob.find(needle)
+    while pos != -1:
+        i = int(np.searchsorted(starts, pos, side="right")) - 1
+        hits.append(offset + i)
+        # one hit per document is enough, jump to the next one
+        if i + 1 >= len(starts):
+            break
+        pos = blob.find(needle, int(starts[i + 1]))
+
+
+def _phrase_query(query: str) -> str | None:
+    q_norm = _normalize_text(query)
+    # same condition as in ``phrase_hits``
+    if not q_norm or "\x00" in q_norm:
+        return None
+    return q_norm
+
+
+def _tag_bonus(hit: np.ndarray) -> np.ndarray:
+    # if query hits tag tokens, boost more aggressively for small docs
+    # scale by hit count, but cap
+    return np.minimum(TAG_BONUS_CAP, 0.25 + 0.25 * hit)
+
+
+def _bonuses(fields, qset, query: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Tag boost and phrase/substring bonus as ``(slots, bonus)`` pairs, from a
+    ``FieldMatcher`` or anything with the same ``tag_hits``/``phrase_hits``.
+    """
+    tag_slots, hit = fields.tag_hits(qset)
+
+    # phrase/substr bonus
+    q_norm = _normalize_text(query)
+    in_title = fields.phrase_hits(q_norm, "title")
+    in_desc = np.setdiff1d(fields.phrase_hits(q_norm, "description"), in_title)
+
+    slots = np.concatenate((tag_slots, in_title, in_desc))
+    bonus = np.concatenate(
+        (
+            _tag_bonus(hit),
+            np.full(len(in_title), TITLE_BONUS),
+            np.full(len(in_desc), DESCRIPTION_BONUS),
+        )
+    )
+    return slots, bonus
+
+
+def _bonuses_of(fields, slots: np.ndarray, qset, query: str) -> np.ndarray:
+    """``_bonuses`` restricted to ``slots``: one bonus per slot, possibly 0."""
+    bonus = np.zeros(len(slots), dtype=np.float64)
+    tag_slots, hit = fields.tag_hits(qset)
+    if len(tag_slots):
+        pos = np.searchsorted(tag_slots, slots)
+        pos[pos == len(tag_slots)] = 0
+        tagged = tag_slots[pos] == slots
+        bonus[tagged] += _tag_bonus(hit[pos[tagged]])
+
+    q_norm = _phrase_query(query)
+    if q_norm is not None and len(slots):
+        in_title = fields.contains(slots, q_norm, "title")
+        bonus[in_title] += TITLE_BONUS
+        rest = np.flatnonzero(~in_title)
+        in_desc = fields.contains(slots[rest], q_norm, "description")
+        bonus[rest[in_desc]] += DESCRIPTION_BONUS
+    return bonus
+
+
+class BM25Index(BM25Okapi):
+    """``BM25Okapi`` that carries the precomputed ``FieldMatcher`` of its corpus."""
+
+    def __init__(self, corpus, fields: FieldMatcher):
+        super().__init__(corpus)
+        self.fields = fields
+
+
 def build_index(
     posts_by_id: dict, *, lang: str = "en", title_weight: int = 3, tag_weight: int = 4
 ):
@@ -250,6 +662,7 @@ def build_index(
     posts = []
     tag_sets = []
     corpus = []
+    fields = FieldMatcher()
 
     for pid, p in posts_by_id.items():
         title = p.get("title", "") or ""
@@ -277,6 +690,7 @@ def build_index(
         if not doc_tokens:
             continue
 
+        fields.set(len(ids), title, desc, ts)
         ids.append(pid)
         posts.append(p)
         corpus.append(doc_tokens)
@@ -286,7 +700,7 @@ def build_index(
         bm25 = None
         return ids, posts, tag_sets, bm25
 
-    bm25 = BM25Okapi(corpus)
+    bm25 = BM25Index(corpus, fields)
     return ids, posts, tag_sets, bm25
 
 
@@ -311,26 +725,8 @@ def search(
     qset = set(q_tokens)
     scores = bm25.get_scores(q_tokens).astype(float)
 
-    # if query hits tag tokens, boost more aggressively for small docs
-    for i, ts in enumerate(tag_sets):
-        if not ts:
-            continue
-        hit = len(ts & qset)
-        if hit:
-            # scale by hit count, but cap
-            scores[i] += min(0.8, 0.25 + 0.25 * hit)
-
-    # fdksgfj
-
-    # phrase/substr bonus
-    q_norm = _normalize_text(query)
-    for i, p in enumerate(posts):
-        title = _normalize_text(p.get("title", "") or "")
-        desc = _normalize_text(p.get("description", "") or "")
-        if q_norm and (q_norm in title):
-            scores[i] += 0.8
-        elif q_norm and (q_norm in desc):
-            scores[i] += 0.3
+    slots, bonus = _bonuses(bm25.fields, qset, query)
+    np.add.at(scores, slots, bonus)
 
     idx = np.argsort(scores)[::-1][:top_k]
 
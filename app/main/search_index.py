@@ -0,0 +1,1318 @@
+"""
+In-house BM25 search engine used by the search service.
+
+The corpus is held in an immutable, array-backed ``IndexSnapshot``: integer
+term ids and CSR postings (int32 slots and float32 normalized term
+frequencies), built straight from token ids without any per-document dict.
+
+Title, description and tags are separate fields, each with its own weight and
+length normalization (BM25F). Code is an optional fourth field, indexed only
+when it has a weight: it is tokenized by identifier and never stored. Field
+weights and per-document length normalization are folded into one "impact"
+per posting when it is indexed, so a query costs the same as plain BM25.
+Changing weights needs a reindex.
+
+Scoring is term-at-a-time over the postings of the query terms only, so
+documents that share no term with the query are never touched. Top-k
+retrieval prunes with MaxScore (``_max_score``): common terms, whose
+contribution is bounded, are only looked up for documents that can still make
+the top k, and the phrase bonus only scans the texts of those documents.
+
+Queries may carry filters (``lang:rust``), required phrases and exclusions
+(``search_query``); they are resolved to sets of slots, from filter postings
+and term postings, before scoring, and restrict it to those documents.
+The same postings count the matching documents per language and feedback
+type (``search_facets``), and a per-document creation time buckets them by
+age, without touching the database.
+
+Query words found nowhere in the index are expanded to their nearest words in
+the vocabulary (``search_spell``), which also suggests a corrected query.
+
+Documents changed after the snapshot was built are kept in a small mutable
+layer on top of it, so adds, removes and updates cost time proportional to
+the size of the document instead of a rebuild of the corpus.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from multiprocessing import get_context
+
+import numpy as np
+
+from app.main.search_engine import (
+    TITLE_BONUS,
+    FieldMatcher,
+    _bonuses,
+    _bonuses_of,
+    _normalize_text,
+    _phrase_query,
+    _tag_bonus,
+    _tags_to_list,
+    _with_bigrams,
+    _words,
+    tokenize,
+    tokenize_code,
+    tokenize_spans,
+    tokenize_tag,
+)
+from app.main.search_query import (
+    AGE_BUCKETS,
+    FACET_FIELDS,
+    ParsedQuery,
+    filter_keys,
+    parse_query,
+    rewrite_words,
+)
+from app.main.search_snapshot import FORMAT_VERSION, TEXT_FIELDS, IndexSnapshot
+from app.main.search_snippet import SNIPPET_CHARS, highlight, matches, snippet
+from app.main.search_spell import (
+    MAX_EXPANSIONS,
+    SpellDelta,
+    build_spell,
+    corrections,
+    is_word,
+)
+
+DEFAULT_PARAMS = {
+    "lang": "en",
+    # "bm25f": per-field length normalization, "bm25": one weighted bag of
+    # tokens (title tokens counted 3 times, tags 4 times)
+    "scoring": "bm25f",
+    "weights": {"title": 3.0, "description": 1.0, "tags": 4.0},
+    "k1": 1.5,
+    # length normalization of the "bm25" bag and of every "bm25f" field
+    "b": 0.75,
+    "field_b": {"title": 0.75, "description": 0.75, "tags": 0.75, "code": 0.75},
+}
+
+# document keys that are indexed but not kept with the document
+UNSTORED = ("code",)
+# posts handed to a worker process at a time by a parallel build
+BUILD_CHUNK = 2000
+
+
+def _text_spans(post: dict, lang: str) -> dict[str, list[tuple[str, int, int]]]:
+    """Words of the title and description with their character offsets."""
+    return {f: tokenize_spans(post.get(f, "") or "", lang=lang) for f in TEXT_FIELDS}
+
+
+def _field_tokens(
+    post: dict, lang: str, fields=(), spans: dict | None = None
+) -> dict[str, list[str]]:
+    """Tokens of every field; title and description from ``spans`` if given."""
+    tag_tokens: list[str] = []
+    for t in _tags_to_list(post.get("tags")):
+        tag_tokens.extend(tokenize_tag(str(t), lang=lang))
+    if spans is None:
+        spans = _text_spans(post, lang)
+    tokens = {
+        f: _with_bigrams([word for word, _start, _end in spans[f]]) for f in TEXT_FIELDS
+    }
+    tokens["tags"] = tag_tokens
+    if "code" in fields:
+        tokens["code"] = tokenize_code(
+            post.get("code", "") or "", post.get("language", ""), lang=lang
+        )
+    return tokens
+
+
+def _stored(post: dict) -> dict:
+    """``post`` as kept in the index, without the ``UNSTORED`` keys."""
+    if not any(key in post for key in UNSTORED):
+        return post
+    return {k: v for k, v in post.items() if k not in UNSTORED}
+
+
+def _doc_words(tokens: dict[str, list[str]]) -> set[str]:
+    """Words of a document for spelling correction (tag tokens included)."""
+    return (
+        set(_words(tokens["title"]))
+        | set(_words(tokens["description"]))
+        | set(tokens["tags"])
+    )
+
+
+def _field_norms(lens: dict, avg_len: dict, params: dict):
+    """
+    Per-document scaling of term frequencies, from per-field lengths (arrays
+    over documents, or numbers for one document): the normalized term
+    frequency of a posting is ``sum(tf[f] * coef[f]) / denom``, and it scores
+    ``idf * (k1 + 1) * tfn / (k1 + tfn)``.
+
+    "bm25f" normalizes every field by its own average length and then sums
+    them by weight. "bm25" sums the weighted fields first, which is exactly
+    what repeating title and tag tokens into one bag of tokens did.
+    """
+    weights = params["weights"]
+    if params["scoring"] == "bm25":
+        b = params["b"]
+        dl = sum(w * lens[f] for f, w in weights.items())
+        avgdl = sum(w * avg_len[f] for f, w in weights.items())
+        denom = 1.0 - b + b * dl / avgdl if avgdl else 1.0
+        return dict(weights), denom
+
+    coef = {}
+    for f, w in weights.items():
+        b, avg = params["field_b"][f], avg_len[f]
+        # a field empty in the whole base corpus is not normalized
+        ratio = lens[f] / avg if avg else 1.0
+        coef[f] = w / (1.0 - b + b * ratio)
+    return coef, 1.0
+
+
+def _csr(rows: array, n_rows: int, *columns: array) -> tuple[np.ndarray, ...]:
+    """Group (row, column...) triples by row. Rows keep their input order."""
+    rows_np = np.frombuffer(rows, dtype=np.int32)
+    order = np.argsort(rows_np, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows_np, minlength=n_rows), out=indptr[1:])
+    return (indptr,) + tuple(np.frombuffer(c, dtype=np.int32)[order] for c in columns)
+
+
+def _join(encoded: list[bytes]) -> tuple[bytes, np.ndarray]:
+    starts = np.zeros(len(encoded), dtype=np.int64)
+    if encoded:
+        np.cumsum([len(e) + 1 for e in encoded[:-1]], out=starts[1:])
+    return b"\x00".join(encoded), starts
+
+
+class _Segment:
+    """
+    Postings and stored data of a run of consecutive posts, in the flat
+    ``array`` rows ``build_snapshot`` turns into a snapshot. Term, tag and
+    filter ids and slots count from zero within a segment; ``merge``
+    renumbers another segment into this one.
+    """
+
+    def __init__(self, fields: list[str]):
+        self.fields = fields
+        self.term_ids: dict[str, int] = {}
+        self.tag_ids: dict[str, int] = {}
+        self.filter_ids: dict[str, int] = {}
+        # (term id, slot, field, tf) rows, one per field a term occurs in, and
+        # (tag id, slot) and (filter id, slot) rows, int32 each
+        self.p_terms, self.p_slots = array("i"), array("i")
+        self.p_fields, self.p_tfs = array("i"), array("i")
+        self.t_terms, self.t_slots = array("i"), array("i")
+        self.f_terms, self.f_slots = array("i"), array("i")
+        self.lens = {f: array("i") for f in fields}
+        self.post_ids = array("q")
+        self.created = array("q")
+        # word -> documents, for spelling correction
+        self.word_df: Counter = Counter()
+        self.texts: dict[str, list[bytes]] = {field: [] for field in TEXT_FIELDS}
+        # per text field: words per post, and (term id, start, length) of each
+        self.span_counts = {field: array("q") for field in TEXT_FIELDS}
+        self.span_terms = {field: array("i") for field in TEXT_FIELDS}
+        self.span_starts = {field: array("i") for field in TEXT_FIELDS}
+        self.span_lens = {field: array("H") for field in TEXT_FIELDS}
+        self.docs: list[bytes] = []
+
+    def add(self, pid: str, post: dict, lang: str) -> None:
+        fields = self.fields
+        spans = _text_spans(post, lang)
+        tokens = _field_tokens(post, lang, fields, spans)
+        if not any(tokens[f] for f in fields):
+            return
+
+        slot = len(self.post_ids)
+        term_ids = self.term_ids
+        for field_id, f in enumerate(fields):
+            counts = Counter(tokens[f])
+            self.p_terms.extend([term_ids.setdefault(t, len(term_ids)) for t in counts])
+            self.p_tfs.extend(counts.values())
+            self.p_slots.extend([slot] * len(counts))
+            self.p_fields.extend([field_id] * len(counts))
+            self.lens[f].append(len(tokens[f]))
+        # sets in sorted order: ids must not depend on the hash seed of the
+        # process, which differs between spawned build workers
+        for tok in sorted(set(tokens["tags"])):
+            self.t_terms.append(self.tag_ids.setdefault(tok, len(self.tag_ids)))
+            self.t_slots.append(slot)
+        for key in sorted(filter_keys(post)):
+            self.f_terms.append(self.filter_ids.setdefault(key, len(self.filter_ids)))
+            self.f_slots.append(slot)
+        self.word_df.update(sorted(_doc_words(tokens)))
+
+        self.post_ids.append(int(pid))
+        self.created.append(int(post.get("created") or 0))
+        for field in TEXT_FIELDS:
+            text = _normalize_text(post.get(field, "") or "")
+            self.texts[field].append(text.encode("utf-8"))
+            # an unweighted field has no postings, so no term ids either
+            words = spans[field] if field in fields else []
+            self.span_counts[field].append(len(words))
+            self.span_terms[field].extend([term_ids[w] for w, _a, _b in words])
+            self.span_starts[field].extend([a for _w, a, _b in words])
+            self.span_lens[field].extend([min(b - a, 0xFFFF) for _w, a, b in words])
+        self.docs.append(
+            json.dumps(_stored(post), ensure_ascii=False).encode("utf-8") + b"\n"
+        )
+
+    def merge(self, other: _Segment) -> None:
+        """
+        Append ``other``, built from the posts that follow these. New terms
+        get ids in the order ``other`` met them, so merging segments gives
+        the same ids (and snapshot) as adding their posts one by one.
+        """
+        offset = len(self.post_ids)
+        renumbered = {}
+        for ids, other_ids, rows, slots in (
+            (self.term_ids, other.term_ids, "p_terms", "p_slots"),
+            (self.tag_ids, other.tag_ids, "t_terms", "t_slots"),
+            (self.filter_ids, other.filter_ids, "f_terms", "f_slots"),
+        ):
+            renumber = np.array(
+                [ids.setdefault(key, len(ids)) for key in other_ids], dtype=np.int32
+            )
+            renumbered[rows] = renumber
+            other_rows = np.frombuffer(getattr(other, rows), dtype=np.int32)
+            getattr(self, rows).frombytes(renumber[other_rows].tobytes())
+            other_slots = np.frombuffer(getattr(other, slots), dtype=np.int32)
+            getattr(self, slots).frombytes((other_slots + offset).tobytes())
+        self.p_fields.extend(other.p_fields)
+        self.p_tfs.extend(other.p_tfs)
+        for f in self.fields:
+            self.lens[f].extend(other.lens[f])
+        self.post_ids.extend(other.post_ids)
+        self.created.extend(other.created)
+        self.word_df.update(other.word_df)
+        for field in TEXT_FIELDS:
+            self.texts[field].extend(other.texts[field])
+            other_terms = np.frombuffer(other.span_terms[field], dtype=np.int32)
+            self.span_terms[field].frombytes(
+                renumbered["p_terms"][other_terms].tobytes()
+            )
+            self.span_counts[field].extend(other.span_counts[field])
+            self.span_starts[field].extend(other.span_starts[field])
+            self.span_lens[field].extend(other.span_lens[field])
+        self.docs.extend(other.docs)
+
+
+def _build_segment(posts: list[tuple[str, dict]], params: dict) -> _Segment:
+    segment = _Segment(list(params["weights"]))
+    for pid, post in posts:
+        segment.add(pid, post, params["lang"])
+    return segment
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parallel_segments(posts, params: dict, workers: int):
+    """
+    Segments of ``BUILD_CHUNK`` posts each, in order, built by ``workers``
+    processes. Only a few chunks are read ahead of the merge, so a stream of
+    posts is still never held whole.
+    """
+    chunks = _chunks(posts, BUILD_CHUNK)
+    first = next(chunks, [])
+    second = next(chunks, None)
+    if second is None:
+        # not worth starting processes for
+        yield _build_segment(first, params)
+        return
+
+    # spawned, not forked: a forked web worker would hand its database
+    # connections and threads to the children
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn")
+    ) as pool:
+        pending: deque = deque()
+        for chunk in chain([first, second], chunks):
+            pending.append(pool.submit(_build_segment, chunk, params))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build_snapshot(
+    posts, *, version: int = 0, gaps=(), workers: int = 1, **params
+) -> IndexSnapshot:
+    """
+    Build an in-memory snapshot of ``posts``: a dict of documents by post id
+    (int-like keys), or ``(post id, document)`` pairs in ascending id order,
+    read once, so documents can be streamed from the database without
+    holding them all (their code least of all). ``params`` override
+    ``DEFAULT_PARAMS``. ``version`` is the last change the posts reflect and
+    ``gaps`` the lower change ids not committed yet when they were read.
+
+    With ``workers`` > 1, chunks of posts are tokenized into segments by that
+    many processes and merged in order; the snapshot is the same either way.
+    """
+    started = time.perf_counter()
+    params = {**DEFAULT_PARAMS, **params}
+    fields = list(params["weights"])
+    if isinstance(posts, dict):
+        posts = sorted(posts.items(), key=lambda item: int(item[0]))
+
+    # slots are ordered by post id so lookups can bisect, and every posting
+    # list comes out sorted by slot
+    index = _Segment(fields)
+    if workers > 1:
+        for segment in _parallel_segments(posts, params, workers):
+            index.merge(segment)
+    else:
+        for pid, post in posts:
+            index.add(pid, post, params["lang"])
+
+    term_ids, tag_ids, filter_ids = index.term_ids, index.tag_ids, index.filter_ids
+    post_ids, docs, texts = index.post_ids, index.docs, index.texts
+    n_docs = len(post_ids)
+    lens_np = {f: np.frombuffer(index.lens[f], dtype=np.int32) for f in fields}
+    avg_len = {f: float(lens_np[f].sum()) / n_docs if n_docs else 0.0 for f in fields}
+    coef, denom = _field_norms(lens_np, avg_len, params)
+    # coef[field id, slot]
+    coef = np.array([np.broadcast_to(coef[f], n_docs) for f in fields]).reshape(
+        len(fields), n_docs
+    )
+
+    indptr, slots, field_ids, tfs = _csr(
+        index.p_terms, len(term_ids), index.p_slots, index.p_fields, index.p_tfs
+    )
+    # rows of one (term, slot) pair are adjacent: merge them into a posting
+    rows = tfs * coef[field_ids, slots]
+    first = np.ones(len(slots), dtype=bool)
+    first[1:] = slots[1:] != slots[:-1]
+    first[indptr[1:-1]] = True
+    starts = np.flatnonzero(first)
+    postings = slots[starts]
+    tfn = np.add.reduceat(rows, starts) if len(starts) else rows
+    tfn = (tfn / np.broadcast_to(denom, n_docs)[postings]).astype(np.float32)
+    indptr = np.searchsorted(starts, indptr).astype(np.int64)
+    # every term has at least one posting, so no reduceat segment is empty
+    if len(term_ids):
+        max_tfn = np.maximum.reduceat(tfn, indptr[:-1])
+    else:
+        max_tfn = np.zeros(0, dtype=np.float32)
+    tag_indptr, tag_slots = _csr(index.t_terms, len(tag_ids), index.t_slots)
+    filter_indptr, filter_slots = _csr(index.f_terms, len(filter_ids), index.f_slots)
+    docs_offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in docs], out=docs_offsets[1:])
+
+    arrays = {
+        "terms": list(term_ids),
+        "indptr": indptr,
+        "postings": postings,
+        "tfn": tfn,
+        "max_tfn": max_tfn,
+        "post_ids": np.frombuffer(post_ids, dtype=np.int64),
+        "tag_terms": list(tag_ids),
+        "tag_indptr": tag_indptr,
+        "tag_slots": tag_slots,
+        "filter_terms": list(filter_ids),
+        "filter_indptr": filter_indptr,
+        "filter_slots": filter_slots,
+        "created": np.frombuffer(index.created, dtype=np.int64),
+        "docs": b"".join(docs),
+        "docs_offsets": docs_offsets,
+        **build_spell(index.word_df),
+    }
+    for field in TEXT_FIELDS:
+        arrays[field], arrays[f"{field}_starts"] = _join(texts[field])
+        span_indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(
+            np.frombuffer(index.span_counts[field], dtype=np.int64), out=span_indptr[1:]
+        )
+        arrays[f"{field}_span_indptr"] = span_indptr
+        arrays[f"{field}_span_terms"] = np.frombuffer(
+            index.span_terms[field], dtype=np.int32
+        )
+        arrays[f"{field}_span_starts"] = np.frombuffer(
+            index.span_starts[field], dtype=np.int32
+        )
+        arrays[f"{field}_span_lens"] = np.frombuffer(
+            index.span_lens[field], dtype=np.uint16
+        )
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "gaps": sorted(gaps),
+        "n_docs": n_docs,
+        "avg_len": avg_len,
+        "params": params,
+        # for reports: what each field costs, and how long this took
+        "field_postings": dict(
+            zip(fields, np.bincount(field_ids, minlength=len(fields)).tolist())
+        ),
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+    return IndexSnapshot(meta, arrays)
+
+
+class _Postings:
+    """
+    Ascending slots of one query term (or of the field bonuses) with their
+    score contributions computed on demand, for all of them or only for the
+    positions probed by ``_max_score``. ``upper`` bounds every contribution;
+    ``costly`` lists look documents up one by one and are probed last.
+    """
+
+    costly = False
+
+    def __init__(self, slots: np.ndarray, upper: float, contrib):
+        self.slots = slots
+        self.upper = upper
+        self._contrib = contrib
+
+    def contrib(self, pos=slice(None)) -> np.ndarray:
+        return self._contrib(pos)
+
+    def probe(self, cand: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Mask of ``cand`` (ascending) found here and their contributions."""
+        if not len(self.slots):
+            return np.zeros(len(cand), dtype=bool), np.zeros(0)
+        pos = np.searchsorted(self.slots, cand)
+        pos[pos == len(self.slots)] = 0
+        hit = self.slots[pos] == cand
+        return hit, self.contrib(pos[hit])
+
+
+class _BonusPostings(_Postings):
+    """
+    Tag or phrase bonuses of every layer (``qset`` empty for the phrase
+    bonus, ``query`` empty for the tag bonus: two lists with a bound each).
+    Finding all phrase matches scans every title and description, so it only
+    runs if the list gets merged; probing checks the texts of the given
+    candidates only. With ``within`` (the slots a filtered query is
+    restricted to), merging probes those.
+    """
+
+    def __init__(self, layers, qset: set[str], query: str, within=None):
+        # [(fields, first slot of the layer)], in slot order
+        self._layers = layers
+        self._qset = qset
+        self._query = query
+        self._within = within
+        self._merged: tuple[np.ndarray, np.ndarray] | None = None
+
+        tag_upper = 0.0
+        for fields, _offset in layers:
+            _slots, hit = fields.tag_hits(qset)
+            if len(hit):
+                tag_upper = max(tag_upper, float(_tag_bonus(hit.max())))
+        phrase_upper = TITLE_BONUS if _phrase_query(query) is not None else 0.0
+        self.upper = tag_upper + phrase_upper
+        self.costly = phrase_upper > 0
+
+    def _merge(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._merged is None and self._within is not None:
+            hit, bonus = self.probe(self._within)
+            self._merged = self._within[hit], bonus
+        if self._merged is None:
+            slots, bonus = [], []
+            for fields, offset in self._layers:
+                s, v = _bonuses(fields, self._qset, self._query)
+                slots.append(offset + s)
+                bonus.append(v)
+            # a slot may get both a tag and a phrase bonus
+            merged, inverse = np.unique(np.concatenate(slots), return_inverse=True)
+            self._merged = merged, np.bincount(
+                inverse, weights=np.concatenate(bonus), minlength=len(merged)
+            )
+        return self._merged
+
+    @property
+    def slots(self) -> np.ndarray:
+        return self._merge()[0]
+
+    def contrib(self, pos=slice(None)) -> np.ndarray:
+        return self._merge()[1][pos]
+
+    def probe(self, cand: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        bonus = np.zeros(len(cand), dtype=np.float64)
+        bounds = [offset for _fields, offset in self._layers[1:]] + [None]
+        for (fields, offset), end in zip(self._layers, bounds):
+            lo = np.searchsorted(cand, offset)
+            hi = len(cand) if end is None else np.searchsorted(cand, end)
+            if hi > lo:
+                bonus[lo:hi] = _bonuses_of(
+                    fields, cand[lo:hi] - offset, self._qset, self._query
+                )
+        hit = bonus > 0
+        return hit, bonus[hit]
+
+
+def _term_postings(slots, tfn, offset, scale, max_tfn, k1) -> _Postings:
+    """
+    BM25 postings of one term in one layer, shifted by ``offset`` into the
+    slot space of the whole index.
+    """
+
+    def contrib(pos):
+        t = tfn[pos].astype(np.float64)
+        return scale * t / (k1 + t)
+
+    upper = scale * max_tfn / (k1 + max_tfn)
+    return _Postings(offset + slots if offset else slots, upper, contrib)
+
+
+# slack for bounds compared with sums accumulated in another order
+_EPS = 1e-9
+
+
+def _kth_best(scores: np.ndarray, k: int) -> float:
+    if len(scores) < k:
+        return -math.inf
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+
+def _max_score(
+    lists: list[_Postings],
+    k: int,
+    alive,
+    *,
+    prune: bool = True,
+    candidates: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact scores of every document that can be in the top ``k`` (MaxScore).
+
+    Lists are merged in decreasing order of their upper bound, keeping the
+    k-th best partial score as a threshold: partial scores only grow, so no
+    document can finish below it. Once the bounds of the remaining lists add
+    up to less than the threshold, a document missing from every merged list
+    cannot reach the top ``k``. The remaining (typically the most common,
+    lowest idf) terms are then never scored in full: only candidates whose
+    partial score plus the remaining bounds still reaches the threshold are
+    looked up in them by binary search. Costly lists (the phrase bonus, which
+    reads texts one by one) come last, so they see the fewest candidates.
+
+    ``candidates`` (ascending slots, e.g. the documents passing the query's
+    filters) bounds the documents that can match at all: once the next list
+    is longer than that set, it becomes the candidates instead, so a filtered
+    query never merges more postings than it has documents to score.
+    """
+    lists = sorted(lists, key=lambda p: (p.costly, -p.upper))
+    # rest[i]: the most that lists[i:] can add to a document
+    rest = np.cumsum([p.upper for p in lists][::-1])[::-1] * (1.0 + _EPS)
+
+    cand = np.zeros(0, dtype=np.int64)
+    scores = np.zeros(0, dtype=np.float64)
+    threshold = -math.inf
+    merged = 0
+    for p in lists:
+        if prune and rest[merged] < threshold:
+            break
+        if candidates is not None and (p.costly or len(p.slots) > len(candidates)):
+            # documents missing from every merged list join with score 0
+            matched = cand
+            cand = candidates[alive(candidates)]
+            partial = scores
+            scores = np.zeros(len(cand), dtype=np.float64)
+            scores[np.searchsorted(cand, matched)] = partial
+            break
+        slots = p.slots.astype(np.int64)
+        contrib = p.contrib()
+        keep = alive(slots)
+        slots, contrib = slots[keep], contrib[keep]
+        if not len(cand):
+            cand, scores = slots, contrib
+        else:
+            cand, inverse = np.unique(
+                np.concatenate((cand, slots)), return_inverse=True
+            )
+            scores = np.bincount(inverse, weights=np.concatenate((scores, contrib)))
+        threshold = _kth_best(scores, k)
+        merged += 1
+
+    for i in range(merged, len(lists)):
+        if prune:
+            keep = scores + rest[i] >= threshold
+            cand, scores = cand[keep], scores[keep]
+        hit, contrib = lists[i].probe(cand)
+        scores[hit] += contrib
+        threshold = _kth_best(scores, k)
+
+    # candidates that matched nothing
+    keep = scores > 0
+    return cand[keep], scores[keep]
+
+
+def _member(sorted_slots: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """Mask of ``slots`` found in the ascending ``sorted_slots``."""
+    if not len(sorted_slots):
+        return np.zeros(len(slots), dtype=bool)
+    pos = np.searchsorted(sorted_slots, slots)
+    pos[pos == len(sorted_slots)] = 0
+    return sorted_slots[pos] == slots
+
+
+def _intersect(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Intersection of two ascending slot arrays, in time linear in the smaller
+    one only: a selective filter stays cheap however common the other is.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    return a[_member(b, a)]
+
+
+def _union(arrays: list[np.ndarray]) -> np.ndarray:
+    """Union of ascending slot arrays."""
+    if not arrays:
+        return np.zeros(0, dtype=np.int64)
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
+
+
+def _rank(cand: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the top ``k`` by score, then by ascending slot."""
+    if len(scores) > k:
+        # argpartition alone would pick arbitrarily among ties with the k-th
+        keep = np.flatnonzero(scores >= -np.partition(-scores, k - 1)[k - 1])
+    else:
+        keep = np.arange(len(scores))
+    order = np.lexsort((cand[keep], -scores[keep]))
+    return keep[order[:k]]
+
+
+class SearchIndex:
+    """
+    BM25 index: an immutable ``base`` snapshot plus a mutable layer.
+
+    The mutable layer keeps ``term -> {slot: tfn}`` postings for documents
+    added after the snapshot, and tombstones for base documents removed or
+    replaced since. Its slots are numbered after the base slots and freed
+    slots are reused. Its documents are length-normalized with the average
+    field lengths of the base, so their postings never change after adding.
+
+    idf uses the Lucene form ``log(1 + (N - df + 0.5) / (df + 0.5))``, which is
+    always positive. rank_bm25 floors negative idf with a corpus-wide average,
+    which would have to be recomputed over the whole vocabulary on every write.
+    N is exact, but document frequencies still count tombstoned base
+    documents until the next snapshot (as Lucene does until segments merge).
+    """
+
+    def __init__(self, base: IndexSnapshot | None = None):
+        if base is None:
+            base = build_snapshot({})
+        self.base = base
+        # scoring must match the parameters the base was built with
+        self.params = base.meta["params"]
+        self.lang = self.params["lang"]
+        self.k1 = self.params["k1"]
+        self._avg_len = base.meta["avg_len"]
+
+        self._base_n = len(base)
+        self._deleted = np.zeros(self._base_n, dtype=bool)
+        self._n_deleted = 0
+
+        self.ids: list[str | None] = []
+        self.posts: list[dict | None] = []
+        self.fields = FieldMatcher()
+
+        self._slots: dict[str, int] = {}
+        self._free: list[int] = []
+        # term -> {slot: normalized term frequency}
+        self._postings: dict[str, dict[int, float]] = {}
+        # slot -> terms, needed to undo a document on removal
+        self._doc_terms: list[list[str] | None] = []
+        # filter key ("lang:rust") -> slots, and slot -> its filter keys
+        self._filters: dict[str, set[int]] = {}
+        self._doc_filters: list[set[str] | None] = []
+        # spelling vocabulary of the mutable layer, and slot -> its words
+        self._spell = SpellDelta()
+        self._doc_words: list[set[str] | None] = []
+        # slot -> title and description words with their offsets (highlights)
+        self._doc_spans: list[dict | None] = []
+
+    def __len__(self) -> int:
+        return len(self._slots) + self._base_n - self._n_deleted
+
+    def __contains__(self, pid: str) -> bool:
+        return pid in self._slots or self._base_slot(pid) is not None
+
+    @property
+    def delta_size(self) -> int:
+        """Documents held in the mutable layer (added or tombstoned)."""
+        return len(self._slots) + self._n_deleted
+
+    def _base_slot(self, pid: str) -> int | None:
+        slot = self.base.slot_of(pid)
+        if slot is None or self._deleted[slot]:
+            return None
+        return slot
+
+    def _take_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+
+        slot = len(self.ids)
+        self.ids.append(None)
+        self.posts.append(None)
+        self._doc_terms.append(None)
+        self._doc_filters.append(None)
+        self._doc_words.append(None)
+        self._doc_spans.append(None)
+        return slot
+
+    def add(self, pid: str, post: dict) -> bool:
+        """
+        Insert or replace a document. Returns False if it has no indexable
+        tokens (it is then absent from the index, as in a full build).
+        """
+        self.remove(pid)
+
+        weights = self.params["weights"]
+        spans = _text_spans(post, self.lang)
+        tokens = _field_tokens(post, self.lang, weights, spans)
+        if not any(tokens[f] for f in weights):
+            return False
+
+        coef, denom = _field_norms(
+            {f: len(tokens[f]) for f in weights}, self._avg_len, self.params
+        )
+        tfn: dict[str, float] = {}
+        for f in weights:
+            for t, tf in Counter(tokens[f]).items():
+                tfn[t] = tfn.get(t, 0.0) + tf * coef[f]
+        terms = list(tfn)
+
+        slot = self._take_slot()
+        self.ids[slot] = pid
+        self.posts[slot] = _stored(post)
+        self.fields.set(
+            slot,
+            post.get("title", "") or "",
+            post.get("description", "") or "",
+            set(tokens["tags"]),
+        )
+        self._doc_terms[slot] = terms
+        self._doc_filters[slot] = filter_keys(post)
+        self._slots[pid] = slot
+        for key in self._doc_filters[slot]:
+            self._filters.setdefault(key, set()).add(slot)
+        self._doc_words[slot] = _doc_words(tokens)
+        self._spell.add(self._doc_words[slot])
+        self._doc_spans[slot] = spans
+
+        for t, value in tfn.items():
+            self._postings.setdefault(t, {})[slot] = value / denom
+        return True
+
+    def remove(self, pid: str) -> bool:
+        """Drop a document if present. Returns whether anything was removed."""
+        slot = self._slots.pop(pid, None)
+        if slot is None:
+            base_slot = self._base_slot(pid)
+            if base_slot is None:
+                return False
+            self._deleted[base_slot] = True
+            self._n_deleted += 1
+            return True
+
+        for t in self._doc_terms[slot]:
+            posting = self._postings[t]
+            del posting[slot]
+            if not posting:
+                del self._postings[t]
+        for key in self._doc_filters[slot]:
+            slots = self._filters[key]
+            slots.discard(slot)
+            if not slots:
+                del self._filters[key]
+        self._spell.remove(self._doc_words[slot])
+
+        self.ids[slot] = None
+        self.posts[slot] = None
+        self.fields.clear(slot)
+        self._doc_terms[slot] = None
+        self._doc_filters[slot] = None
+        self._doc_words[slot] = None
+        self._doc_spans[slot] = None
+        self._free.append(slot)
+        return True
+
+    def _query_postings(self, q_tokens: list[str]) -> list[_Postings]:
+        """
+        Postings of every distinct query term, base and mutable layers apart;
+        mutable slots are offset by the base size.
+        """
+        n_docs = len(self)
+        k1 = self.k1
+        base_n = self._base_n
+        lists = []
+        # a repeated query term counts once per occurrence
+        for q, count in Counter(q_tokens).items():
+            posting = self._postings.get(q)
+            base_posting = self.base.postings(q)
+            df = len(posting) if posting else 0
+            if base_posting is not None:
+                df += len(base_posting[0])
+            if not df:
+                continue
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            scale = count * idf * (k1 + 1.0)
+
+            if base_posting is not None:
+                slots, tfn, max_tfn = base_posting
+                lists.append(_term_postings(slots, tfn, 0, scale, max_tfn, k1))
+            if posting:
+                n = len(posting)
+                slots = np.fromiter(sorted(posting), dtype=np.int64, count=n)
+                tfn = np.fromiter(
+                    (posting[s] for s in slots), dtype=np.float64, count=n
+                )
+                lists.append(
+                    _term_postings(slots, tfn, base_n, scale, float(tfn.max()), k1)
+                )
+        return lists
+
+    def _corrections(self, q_tokens: list[str]) -> dict[str, list[str]]:
+        """
+        Nearest vocabulary words of every query word with no postings, best
+        first: all those at the smallest edit distance, up to
+        ``MAX_EXPANSIONS``.
+        """
+        found = {}
+        sources = (self.base.spell, self._spell)
+        for word in dict.fromkeys(_words(q_tokens)):
+            if not is_word(word) or word in self._postings:
+                continue
+            if self.base.postings(word) is not None:
+                continue
+            nearest = corrections(word, sources)
+            if nearest:
+                best = [t for t, d, _df in nearest if d == nearest[0][1]]
+                found[word] = best[:MAX_EXPANSIONS]
+        return found
+
+    def _expand(self, q_tokens: list[str]) -> list[str]:
+        """``q_tokens`` plus the corrections of its unknown words."""
+        extra = [t for terms in self._corrections(q_tokens).values() for t in terms]
+        return q_tokens + extra
+
+    def suggest(self, query: str) -> str | None:
+        """
+        ``query`` with its unknown words replaced by their nearest vocabulary
+        word ("did you mean"), or None if every word is known or has none.
+        """
+        parsed = parse_query(query)
+        text = parsed.text if parsed.has_operators else query
+        found = self._corrections(tokenize(text, lang=self.lang))
+        if not found:
+            return None
+
+        def fix(word):
+            tokens = tokenize(word, lang=self.lang)
+            if len(tokens) == 1 and tokens[0] in found:
+                return found[tokens[0]][0]
+            return word
+
+        suggestion = rewrite_words(query, fix)
+        return suggestion if suggestion != query else None
+
+    def snippets(self, query: str, pids, width: int = SNIPPET_CHARS) -> dict:
+        """
+        ``{pid: {"title": segments, "description": segments}}`` for the
+        documents ``pids`` of the results of ``query``: the title with the
+        words it matched marked, and an excerpt of the description around its
+        best matches (``search_snippet``), from the stored word offsets.
+        """
+        parsed = parse_query(query)
+        text = parsed.text if parsed.has_operators else query
+        wanted = set(self._expand(tokenize(text, lang=self.lang)))
+        # a query word may be the joined bigram of two document words
+        # ("timsort" of "Tim Sort"); halves of one letter are not tried
+        splits = [(t[:k], t[k:]) for t in wanted for k in range(2, len(t) - 1)]
+
+        base_pairs: dict[int, set[int]] = {}
+        delta_pairs: dict[str, set[str]] = {}
+        for first, second in splits:
+            a, b = self.base.term_id(first), self.base.term_id(second)
+            if a is not None and b is not None:
+                base_pairs.setdefault(a, set()).add(b)
+            if first in self._postings and second in self._postings:
+                delta_pairs.setdefault(first, set()).add(second)
+        base_wanted = set(map(self.base.term_id, wanted)) - {None}
+
+        found = {}
+        for pid in pids:
+            slot = self._base_slot(pid)
+            if slot is not None:
+                post = self.base.doc(slot)
+                spans = {}
+                for f in TEXT_FIELDS:
+                    terms, starts, lens = self.base.spans(slot, f)
+                    spans[f] = terms.tolist(), starts.tolist(), lens.tolist()
+                q_terms, q_pairs = base_wanted, base_pairs
+            elif pid in self._slots:
+                slot = self._slots[pid]
+                post = self.posts[slot]
+                spans = {}
+                for f, words in self._doc_spans[slot].items():
+                    spans[f] = (
+                        [w for w, _a, _b in words],
+                        [a for _w, a, _b in words],
+                        [b - a for _w, a, b in words],
+                    )
+                q_terms, q_pairs = wanted, delta_pairs
+            else:
+                continue
+
+            terms, starts, lens = spans["title"]
+            hits = matches(terms, q_terms, q_pairs)
+            title = highlight(post.get("title", "") or "", starts, lens, hits)
+            terms, starts, lens = spans["description"]
+            hits = matches(terms, q_terms, q_pairs)
+            description = snippet(
+                post.get("description", "") or "", terms, starts, lens, hits, width
+            )
+            found[pid] = {"title": title, "description": description}
+        return found
+
+    def _alive(self, slots: np.ndarray) -> np.ndarray:
+        """Mask of ``slots`` that are not tombstoned base documents."""
+        if not self._n_deleted:
+            return np.ones(len(slots), dtype=bool)
+        alive = np.ones(len(slots), dtype=bool)
+        in_base = slots < self._base_n
+        alive[in_base] = ~self._deleted[slots[in_base]]
+        return alive
+
+    def _pid(self, i: int) -> str:
+        if i < self._base_n:
+            return self.base.pid(i)
+        return self.ids[i - self._base_n]
+
+    def _post(self, i: int) -> dict:
+        if i < self._base_n:
+            return self.base.doc(i)
+        return self.posts[i - self._base_n]
+
+    def _delta_slots(self, slots) -> np.ndarray:
+        n = len(slots)
+        return self._base_n + np.fromiter(sorted(slots), dtype=np.int64, count=n)
+
+    def _created(self, slots: np.ndarray) -> np.ndarray:
+        """Creation times (Unix seconds) of ``slots``."""
+        in_base = slots < self._base_n
+        created = np.empty(len(slots), dtype=np.int64)
+        created[in_base] = self.base.created[slots[in_base]]
+        created[~in_base] = [
+            int(self.posts[s - self._base_n].get("created") or 0)
+            for s in slots[~in_base]
+        ]
+        return created
+
+    def _age_slots(self, value: str) -> np.ndarray:
+        """Ascending slots of the documents created within age ``value``."""
+        seconds = AGE_BUCKETS.get(value)
+        if seconds is None:
+            return np.zeros(0, dtype=np.int64)
+        cutoff = time.time() - seconds
+        slots = np.flatnonzero(self.base.created >= cutoff)
+        delta = [
+            slot
+            for slot, post in enumerate(self.posts)
+            if post is not None and int(post.get("created") or 0) >= cutoff
+        ]
+        if delta:
+            slots = np.concatenate((slots, self._base_n + np.array(delta)))
+        return slots
+
+    def _filter_keys(self, field: str) -> list[str]:
+        """Filter keys of ``field`` in either layer."""
+        keys = dict.fromkeys(self.base.filter_terms(field))
+        prefix = f"{field}:"
+        keys.update((k, None) for k in self._filters if k.startswith(prefix))
+        return list(keys)
+
+    def _filter_slots(self, key: str) -> np.ndarray:
+        """Ascending slots of the documents matching filter ``key``."""
+        field, value = key.split(":", 1)
+        if field == "age":
+            return self._age_slots(value)
+        slots = self.base.filter_slots(key).astype(np.int64)
+        delta = self._filters.get(key)
+        if delta:
+            slots = np.concatenate((slots, self._delta_slots(delta)))
+        return slots
+
+    def _word_slots(self, word: str) -> np.ndarray:
+        """Ascending slots of the documents containing every token of ``word``."""
+        result = None
+        for tok in set(tokenize(word, lang=self.lang)):
+            base_posting = self.base.postings(tok)
+            slots = np.zeros(0, dtype=np.int64)
+            if base_posting is not None:
+                slots = base_posting[0].astype(np.int64)
+            posting = self._postings.get(tok)
+            if posting:
+                slots = np.concatenate((slots, self._delta_slots(posting)))
+            result = slots if result is None else _intersect(result, slots)
+        return result if result is not None else np.zeros(0, dtype=np.int64)
+
+    def _phrase_slots(self, phrase: str, within: np.ndarray | None = None):
+        """
+        Ascending slots whose normalized title or description contains
+        ``phrase``. Given ``within``, only those documents are checked instead
+        of scanning every text.
+        """
+        q_norm = _phrase_query(" ".join(phrase.split()))
+        if q_norm is None:
+            return np.zeros(0, dtype=np.int64)
+        hits = []
+        layers = [
+            (self.base.fields, 0, self._base_n),
+            (self.fields, self._base_n, None),
+        ]
+        for fields, offset, end in layers:
+            if within is None:
+                for field in TEXT_FIELDS:
+                    hits.append(offset + fields.phrase_hits(q_norm, field))
+                continue
+            lo = np.searchsorted(within, offset)
+            hi = len(within) if end is None else np.searchsorted(within, end)
+            slots = within[lo:hi] - offset
+            found = fields.contains(slots, q_norm, "title")
+            rest = np.flatnonzero(~found)
+            found[rest] = fields.contains(slots[rest], q_norm, "description")
+            hits.append(offset + slots[found])
+        return _union(hits)
+
+    def _clause_slots(self, clause, within: np.ndarray | None = None) -> np.ndarray:
+        if clause.kind == "filter":
+            return self._filter_slots(clause.key)
+        if clause.kind == "phrase":
+            return self._phrase_slots(clause.value, within)
+        return self._word_slots(clause.value)
+
+    def _required_slots(self, parsed: ParsedQuery) -> np.ndarray | None:
+        """
+        Ascending slots satisfying every required group of ``parsed``, or None
+        if it has none. Groups without phrases are intersected first, smallest
+        first; phrases are then only looked for in what is left.
+        """
+        groups = parsed.required
+        if not groups:
+            return None
+
+        def has_phrase(group):
+            return any(c.kind == "phrase" for c in group)
+
+        sets = sorted(
+            (
+                _union([self._clause_slots(c) for c in g])
+                for g in groups
+                if not has_phrase(g)
+            ),
+            key=len,
+        )
+        allowed = None
+        for slots in sets:
+            allowed = slots if allowed is None else _intersect(allowed, slots)
+        for group in filter(has_phrase, groups):
+            slots = _union([self._clause_slots(c, allowed) for c in group])
+            allowed = slots if allowed is None else _intersect(allowed, slots)
+        return allowed
+
+    def _newest(self, cand: np.ndarray, k: int) -> np.ndarray:
+        """Positions of the ``k`` highest post ids (newest posts) of ``cand``."""
+        in_base = cand < self._base_n
+        pids = np.empty(len(cand), dtype=np.int64)
+        pids[in_base] = self.base.post_ids[cand[in_base]]
+        pids[~in_base] = [int(self.ids[s - self._base_n]) for s in cand[~in_base]]
+        if len(pids) > k:
+            keep = np.argpartition(-pids, k - 1)[:k]
+        else:
+            keep = np.arange(len(pids))
+        return keep[np.argsort(-pids[keep])]
+
+    def _restrict(self, parsed: ParsedQuery):
+        """
+        ``(allowed, alive)`` for ``parsed``: the slots its required groups
+        leave (None if unrestricted) and a mask function over slots that
+        also drops tombstones and exclusions.
+        """
+        allowed = self._required_slots(parsed)
+        excluded = _union([self._clause_slots(c, allowed) for c in parsed.excluded])
+
+        def alive(slots):
+            mask = self._alive(slots)
+            if allowed is not None:
+                mask &= _member(allowed, slots)
+            if len(excluded):
+                mask &= ~_member(excluded, slots)
+            return mask
+
+        return allowed, alive
+
+    def _top_k(self, q_tokens, text, allowed, alive, top_k, detailed, prune):
+        if not q_tokens:
+            cand = allowed[alive(allowed)]
+            scores = np.zeros(len(cand), dtype=np.float64)
+            order = self._newest(cand, top_k)
+        else:
+            lists = self._query_postings(q_tokens)
+            layers = [(self.base.fields, 0), (self.fields, self._base_n)]
+            lists.append(_BonusPostings(layers, set(q_tokens), ""))
+            lists.append(_BonusPostings(layers, set(), text, allowed))
+            cand, scores = _max_score(
+                lists, top_k, alive, prune=prune, candidates=allowed
+            )
+            order = _rank(cand, scores, top_k)
+
+        if detailed:
+            return [
+                (self._pid(cand[i]), self._post(cand[i]), float(scores[i]))
+                for i in order
+            ]
+        return [(self._pid(cand[i]), float(scores[i])) for i in order]
+
+    def search(
+        self,
+        query: str,
+        *,
+        top_k: int = 10,
+        detailed: bool = False,
+        prune: bool = True,
+    ):
+        """
+        Same ranking and return shape as ``search_engine.search``; equal
+        scores are ranked by ascending slot. ``prune=False`` scores every
+        matching document (the reference for ``_max_score``).
+
+        ``query`` may use the ``search_query`` language. Filters, phrases and
+        exclusions become sets of slots before anything is scored, and a
+        query term with more postings than the documents left is looked up
+        for those documents only. Filters alone list the newest matching
+        posts, scored 0. Words with no postings also rank by their nearest
+        vocabulary words (``suggest``).
+        """
+        parsed = parse_query(query)
+        # without operators the raw text ranks, phrase bonus included
+        text = parsed.text if parsed.has_operators else query
+        q_tokens = self._expand(tokenize(text, lang=self.lang))
+        if not len(self) or top_k <= 0 or not (q_tokens or parsed.required):
+            return []
+
+        allowed, alive = self._restrict(parsed)
+        return self._top_k(q_tokens, text, allowed, alive, top_k, detailed, prune)
+
+    def search_facets(
+        self,
+        query: str,
+        *,
+        top_k: int = 10,
+        facets=FACET_FIELDS,
+        detailed: bool = False,
+    ):
+        """
+        ``(search results, counts)``: the top ``top_k`` as ``search`` ranks
+        them, and for every field of ``facets`` the ``(value, posts)`` pairs
+        of the documents matching ``query``, most posts first. ``age``
+        counts are cumulative, in ``AGE_BUCKETS`` order.
+
+        Both come from one resolution of the query's filters. A document
+        matches if it passes them and, when the query has words, contains
+        one; a post ranked only for containing the query text inside a
+        longer word is not counted.
+        """
+        parsed = parse_query(query)
+        text = parsed.text if parsed.has_operators else query
+        q_tokens = self._expand(tokenize(text, lang=self.lang))
+        if not len(self) or not (q_tokens or parsed.required):
+            return [], {field: [] for field in facets}
+
+        allowed, alive = self._restrict(parsed)
+        results = []
+        if top_k > 0:
+            results = self._top_k(q_tokens, text, allowed, alive, top_k, detailed, True)
+        matched = self._matched(q_tokens, allowed, alive)
+        return results, self._facet_counts(matched, facets)
+
+    def _matched(self, q_tokens, allowed, alive) -> np.ndarray:
+        """Ascending slots of every document the query matches."""
+        if not q_tokens:
+            return allowed[alive(allowed)]
+        # bitset of the documents holding any query term
+        hit = np.zeros(self._base_n + len(self.ids), dtype=bool)
+        for tok in set(q_tokens):
+            base_posting = self.base.postings(tok)
+            if base_posting is not None:
+                hit[base_posting[0]] = True
+            posting = self._postings.get(tok)
+            if posting:
+                hit[self._delta_slots(posting)] = True
+        slots = np.flatnonzero(hit) if allowed is None else allowed[hit[allowed]]
+        return slots[alive(slots)]
+
+    def _facet_counts(self, matched: np.ndarray, facets) -> dict:
+        counts: dict[str, list[tuple[str, int]]] = {}
+        hit = None
+        for field in facets:
+            if field == "age":
+                created = self._created(matched)
+                now = time.time()
+                counts[field] = [
+                    (value, int(np.count_nonzero(created >= now - seconds)))
+                    for value, seconds in AGE_BUCKETS.items()
+                ]
+                continue
+
+            values = []
+            for key in self._filter_keys(field):
+                slots = self._filter_slots(key)
+                if len(matched) * 16 < len(slots):
+                    # a few matches: look them up instead of reading the list
+                    n = np.count_nonzero(_member(slots, matched))
+                else:
+                    if hit is None:
+                        hit = np.zeros(self._base_n + len(self.ids), dtype=bool)
+                        hit[matched] = True
+                    n = np.count_nonzero(hit[slots])
+                if n:
+                    values.append((key.split(":", 1)[1], int(n)))
+            counts[field] = sorted(values, key=lambda v: (-v[1], v[0]))
+        return counts
+
+
+# --- engine interface, same signatures as search_engine ---
+
+
+def build_index(
+    posts_by_id: dict, *, lang: str = "en", title_weight: int = 3, tag_weight: int = 4
+):
+    weights = {"title": title_weight, "description": 1, "tags": tag_weight}
+    index = SearchIndex(build_snapshot(posts_by_id, lang=lang, weights=weights))
+    ids = [index.base.pid(i) for i in range(len(index.base))]
+    posts = [posts_by_id[pid] for pid in ids]
+    # tag postings live inside the index
+    tag_sets: list[set[str]] = []
+    return ids, posts, tag_sets, index
+
+
+def search(
+    query: str,
+    ids,
+    posts,
+    tag_sets,
+    bm25,
+    *,
+    lang: str = "en",
+    top_k: int = 10,
+    detailed: bool = False,
+):
+    if bm25 is None:
+        return []
+    return bm25.search(query, top_k=top_k, detailed=detailed)
@@ -0,0 +1,215 @@
+"""
+PostgreSQL full-text search backend.
+
+Posts carry a generated, GIN-indexed ``search_vector`` column (migration
+``c3d51a7e8b20``): title weighted A, tags B and description C. A query
+matches posts sharing any of its words, like the BM25 engines, and is ranked
+with ``ts_rank_cd``. Nothing is held in Python memory, and every worker sees
+writes as soon as they are committed.
+
+Queries using the ``search_query`` language become SQL conditions: filters
+on the post columns, phrases with ``phraseto_tsquery`` (adjacent words
+rather than a substring of the text) and exclusions with ``NOT``. Facet
+counts (``facets``) group the same matching posts in one statement.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app import db
+from app.main.search_query import AGE_BUCKETS, ParsedQuery, parse_query
+
+TS_CONFIG = "english"
+
+# Same expression as the migration; kept here for benchmarks and tooling
+SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(tags, '')), 'B') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'C')"
+)
+
+
+def search_sql(table: str = "posts"):
+    # plainto_tsquery ANDs the words; OR them so any word matches.
+    # ts_rank_cd normalization 1 divides by 1 + log(document length).
+    return text(
+        f"""
+        WITH q AS (
+            SELECT replace(
+                plainto_tsquery('{TS_CONFIG}', :query)::text, '&', '|'
+            )::tsquery AS query
+        )
+        SELECT p.id, ts_rank_cd(p.search_vector, q.query, 1) AS rank
+        FROM {table} AS p, q
+        WHERE p.visibility = 'public' AND p.search_vector @@ q.query
+        ORDER BY rank DESC, p.id
+        LIMIT :limit
+        """
+    )
+
+
+def _clause_sql(clause, name: str, params: dict) -> str:
+    """Condition on ``p`` matching one clause, its value bound as ``name``."""
+    if clause.kind == "word":
+        params[name] = clause.value
+        return f"p.search_vector @@ plainto_tsquery('{TS_CONFIG}', :{name})"
+    if clause.kind == "phrase":
+        params[name] = clause.value
+        return f"p.search_vector @@ phraseto_tsquery('{TS_CONFIG}', :{name})"
+
+    params[name] = clause.key.split(":", 1)[1]
+    if clause.field == "age":
+        # created_at is naive UTC
+        params[name] = AGE_BUCKETS.get(params[name], -1)
+        return (
+            f"(:{name} >= 0 AND p.created_at >= "
+            f"(now() AT TIME ZONE 'utc') - make_interval(secs => :{name}))"
+        )
+    if clause.field == "type":
+        # only posts are in this table
+        return f":{name} = 'post'"
+    if clause.field == "difficulty":
+        # battles only
+        return "FALSE"
+    if clause.field == "lang":
+        return f"lower(p.language) = :{name}"
+    if clause.field == "user":
+        return f"p.user_id IN (SELECT id FROM users WHERE lower(username) = :{name})"
+    # comma-separated columns: "python, flask"
+    column = "p.tags" if clause.field == "tag" else "p.feedback_type"
+    return (
+        f"EXISTS (SELECT 1 FROM unnest(string_to_array(lower({column}), ',')) "
+        f"AS v WHERE trim(v) = :{name})"
+    )
+
+
+def _conditions(parsed: ParsedQuery, params: dict) -> str:
+    """WHERE clause on ``p`` for the filters, phrases and exclusions."""
+    where = ["p.visibility = 'public'"]
+    for i, group in enumerate(parsed.required):
+        conditions = [_clause_sql(c, f"r{i}_{j}", params) for j, c in enumerate(group)]
+        where.append("(" + " OR ".join(conditions) + ")")
+    for i, clause in enumerate(parsed.excluded):
+        where.append(f"NOT ({_clause_sql(clause, f'x{i}', params)})")
+    return " AND ".join(where)
+
+
+def query_sql(parsed: ParsedQuery, table: str = "posts"):
+    """``(statement, params)`` for a query with operators; ``limit`` unbound."""
+    params: dict = {}
+    conditions = _conditions(parsed, params)
+
+    if not parsed.text.strip():
+        # filters only: newest posts first
+        return (
+            text(
+                f"""
+                SELECT p.id, 0.0 AS rank
+                FROM {table} AS p
+                WHERE {conditions}
+                ORDER BY p.id DESC
+                LIMIT :limit
+                """
+            ),
+            params,
+        )
+
+    params["query"] = parsed.text
+    return (
+        text(
+            f"""
+            WITH q AS (
+                SELECT replace(
+                    plainto_tsquery('{TS_CONFIG}', :query)::text, '&', '|'
+                )::tsquery AS query
+            )
+            SELECT p.id, ts_rank_cd(p.search_vector, q.query, 1) AS rank
+            FROM {table} AS p, q
+            WHERE {conditions} AND p.search_vector @@ q.query
+            ORDER BY rank DESC, p.id
+            LIMIT :limit
+            """
+        ),
+        params,
+    )
+
+
+def is_available() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def search(query: str, limit: int, table: str = "posts") -> list[tuple[int, float]]:
+    """``(post id, rank)`` of the best public posts for ``query``."""
+    parsed = parse_query(query)
+    if not parsed.has_operators:
+        sql, params = search_sql(table), {"query": query}
+    elif parsed.text.strip() or parsed.required:
+        sql, params = query_sql(parsed, table)
+    else:
+        # exclusions alone leave nothing to rank
+        return []
+    rows = db.session.execute(sql, {**params, "limit": limit})
+    return [(row.id, float(row.rank)) for row in rows]
+
+
+def facets_sql(parsed: ParsedQuery, query: str, table: str = "posts"):
+    """
+    ``(statement, params)`` counting the posts ``query`` matches by language,
+    feedback type and age; rows are ``(field, value, n)``.
+    """
+    params: dict = {}
+    if parsed.has_operators:
+        conditions = _conditions(parsed, params)
+        query = parsed.text
+    else:
+        conditions = "p.visibility = 'public'"
+    if query.strip():
+        params["query"] = query
+        conditions += (
+            f" AND p.search_vector @@ replace("
+            f"plainto_tsquery('{TS_CONFIG}', :query)::text, '&', '|')::tsquery"
+        )
+    buckets = ", ".join(f"('{value}', {secs})" for value, secs in AGE_BUCKETS.items())
+    return (
+        text(
+            f"""
+            WITH m AS (
+                SELECT p.language, p.feedback_type, p.created_at
+                FROM {table} AS p
+                WHERE {conditions}
+            )
+            SELECT 'lang' AS field, lower(m.language) AS value, count(*) AS n
+            FROM m GROUP BY 2
+            UNION ALL
+            SELECT 'feedback', trim(v), count(*)
+            FROM m, unnest(string_to_array(lower(m.feedback_type), ',')) AS v
+            WHERE trim(v) <> '' GROUP BY 2
+            UNION ALL
+            SELECT 'age', b.value, count(m.created_at)
+            FROM (VALUES {buckets}) AS b (value, secs)
+            LEFT JOIN m ON m.created_at >=
+                (now() AT TIME ZONE 'utc') - make_interval(secs => b.secs)
+            GROUP BY 2
+            """
+        ),
+        params,
+    )
+
+
+def facets(query: str, table: str = "posts") -> dict:
+    """Facet counts in the shape of ``SearchIndex.search_facets``."""
+    parsed = parse_query(query)
+    if parsed.has_operators and not (parsed.text.strip() or parsed.required):
+        return {}
+    sql, params = facets_sql(parsed, query, table)
+    counts: dict[str, dict[str, int]] = {"lang": {}, "feedback": {}, "age": {}}
+    for row in db.session.execute(sql, params):
+        counts[row.field][row.value] = row.n
+    result = {
+        field: sorted(values.items(), key=lambda v: (-v[1], v[0]))
+        for field, values in counts.items()
+        if field != "age"
+    }
+    result["age"] = [(value, counts["age"].get(value, 0)) for value in AGE_BUCKETS]
+    return result
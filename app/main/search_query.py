@@ -0,0 +1,231 @@
+"""
+Search query language.
+
+    rust async            posts matching any of the words, best first
+    "borrow checker"      posts whose title or description has the phrase
+    -unsafe  -"todo app"  posts without the word / phrase
+    lang:rust             field filters: lang, tag, user, feedback, difficulty
+    type:battle           battles instead of posts (type:post OR type:battle
+                          for both)
+    age:week              posted within the last day, week, month or year
+    -tag:homework         excluded filter
+    "x y" OR lang:go      either side, when neither is optional on its own
+
+Words are optional and only rank, as before; phrases and filters are
+required. ``OR`` (upper case) joins its neighbours into one requirement that
+any of them satisfies. A query without operators parses to its words only,
+so it ranks exactly as the plain text does.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from app.main.search_engine import TOKEN_RE, _tags_to_list
+
+FILTER_FIELDS = ("type", "lang", "tag", "user", "feedback", "difficulty", "age")
+
+# fields the search page counts matching documents by
+FACET_FIELDS = ("type", "lang", "difficulty", "feedback", "age")
+
+# kinds of documents searched, by their ``type:`` value
+DOC_TYPES = ("post", "battle")
+# what a query without a type: filter searches
+DEFAULT_TYPES = ("post",)
+
+# age filter value -> seconds; relative to the time of the query, so they
+# are not indexed as keys but checked against each post's creation time
+AGE_BUCKETS = {
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 30 * 86400,
+    "year": 365 * 86400,
+}
+
+LANG_ALIASES = {
+    "c++": "cpp",
+    "c#": "csharp",
+    "golang": "go",
+    "js": "javascript",
+    "ts": "typescript",
+    "py": "python",
+}
+
+# optional "-", optional "field:", then a quoted phrase (closing quote
+# optional) or a bare word
+_CLAUSE_RE = re.compile(
+    r"(-)?(?:(" + "|".join(FILTER_FIELDS) + r'):(?=\S))?(?:"([^"]*)"?|(\S+))',
+    flags=re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Clause:
+    # "word", "phrase" or "filter"
+    kind: str
+    value: str
+    # filter field, for filters
+    field: str | None = None
+
+    @property
+    def key(self) -> str:
+        """Index key of a filter: ``"lang:rust"``."""
+        return filter_key(self.field, self.value)
+
+
+@dataclass
+class ParsedQuery:
+    # positive clauses; the clauses of a group are joined by OR
+    groups: list[list[Clause]] = field(default_factory=list)
+    excluded: list[Clause] = field(default_factory=list)
+    has_operators: bool = False
+
+    @property
+    def required(self) -> list[list[Clause]]:
+        """Groups a post must satisfy: all but those of words alone."""
+        return [g for g in self.groups if any(c.kind != "word" for c in g)]
+
+    @property
+    def text(self) -> str:
+        """Words and phrases to rank with."""
+        return " ".join(c.value for g in self.groups for c in g if c.kind != "filter")
+
+
+def _normalize_value(field_name: str, value: str) -> str:
+    value = " ".join(value.split()).lower()
+    if field_name == "lang":
+        return LANG_ALIASES.get(value, value)
+    if field_name == "tag":
+        return value.lstrip("#")
+    if field_name == "type" and value.endswith("s") and value[:-1] in DOC_TYPES:
+        # "type:battles" -> "type:battle"
+        return value[:-1]
+    if field_name == "feedback":
+        # "code-quality" / "code quality" -> "code_quality"
+        return re.sub(r"[\s-]+", "_", value)
+    return value
+
+
+def filter_key(field_name: str, value: str) -> str:
+    return f"{field_name}:{_normalize_value(field_name, value)}"
+
+
+def filter_keys(post: dict) -> set[str]:
+    """
+    Keys of every filter ``post`` (an index document) matches, except
+    ``age``, which depends on when it is asked.
+    """
+    keys = set()
+    if post.get("type"):
+        keys.add(filter_key("type", post["type"]))
+    if post.get("difficulty"):
+        keys.add(filter_key("difficulty", post["difficulty"]))
+    if post.get("language"):
+        keys.add(filter_key("lang", post["language"]))
+    if post.get("user"):
+        keys.add(filter_key("user", post["user"]))
+    for tag in _tags_to_list(post.get("tags")):
+        keys.add(filter_key("tag", tag))
+    for value in _tags_to_list(post.get("feedback")):
+        keys.add(filter_key("feedback", value))
+    keys.discard("tag:")
+    return keys
+
+
+def parse_query(query: str) -> ParsedQuery:
+    parsed = ParsedQuery()
+    join = False
+    for m in _CLAUSE_RE.finditer(query or ""):
+        negated, field_name, phrase, word = m.groups()
+        if word == "OR" and not negated and not field_name:
+            # a leading or dangling OR joins nothing
+            join = bool(parsed.groups)
+            parsed.has_operators = True
+            continue
+
+        if field_name:
+            clause = Clause(
+                "filter", phrase if phrase is not None else word, field_name.lower()
+            )
+        elif phrase is not None:
+            clause = Clause("phrase", phrase)
+        else:
+            clause = Clause("word", word)
+        if not clause.value.strip():
+            join = False
+            continue
+
+        if negated or clause.kind != "word":
+            parsed.has_operators = True
+        if negated:
+            parsed.excluded.append(clause)
+            join = False
+        elif join:
+            parsed.groups[-1].append(clause)
+            join = False
+        else:
+            parsed.groups.append([clause])
+    return parsed
+
+
+def query_types(parsed: ParsedQuery) -> tuple[str, ...]:
+    """
+    Document types ``parsed`` can match, in ``DOC_TYPES`` order: those its
+    ``type:`` filters ask for, or ``DEFAULT_TYPES`` if it has none.
+    """
+
+    def is_type(clause):
+        return clause.kind == "filter" and clause.field == "type"
+
+    types = None
+    for group in parsed.required:
+        if all(is_type(c) for c in group):
+            asked = {c.key.split(":", 1)[1] for c in group}
+            types = asked if types is None else types & asked
+        elif any(is_type(c) for c in group) and types is None:
+            # "type:battle OR lang:go": go posts match too
+            types = set(DOC_TYPES)
+    excluded = {c.key.split(":", 1)[1] for c in parsed.excluded if is_type(c)}
+    if types is None:
+        types = set(DOC_TYPES if excluded else DEFAULT_TYPES)
+    return tuple(t for t in DOC_TYPES if t in types and t not in excluded)
+
+
+def without_field(query: str, field_name: str) -> str:
+    """``query`` without any of its filters on ``field_name``, negated or not."""
+    kept, end = [], 0
+    for m in _CLAUSE_RE.finditer(query or ""):
+        if (m.group(2) or "").lower() == field_name:
+            kept.append(query[end : m.start()])
+            end = m.end()
+    kept.append((query or "")[end:])
+    return " ".join("".join(kept).split())
+
+
+def without_filter(query: str, key: str) -> str:
+    """``query`` without its (non-negated) filters on ``key``."""
+    kept, end = [], 0
+    for m in _CLAUSE_RE.finditer(query or ""):
+        negated, field_name, phrase, word = m.groups()
+        value = phrase if phrase is not None else word
+        if field_name and not negated and filter_key(field_name.lower(), value) == key:
+            kept.append(query[end : m.start()])
+            end = m.end()
+    kept.append((query or "")[end:])
+    return " ".join("".join(kept).split())
+
+
+def rewrite_words(query: str, fix) -> str:
+    """
+    ``query`` with every word of its word and phrase clauses replaced by
+    ``fix(word)``; filters, ``-`` and ``OR`` are kept as typed.
+    """
+
+    def clause(m):
+        _negated, field_name, _phrase, word = m.groups()
+        if field_name or word == "OR":
+            return m.group(0)
+        return TOKEN_RE.sub(lambda w: fix(w.group(0)), m.group(0))
+
+    return _CLAUSE_RE.sub(clause, query or "")
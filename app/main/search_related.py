@@ -0,0 +1,101 @@
+"""
+"More like this": the most similar posts of every post, precomputed from
+the term vectors of a search snapshot.
+
+A post is represented by the BM25 weight of each of its terms
+(``idf * (k1 + 1) * tfn / (k1 + tfn)``, what search scores it with), cut to
+its ``TERMS`` heaviest terms as Lucene's MoreLikeThis does: rare terms of the
+title and tags outweigh the filler of a long description. Two posts are as
+similar as the cosine of those vectors.
+
+Only posts sharing one of those terms are compared, found through an
+inverted list of the cut vectors. A term among the heaviest of more than
+``MAX_DF`` posts says little about any of them and is not used to match.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from app.main.search_snapshot import IndexSnapshot
+
+# related posts kept per post
+TOP = 5
+# heaviest terms kept per post
+TERMS = 16
+# posts a term may be among the heaviest terms of and still match them
+MAX_DF = 200
+
+
+def _term_vectors(snap: IndexSnapshot, terms: int):
+    """``(slots, term ids, weights)`` of the ``terms`` heaviest terms of every post."""
+    n_docs = len(snap)
+    k1 = snap.meta["params"]["k1"]
+    indptr = np.asarray(snap.arrays["indptr"])
+    slots = np.asarray(snap.arrays["postings"])
+    tfn = np.asarray(snap.arrays["tfn"], dtype=np.float64)
+
+    df = np.diff(indptr)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    term_ids = np.repeat(np.arange(len(df), dtype=np.int32), df)
+    weights = idf[term_ids] * (k1 + 1.0) * tfn / (k1 + tfn)
+
+    # by slot, heaviest first (ties by term id, so the cut is reproducible)
+    order = np.lexsort((term_ids, -weights, slots))
+    slots, term_ids, weights = slots[order], term_ids[order], weights[order]
+    starts = np.searchsorted(slots, np.arange(n_docs))
+    keep = np.arange(len(slots)) - starts[slots] < terms
+    return slots[keep], term_ids[keep], weights[keep]
+
+
+def related_posts(
+    snap: IndexSnapshot, top: int = TOP, terms: int = TERMS, max_df: int = MAX_DF
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    ``(post ids, related, scores)``: row ``s`` of the int64 ``related`` holds
+    the ids of up to ``top`` posts most similar to post ``post_ids[s]``, most
+    similar first and padded with -1, and float32 ``scores`` their cosines.
+    """
+    n_docs = len(snap)
+    post_ids = np.asarray(snap.post_ids, dtype=np.int64)
+    related = np.full((n_docs, top), -1, dtype=np.int64)
+    scores = np.zeros((n_docs, top), dtype=np.float32)
+    if not n_docs:
+        return post_ids, related, scores
+
+    slots, term_ids, weights = _term_vectors(snap, terms)
+    norms = np.sqrt(np.bincount(slots, weights=weights**2, minlength=n_docs))
+    doc_indptr = np.searchsorted(slots, np.arange(n_docs + 1))
+
+    # term -> (slots, weights) of the posts it is among the heaviest terms of
+    by_term = np.argsort(term_ids, kind="stable")
+    term_slots, term_weights = slots[by_term], weights[by_term]
+    n_terms = int(term_ids.max()) + 1 if len(term_ids) else 0
+    term_df = np.bincount(term_ids, minlength=n_terms)
+    term_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(term_df, out=term_indptr[1:])
+
+    for slot in range(n_docs):
+        lo, hi = doc_indptr[slot], doc_indptr[slot + 1]
+        members, products = [], []
+        for tid, w in zip(term_ids[lo:hi].tolist(), weights[lo:hi].tolist()):
+            if term_df[tid] > max_df:
+                continue
+            a, b = term_indptr[tid], term_indptr[tid + 1]
+            members.append(term_slots[a:b])
+            products.append(term_weights[a:b] * w)
+        if not members:
+            continue
+        candidates, inverse = np.unique(np.concatenate(members), return_inverse=True)
+        dots = np.bincount(inverse, weights=np.concatenate(products))
+        cosines = dots / (norms[slot] * norms[candidates])
+        cosines[candidates == slot] = 0.0
+
+        k = min(top, len(candidates))
+        best = np.argpartition(-cosines, k - 1)[:k]
+        # most similar first; equal scores by post id
+        best = best[np.lexsort((candidates[best], -cosines[best]))]
+        best = best[cosines[best] > 0.0]
+        related[slot, : len(best)] = post_ids[candidates[best]]
+        scores[slot, : len(best)] = cosines[best]
+    return post_ids, related, scores
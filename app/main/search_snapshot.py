@@ -0,0 +1,358 @@
+"""
+Immutable, array-backed search index segments and their on-disk snapshots.
+
+An ``IndexSnapshot`` is a set of flat arrays (CSR postings over an integer
+vocabulary, doc lengths, id map, tag postings, normalized text blobs). It is
+either built in memory by ``search_index.build_snapshot`` or opened from disk
+with ``mmap``, so the page cache holds one copy for every gunicorn worker.
+
+Snapshots on disk are immutable; a new one is written to a temporary
+directory and published by atomically replacing the ``CURRENT`` pointer file,
+so readers never see a half-written index.
+
+Layout of ``<root>/<name>/``:
+    meta.json                     format, posts version and its gaps, corpus
+                                  stats, params
+    terms.txt                     vocabulary, one term per line (term id = line)
+    indptr.npy                    int64[V + 1] postings offsets per term id
+    postings.npy / tfn.npy        int32 slots / float32 length-normalized,
+                                  field-weighted term frequencies
+    max_tfn.npy                   float32 highest tfn per term id (score bound)
+    post_ids.npy                  int64 post id per slot (ascending)
+    tag_terms.txt, tag_indptr.npy, tag_slots.npy   tag token -> slots
+    filter_terms.txt, filter_indptr.npy, filter_slots.npy
+                                  filter key ("lang:rust") -> slots
+    created.npy                   int64 creation time per slot (Unix seconds)
+    spell_terms.txt, spell_df.npy words and their document counts
+    spell_keys.npy, spell_ids.npy uint32 CRC-32 of every delete of up to one
+                                  character of a word, sorted, and the word id
+    spell_keys2.npy, spell_ids2.npy   same for deletes of two characters
+    title.bin, description.bin    NUL-joined normalized text, UTF-8
+    title_starts.npy, ...         int64 byte offset of every slot in the blob
+    title_span_indptr.npy, ...    int64[N + 1] offsets of every slot's words
+    title_span_terms.npy, ...     int32 term id of every title word, in order
+    title_span_starts.npy, ...    int32 character offset of the word in the
+    title_span_lens.npy, ...      stored title and uint16 length, to
+                                  highlight matches (same for description)
+    docs.bin, docs_offsets.npy    raw documents (JSON lines) for detailed results
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import uuid
+from contextlib import contextmanager, suppress
+
+import numpy as np
+
+from app.main.search_engine import _count_slots, _find_all
+from app.main.search_spell import SnapshotSpell
+
+FORMAT_VERSION = 7
+
+CURRENT = "CURRENT"
+LOCK = ".lock"
+# prefix of a snapshot still being written
+TMP = ".tmp-"
+# old snapshots kept around for workers that have not swapped yet
+KEEP = 2
+
+TEXT_FIELDS = ("title", "description")
+
+LISTS = ("terms", "tag_terms", "filter_terms", "spell_terms")
+BLOBS = ("title", "description", "docs")
+ARRAYS = (
+    "indptr",
+    "postings",
+    "tfn",
+    "max_tfn",
+    "post_ids",
+    "tag_indptr",
+    "tag_slots",
+    "filter_indptr",
+    "filter_slots",
+    "created",
+    "spell_df",
+    "spell_keys",
+    "spell_ids",
+    "spell_keys2",
+    "spell_ids2",
+    "title_starts",
+    "description_starts",
+    "title_span_indptr",
+    "title_span_terms",
+    "title_span_starts",
+    "title_span_lens",
+    "description_span_indptr",
+    "description_span_terms",
+    "description_span_starts",
+    "description_span_lens",
+    "docs_offsets",
+)
+
+
+def _read_lines(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        data = f.read()
+    return data.split("\n") if data else []
+
+
+def _map_file(path: str):
+    # mmap refuses empty files; an empty blob has nothing to find anyway
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SnapshotFields:
+    """Read-only ``FieldMatcher`` counterpart backed by snapshot arrays."""
+
+    def __init__(self, arrays: dict):
+        self._tag_ids = {t: i for i, t in enumerate(arrays["tag_terms"])}
+        self._tag_indptr = arrays["tag_indptr"]
+        self._tag_slots = arrays["tag_slots"]
+        self._blobs = {
+            field: (arrays[field], arrays[f"{field}_starts"]) for field in TEXT_FIELDS
+        }
+
+    def tag_hits(self, tokens) -> tuple[np.ndarray, np.ndarray]:
+        arrays = []
+        for tok in set(tokens):
+            tid = self._tag_ids.get(tok)
+            if tid is not None:
+                lo, hi = self._tag_indptr[tid], self._tag_indptr[tid + 1]
+                arrays.append(self._tag_slots[lo:hi])
+        return _count_slots(arrays)
+
+    def contains(self, slots: np.ndarray, q_norm: str, field: str) -> np.ndarray:
+        blob, starts = self._blobs[field]
+        needle = q_norm.encode("utf-8")
+        slots = np.asarray(slots, dtype=np.int64)
+        lo = starts[slots]
+        # a text ends right before the NUL that precedes the next one
+        nxt = np.minimum(slots + 1, len(starts) - 1)
+        hi = np.where(slots + 1 < len(starts), starts[nxt] - 1, len(blob))
+        find = blob.find
+        return np.fromiter(
+            (find(needle, a, b) != -1 for a, b in zip(lo.tolist(), hi.tolist())),
+            dtype=bool,
+            count=len(slots),
+        )
+
+    def phrase_hits(self, q_norm: str, field: str) -> np.ndarray:
+        hits: list[int] = []
+        if q_norm and "\x00" not in q_norm:
+            blob, starts = self._blobs[field]
+            # UTF-8 is self-synchronizing: a byte match is a character match
+            _find_all(blob, starts, q_norm.encode("utf-8"), hits, 0)
+        return np.array(hits, dtype=np.int64)
+
+
+class IndexSnapshot:
+    """Immutable BM25 segment; see the module docstring for its arrays."""
+
+    def __init__(self, meta: dict, arrays: dict, name: str | None = None):
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search snapshot format: {name}")
+
+        self.meta = meta
+        self.arrays = arrays
+        self.name = name
+        self.version: int = meta["version"]
+        self.gaps: list[int] = meta.get("gaps", [])
+
+        self._term_ids = {t: i for i, t in enumerate(arrays["terms"])}
+        self._indptr = arrays["indptr"]
+        self._postings = arrays["postings"]
+        self._tfn = arrays["tfn"]
+        self._max_tfn = arrays["max_tfn"]
+        self.post_ids = arrays["post_ids"]
+        self.fields = SnapshotFields(arrays)
+        self._filter_ids = {k: i for i, k in enumerate(arrays["filter_terms"])}
+        self._filter_indptr = arrays["filter_indptr"]
+        self._filter_slots = arrays["filter_slots"]
+        # filter field -> its keys
+        self._filter_fields: dict[str, list[str]] = {}
+        for key in arrays["filter_terms"]:
+            self._filter_fields.setdefault(key.split(":", 1)[0], []).append(key)
+        self.created = arrays["created"]
+        self.spell = SnapshotSpell(arrays)
+        self._docs = arrays["docs"]
+        self._docs_offsets = arrays["docs_offsets"]
+
+    def __len__(self) -> int:
+        return len(self.post_ids)
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float] | None:
+        """``(slots, tfn, max_tfn)`` of ``term``; slots are ascending."""
+        tid = self._term_ids.get(term)
+        if tid is None:
+            return None
+        lo, hi = self._indptr[tid], self._indptr[tid + 1]
+        return (
+            self._postings[lo:hi],
+            self._tfn[lo:hi],
+            float(self._max_tfn[tid]),
+        )
+
+    def term_id(self, term: str) -> int | None:
+        return self._term_ids.get(term)
+
+    def spans(self, slot: int, field: str):
+        """
+        ``(term ids, starts, lengths)`` of the words of ``field`` (a
+        ``TEXT_FIELDS`` field) of ``slot``, in order; offsets are characters
+        of the stored document's text.
+        """
+        arrays = self.arrays
+        indptr = arrays[f"{field}_span_indptr"]
+        lo, hi = indptr[slot], indptr[slot + 1]
+        return (
+            arrays[f"{field}_span_terms"][lo:hi],
+            arrays[f"{field}_span_starts"][lo:hi],
+            arrays[f"{field}_span_lens"][lo:hi],
+        )
+
+    def filter_slots(self, key: str) -> np.ndarray:
+        """Ascending slots of the documents matching filter ``key``."""
+        fid = self._filter_ids.get(key)
+        if fid is None:
+            return np.zeros(0, dtype=np.int32)
+        return self._filter_slots[
+            self._filter_indptr[fid] : self._filter_indptr[fid + 1]
+        ]
+
+    def filter_terms(self, field: str) -> list[str]:
+        """Filter keys of ``field`` ("lang" -> ["lang:go", ...])."""
+        return self._filter_fields.get(field, [])
+
+    def slot_of(self, pid: str) -> int | None:
+        try:
+            key = int(pid)
+        except ValueError:
+            return None
+        slot = int(np.searchsorted(self.post_ids, key))
+        if slot < len(self.post_ids) and self.post_ids[slot] == key:
+            return slot
+        return None
+
+    def pid(self, slot: int) -> str:
+        return str(int(self.post_ids[slot]))
+
+    def doc(self, slot: int) -> dict:
+        lo, hi = self._docs_offsets[slot], self._docs_offsets[slot + 1]
+        return json.loads(self._docs[lo:hi])
+
+    def nbytes(self) -> int:
+        """Size of the arrays and blobs (vocabulary strings not included)."""
+        total = sum(self.arrays[key].nbytes for key in ARRAYS)
+        return total + sum(len(self.arrays[key]) for key in BLOBS)
+
+
+def save_snapshot(snapshot: IndexSnapshot, path: str) -> None:
+    os.makedirs(path)
+    for key in LISTS:
+        with open(f"{path}/{key}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(snapshot.arrays[key]))
+    for key in BLOBS:
+        with open(f"{path}/{key}.bin", "wb") as f:
+            f.write(snapshot.arrays[key])
+    for key in ARRAYS:
+        np.save(f"{path}/{key}.npy", snapshot.arrays[key])
+    # written last: a directory without meta.json is not a snapshot
+    with open(f"{path}/meta.json", "w", encoding="utf-8") as f:
+        json.dump(snapshot.meta, f)
+
+
+def load_snapshot(path: str) -> IndexSnapshot:
+    with open(f"{path}/meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    # checked before opening arrays an older format may not have
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported search snapshot format: {path}")
+    arrays: dict = {}
+    for key in LISTS:
+        arrays[key] = _read_lines(f"{path}/{key}.txt")
+    for key in BLOBS:
+        arrays[key] = _map_file(f"{path}/{key}.bin")
+    for key in ARRAYS:
+        arrays[key] = np.load(f"{path}/{key}.npy", mmap_mode="r")
+    return IndexSnapshot(meta, arrays, name=os.path.basename(path))
+
+
+def current_snapshot(root: str) -> str | None:
+    """Name of the published snapshot, or None if nothing was published yet."""
+    try:
+        with open(os.path.join(root, CURRENT), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_snapshot(root: str, name: str) -> IndexSnapshot:
+    return load_snapshot(os.path.join(root, name))
+
+
+@contextmanager
+def build_lock(root: str, *, blocking: bool = True):
+    """
+    Cross-process lock around building a snapshot. Yields whether it was
+    acquired, which is always True when ``blocking``.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK), "w") as f:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish_snapshot(root: str, snapshot: IndexSnapshot) -> str:
+    """
+    Write ``snapshot`` to ``root`` and make it current. Returns its name.
+    Call it under ``build_lock``: what another publish left half-written is
+    then known to be abandoned, and removed.
+    """
+    os.makedirs(root, exist_ok=True)
+    name = f"{snapshot.version:012d}-{uuid.uuid4().hex[:8]}"
+    tmp = os.path.join(root, f"{TMP}{name}")
+    save_snapshot(snapshot, tmp)
+    os.rename(tmp, os.path.join(root, name))
+
+    pointer = os.path.join(root, f".{CURRENT}-{name}")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(root, CURRENT))
+
+    _prune(root, keep=name)
+    return name
+
+
+def _prune(root: str, keep: str) -> None:
+    # Workers still reading a removed snapshot keep their mappings alive.
+    entries = os.listdir(root)
+    names = sorted(n for n in entries if not n.startswith(".") and n != CURRENT)
+    for n in names[:-KEEP]:
+        if n != keep:
+            shutil.rmtree(os.path.join(root, n), ignore_errors=True)
+    # left by a publish that was killed or failed: under the build lock, no
+    # other one is writing
+    for n in entries:
+        if n.startswith(TMP):
+            shutil.rmtree(os.path.join(root, n), ignore_errors=True)
+        elif n.startswith(f".{CURRENT}-"):
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(root, n))
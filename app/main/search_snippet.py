@@ -0,0 +1,126 @@
+"""
+Highlighted excerpts of search results.
+
+The index keeps the character offsets of every title and description word
+(``tokenize_spans``), so marking the words a query matched only compares
+term ids; result texts are never tokenized again. An excerpt is the window
+of ``SNIPPET_CHARS`` characters holding the most distinct matched words,
+with a little text before the first of them, cut at word boundaries.
+
+Both come out as ``(text, matched)`` segments for the template to escape
+and mark up.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+
+# characters of description shown per result
+SNIPPET_CHARS = 200
+# most matches considered when placing the window
+MAX_HITS = 200
+
+ELLIPSIS = "…"
+
+
+def matches(terms: list, wanted: set, pairs: dict) -> list[bool]:
+    """
+    Whether each word (``terms``, ids or strings) is ``wanted``, or is the
+    first or second of a pair (``{first: {seconds}}``) found next to each
+    other: the query word "timsort" matches "Tim Sort".
+    """
+    hits = [term in wanted for term in terms]
+    if pairs:
+        for i, (first, second) in enumerate(zip(terms, terms[1:])):
+            if first in pairs and second in pairs[first]:
+                hits[i] = hits[i + 1] = True
+    return hits
+
+
+def _segments(text: str, lo: int, hi: int, starts, ends, hits) -> list:
+    """``text[lo:hi]`` split into matched and unmatched segments."""
+    segments = []
+    pos = lo
+    for start, end, hit in zip(starts, ends, hits):
+        a, b = max(start, pos), min(end, hi)
+        if not hit or a >= b:
+            # unmatched, inside the previous match, or outside the window
+            continue
+        if segments and segments[-1][1] and a == pos:
+            # touching the previous match: extend it
+            segments[-1] = (segments[-1][0] + text[a:b], True)
+        else:
+            if a > pos:
+                segments.append((text[pos:a], False))
+            segments.append((text[a:b], True))
+        pos = b
+    if pos < hi:
+        segments.append((text[pos:hi], False))
+    return segments
+
+
+def highlight(text: str, starts: list, lens: list, hits: list) -> list:
+    """All of ``text``, its matched words marked."""
+    ends = [a + n for a, n in zip(starts, lens)]
+    return _segments(text, 0, len(text), starts, ends, hits)
+
+
+def _window(starts, ends, terms, hits, width: int) -> tuple[int, int]:
+    """
+    ``(first, last)`` matched words of the window with the most distinct
+    matched words (then the most matches, then the earliest).
+    """
+    positions = [i for i, hit in enumerate(hits) if hit][:MAX_HITS]
+    if not positions:
+        return 0, 0
+    hit_ends = [ends[i] for i in positions]
+    best, best_key = (positions[0], positions[0]), (0, 0)
+    for k, first in enumerate(positions):
+        j = bisect_right(hit_ends, starts[first] + width, lo=k)
+        key = (len({terms[i] for i in positions[k:j]}), j - k)
+        if key > best_key:
+            best, best_key = (first, positions[max(j - 1, k)]), key
+    return best
+
+
+def snippet(
+    text: str,
+    terms: list,
+    starts: list,
+    lens: list,
+    hits: list,
+    width: int = SNIPPET_CHARS,
+) -> list:
+    """
+    About ``width`` characters of ``text`` around its best matches, matched
+    words marked, with an ellipsis where it was cut.
+    """
+    ends = [a + n for a, n in zip(starts, lens)]
+    if len(text) <= width:
+        return _segments(text, 0, len(text), starts, ends, hits)
+
+    lo = 0
+    if starts:
+        first, last = _window(starts, ends, terms, hits, width)
+        # some text before the first match, as long as the matches fit
+        lead = min(width // 4, width - (ends[last] - starts[first]))
+        lo = max(0, starts[first] - max(lead, 0))
+    lo = min(lo, len(text) - width)
+    hi = lo + width
+
+    # cut at word boundaries
+    if lo > 0:
+        i = bisect_left(starts, lo)
+        if i < len(starts) and starts[i] < hi:
+            lo = starts[i]
+    if hi < len(text):
+        k = bisect_right(ends, hi) - 1
+        if k >= 0 and ends[k] > lo:
+            hi = ends[k]
+
+    segments = _segments(text, lo, hi, starts, ends, hits)
+    if lo > 0:
+        segments.insert(0, (ELLIPSIS + " ", False))
+    if hi < len(text):
+        segments.append((" " + ELLIPSIS, False))
+    return segments
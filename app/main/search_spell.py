@@ -0,0 +1,219 @@
+"""
+Spelling correction of query words against the index vocabulary (SymSpell).
+
+Every vocabulary word is filed under each string left by deleting up to
+``MAX_DISTANCE`` characters from its first ``PREFIX`` characters. A misspelled
+query word reaches the words within that edit distance through its own
+deletes: a few dozen lookups whatever the size of the vocabulary, and only the
+words found get an exact edit distance. Words one edit apart always share a
+delete of at most one character each, so those deletes are kept apart and
+looked up first; the larger set of two-character deletes is only read when no
+word is one edit away.
+
+In snapshots the deletes are CRC-32 keys in sorted arrays, looked up by binary
+search; a collision only adds a candidate the distance check then rejects.
+"""
+
+from __future__ import annotations
+
+import zlib
+from collections import Counter
+
+import numpy as np
+
+MAX_DISTANCE = 2
+# only the start of a word is spelled out in deletes; edits past it are
+# still measured, just not used to find candidates
+PREFIX = 7
+# shorter words are neither corrected nor suggested
+MIN_LENGTH = 3
+# nearest words a misspelled query word expands to
+MAX_EXPANSIONS = 3
+
+
+def max_distance(word: str) -> int:
+    """Edits allowed for ``word``: one for short words, where two is most of it."""
+    return 1 if len(word) <= 4 else MAX_DISTANCE
+
+
+def is_word(token: str) -> bool:
+    return len(token) >= MIN_LENGTH and token.isalpha()
+
+
+def _deletes(word: str, distance: int) -> list[set[str]]:
+    """Strings left by deleting 0, 1, ... ``distance`` characters of ``word``."""
+    levels = [{word[:PREFIX]}]
+    for _ in range(distance):
+        levels.append(
+            {
+                w[:i] + w[i + 1 :]
+                for w in levels[-1]
+                if len(w) > 1
+                for i in range(len(w))
+            }
+        )
+    return levels
+
+
+def _key(s: str) -> int:
+    return zlib.crc32(s.encode("utf-8"))
+
+
+def edit_distances(word: str, terms) -> list[int]:
+    """
+    Optimal string alignment distances (Levenshtein plus adjacent
+    transpositions: "djnago" -> "django" is one edit) from ``word`` to each
+    of ``terms``, with Hyyrö's bit-parallel algorithm: one pass over a term,
+    a few integer operations per character, whatever the length of ``word``.
+    """
+    m = len(word)
+    if not m:
+        return [len(t) for t in terms]
+    # peq[c]: bits of the positions of c in word
+    peq: dict[str, int] = {}
+    for i, c in enumerate(word):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+
+    result = []
+    for term in terms:
+        pv, mv, d0, prev_eq, score = full, 0, 0, 0, m
+        for c in term:
+            eq = peq.get(c, 0)
+            tr = (((~d0) & eq) << 1) & prev_eq
+            d0 = ((((eq & pv) + pv) ^ pv) | eq | mv | tr) & full
+            hp = mv | (~(d0 | pv) & full)
+            hm = pv & d0
+            if hp & last:
+                score += 1
+            elif hm & last:
+                score -= 1
+            hp = ((hp << 1) | 1) & full
+            hm = (hm << 1) & full
+            pv = hm | (~(d0 | hp) & full)
+            mv = hp & d0
+            prev_eq = eq
+        result.append(score)
+    return result
+
+
+def _sorted_keys(keys: list[int], ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    keys_np = np.array(keys, dtype=np.uint32)
+    order = np.argsort(keys_np, kind="stable")
+    return keys_np[order], np.array(ids, dtype=np.int32)[order]
+
+
+def build_spell(word_df: dict[str, int]) -> dict:
+    """Snapshot arrays of the words of ``word_df`` (word -> documents)."""
+    terms = [w for w in word_df if is_word(w)]
+    # (key, word id) of deletes of up to one character, then of two
+    near: tuple[list[int], list[int]] = ([], [])
+    far: tuple[list[int], list[int]] = ([], [])
+    for tid, word in enumerate(terms):
+        for depth, deletes in enumerate(_deletes(word, MAX_DISTANCE)):
+            keys, ids = near if depth <= 1 else far
+            keys.extend(_key(d) for d in deletes)
+            ids.extend([tid] * len(deletes))
+    arrays = {
+        "spell_terms": terms,
+        "spell_df": np.array([word_df[w] for w in terms], dtype=np.int32),
+    }
+    arrays["spell_keys"], arrays["spell_ids"] = _sorted_keys(*near)
+    arrays["spell_keys2"], arrays["spell_ids2"] = _sorted_keys(*far)
+    return arrays
+
+
+class SnapshotSpell:
+    """Read-only delete index over the words of a snapshot."""
+
+    def __init__(self, arrays: dict):
+        self._terms = arrays["spell_terms"]
+        self._df = arrays["spell_df"]
+        # deletes of up to one character, and of two
+        self._tables = [
+            (arrays["spell_keys"], arrays["spell_ids"]),
+            (arrays["spell_keys2"], arrays["spell_ids2"]),
+        ]
+
+    def candidates(self, word: str, distance: int) -> dict[str, int]:
+        """
+        Words sharing a delete with ``word``, with their document counts:
+        every word within ``distance`` edits, and then some.
+        """
+        keys = np.array(
+            [_key(d) for level in _deletes(word, distance) for d in level],
+            dtype=np.uint32,
+        )
+        found = []
+        for table_keys, table_ids in self._tables[:distance]:
+            lo = np.searchsorted(table_keys, keys, side="left")
+            counts = np.searchsorted(table_keys, keys, side="right") - lo
+            # positions lo[i] .. lo[i] + counts[i] - 1 of every key, in one array
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            found.append(table_ids[starts + np.arange(len(starts))])
+        ids = np.unique(np.concatenate(found))
+        df = self._df[ids].tolist()
+        return {self._terms[i]: n for i, n in zip(ids.tolist(), df)}
+
+
+class SpellDelta:
+    """Mutable delete index over the words of documents added since."""
+
+    def __init__(self):
+        self._df: Counter = Counter()
+        self._deletes: dict[str, set[str]] = {}
+
+    def add(self, words) -> None:
+        for word in words:
+            if not is_word(word):
+                continue
+            self._df[word] += 1
+            if self._df[word] == 1:
+                for level in _deletes(word, MAX_DISTANCE):
+                    for d in level:
+                        self._deletes.setdefault(d, set()).add(word)
+
+    def remove(self, words) -> None:
+        for word in words:
+            if not is_word(word):
+                continue
+            self._df[word] -= 1
+            if self._df[word]:
+                continue
+            del self._df[word]
+            for d in set().union(*_deletes(word, MAX_DISTANCE)):
+                found = self._deletes[d]
+                found.discard(word)
+                if not found:
+                    del self._deletes[d]
+
+    def candidates(self, word: str, distance: int) -> dict[str, int]:
+        found: dict[str, int] = {}
+        for level in _deletes(word, distance):
+            for d in level:
+                for w in self._deletes.get(d, ()):
+                    found[w] = self._df[w]
+        return found
+
+
+def corrections(word: str, sources) -> list[tuple[str, int, int]]:
+    """
+    ``(word, distance, documents)`` of the vocabulary words nearest to
+    ``word``, within ``max_distance(word)`` edits, most common first.
+    """
+    for limit in range(1, max_distance(word) + 1):
+        found: dict[str, int] = {}
+        for source in sources:
+            for term, df in source.candidates(word, limit).items():
+                found[term] = found.get(term, 0) + df
+        terms = [t for t in found if t != word and abs(len(t) - len(word)) <= limit]
+        result = [
+            (term, distance, found[term])
+            for term, distance in zip(terms, edit_distances(word, terms))
+            if distance <= limit
+        ]
+        if result:
+            result.sort(key=lambda c: (c[1], -c[2], c[0]))
+            return result
+    return []
@@ -0,0 +1,66 @@
+"""
+Normalized tags of posts and battles.
+
+``Post.tags`` and ``Battle.tags`` keep the comma-separated string the pages
+show; each distinct tag is also a ``Tag`` row, linked through ``post_tags``
+and ``battle_tags`` when the post or battle is created. Finding the posts
+with a tag is then an indexed lookup of ``post_tags`` by tag id, and a tag
+matches whole: "go" is not found in "django".
+"""
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Post, Tag, post_tags
+
+# longest tag kept (Tag.name)
+TAG_LENGTH = 50
+
+
+def split_tags(tags: str | None) -> list[str]:
+    """The distinct tags of a comma-separated ``tags`` string, lowercased."""
+    names = []
+    for tag in (tags or "").split(","):
+        tag = tag.strip().lower()
+        if tag and len(tag) <= TAG_LENGTH and tag not in names:
+            names.append(tag)
+    return names
+
+
+def get_or_create(names: list[str]) -> list[Tag]:
+    """The ``Tag`` of each name, inserting those that are new."""
+    if not names:
+        return []
+    found = {t.name: t for t in Tag.query.filter(Tag.name.in_(names))}
+    missing = [name for name in names if name not in found]
+    for name in missing:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(Tag.__table__.insert(), {"name": name})
+        except IntegrityError:
+            # inserted meanwhile by another request; read below
+            pass
+    if missing:
+        found.update((t.name, t) for t in Tag.query.filter(Tag.name.in_(missing)))
+    return [found[name] for name in names]
+
+
+def set_tags(item, tags: str | None) -> None:
+    """Link a ``Post`` or ``Battle`` to the tags of its ``tags`` string."""
+    item.tag_list = get_or_create(split_tags(tags))
+
+
+def tagged_posts(name: str, limit: int):
+    """
+    SQL select of the ids of the newest ``limit`` public posts tagged
+    ``name``, read from the ``post_tags`` index of the tag.
+    """
+    tag_id = select(Tag.id).where(Tag.name == name).scalar_subquery()
+    return (
+        select(post_tags.c.post_id.label("id"))
+        .join(Post, Post.id == post_tags.c.post_id)
+        .where(post_tags.c.tag_id == tag_id, Post.visibility == "public")
+        .order_by(post_tags.c.post_id.desc())
+        .limit(limit)
+    )
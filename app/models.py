@@ -4,6 +4,8 @@ Defining models for database
 
 from datetime import date, datetime
 
+from sqlalchemy import event, inspect, literal, literal_column, select
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app import db
@@ -36,6 +38,47 @@ class Reaction(db.Model):
     )
 
 
+class Tag(db.Model):
+    """
+    Tag model
+    One row per distinct tag of posts and battles, lowercased, so posts
+    sharing a tag are found through ``post_tags`` rather than by matching
+    the ``Post.tags`` strings (``app.main.tags``).
+    Example:
+        Tag(name="python")
+    """
+
+    __tablename__ = "tags"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+
+# Tags of each post and battle; the primary keys look up the tags of one
+# post, the tag_id indexes the posts of one tag
+post_tags = db.Table(
+    "post_tags",
+    db.Column(
+        "post_id",
+        db.Integer,
+        db.ForeignKey("posts.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column("tag_id", db.Integer, db.ForeignKey("tags.id"), primary_key=True),
+    db.Index("ix_post_tags_tag_id", "tag_id", "post_id"),
+)
+battle_tags = db.Table(
+    "battle_tags",
+    db.Column(
+        "battle_id",
+        db.Integer,
+        db.ForeignKey("battles.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column("tag_id", db.Integer, db.ForeignKey("tags.id"), primary_key=True),
+    db.Index("ix_battle_tags_tag_id", "tag_id", "battle_id"),
+)
+
+
 class User(db.Model):
     """
     User model
@@ -122,6 +165,14 @@ class Post(db.Model):
     visibility = db.Column(db.String(20), default="public", nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    # Denormalized counts of reactions and comments, kept exact by the routes
+    # that add and delete them (``app.main.engagement``) so feeds can sort by
+    # engagement without aggregating those tables
+    reaction_count = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
+    comment_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+
     # Foreign Key linking to User
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     author = db.relationship("User", backref="posts", lazy=True)
@@ -135,6 +186,8 @@ class Post(db.Model):
         cascade="all, delete-orphan",
         order_by="Comment.created_at.asc()",
     )
+    # ``tags`` as rows of ``post_tags``, kept in step by ``app.main.tags``
+    tag_list = db.relationship("Tag", secondary=post_tags, lazy=True)
 
     @property
     def reactions_summary(self):
@@ -147,10 +200,165 @@ class Post(db.Model):
             summary[reaction.emoji]["user_ids"].add(reaction.user_id)
         return summary
 
+    @hybrid_property
+    def engagement(self):
+        """5 points per reaction and 10 per comment, as user points count them"""
+        return self.reaction_count * 5 + self.comment_count * 10
+
+    @engagement.inplace.expression
+    @classmethod
+    def _engagement_expression(cls):
+        # inline numbers, so queries match the ix_posts_engagement expression
+        five, ten = literal_column("5"), literal_column("10")
+        return cls.reaction_count * five + cls.comment_count * ten
+
     def __repr__(self):
         return f"Post('{self.title}', '{self.created_at}')"
 
 
+# Feed orders, read from the index instead of sorting every post; keyset
+# pages compare (engagement, created_at, id) rows, so the keys end with id
+db.Index(
+    "ix_posts_engagement", Post.visibility, Post.engagement, Post.created_at, Post.id
+)
+db.Index("ix_posts_visibility_created_at", Post.visibility, Post.created_at, Post.id)
+# Newest posts of a language: a candidate source of the recommended feed
+db.Index(
+    "ix_posts_visibility_language_created_at",
+    Post.visibility,
+    Post.language,
+    Post.created_at,
+    Post.id,
+)
+
+
+class PostChange(db.Model):
+    """
+    PostChange model
+    Append-only log of writes to posts, replayed by the search index: every
+    insert, update or delete of a post appends a row, so workers only replay
+    rows they have not read yet. The autoincrement id orders them, but not
+    by commit: a lower id can commit after a higher one was read, so readers
+    look again for the ids they skipped (``app.main.search._Cursor``).
+    Example:
+        PostChange(post_id=1)
+    """
+
+    __tablename__ = "post_changes"
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: the row must outlive the post it records a delete for
+    post_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+@event.listens_for(Post, "after_insert")
+@event.listens_for(Post, "after_update")
+@event.listens_for(Post, "after_delete")
+def _record_post_change(mapper, connection, target):
+    """Bump the posts version in the same transaction as the write itself."""
+    connection.execute(
+        PostChange.__table__.insert().values(
+            post_id=target.id, created_at=datetime.utcnow()
+        )
+    )
+
+
+@event.listens_for(User, "after_update")
+def _record_author_rename(mapper, connection, target):
+    """
+    Posts and battles are searchable by author (``user:``): reindex them on
+    a rename.
+    """
+    if not inspect(target).attrs.username.history.has_changes():
+        return
+    connection.execute(
+        PostChange.__table__.insert().from_select(
+            ["post_id", "created_at"],
+            select(Post.id, literal(datetime.utcnow())).where(
+                Post.user_id == target.id
+            ),
+        )
+    )
+    connection.execute(
+        BattleChange.__table__.insert().from_select(
+            ["battle_id", "created_at"],
+            select(Battle.id, literal(datetime.utcnow())).where(
+                Battle.user_id == target.id
+            ),
+        )
+    )
+
+
+class UserChange(db.Model):
+    """
+    UserChange model
+    Append-only log of writes to users that autocomplete ranks or shows
+    (sign-ups, renames, points), versioned like ``PostChange``.
+    Example:
+        UserChange(user_id=1)
+    """
+
+    __tablename__ = "user_changes"
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: the row must outlive the user it records a delete for
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _record_user_change(mapper, connection, target):
+    """Bump the users version in the same transaction as the write itself."""
+    connection.execute(
+        UserChange.__table__.insert().values(
+            user_id=target.id, created_at=datetime.utcnow()
+        )
+    )
+
+
+@event.listens_for(User, "after_update")
+def _record_user_rerank(mapper, connection, target):
+    """Renames and points changes are seen by autocomplete; streaks are not."""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("username", "points")):
+        _record_user_change(mapper, connection, target)
+
+
+class RelatedPost(db.Model):
+    """
+    RelatedPost model
+    Precomputed "more like this" posts of a post (``search_related``),
+    rebuilt by ``flask build-related-posts``.
+    Example:
+        RelatedPost(post_id=1, related_id=7, score=0.42)
+    """
+
+    __tablename__ = "related_posts"
+    # No foreign keys: derived data, replaced as a whole; rows of deleted
+    # posts are skipped by the join that reads them until the next rebuild
+    post_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    score = db.Column(db.Float, nullable=False)
+
+
+class UserAffinity(db.Model):
+    """
+    UserAffinity model
+    How much a user cares about a language or a tag, for the recommended
+    feed: the weights of their posts, comments and reactions in it, kept by
+    ``app.main.affinity`` as they happen.
+    Example:
+        UserAffinity(user_id=1, kind="tag", name="rust", weight=5)
+    """
+
+    __tablename__ = "user_affinities"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    # "language" or "tag"
+    kind = db.Column(db.String(10), primary_key=True)
+    name = db.Column(db.String(50), primary_key=True)
+    weight = db.Column(db.Integer, nullable=False)
+
+
 class Comment(db.Model):
     """
     Comment model
@@ -171,6 +379,10 @@ class Comment(db.Model):
     author = db.relationship("User", backref="comments", lazy=True)
 
 
+# A post's thread, oldest first, in keyset pages of (created_at, id)
+db.Index("ix_comments_post_created_at", Comment.post_id, Comment.created_at, Comment.id)
+
+
 class Battle(db.Model):
     """
     Battle model
@@ -215,11 +427,68 @@ class Battle(db.Model):
     review_end_time = db.Column(db.DateTime, nullable=True)
     winner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     winner = db.relationship("User", foreign_keys=[winner_id])
+    # ``tags`` as rows of ``battle_tags``, kept in step by ``app.main.tags``
+    tag_list = db.relationship("Tag", secondary=battle_tags, lazy=True)
 
     def __repr__(self):
         return f"Battle('{self.title}', '{self.status}')"
 
 
+# battles list order, for keyset pages of (created_at, id)
+db.Index(
+    "ix_battles_visibility_created_at",
+    Battle.visibility,
+    Battle.created_at,
+    Battle.id,
+)
+
+
+class BattleChange(db.Model):
+    """
+    BattleChange model
+    Append-only log of writes to battles that search indexes, versioned
+    like ``PostChange``.
+    Example:
+        BattleChange(battle_id=1)
+    """
+
+    __tablename__ = "battle_changes"
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: the row must outlive the battle it records a delete for
+    battle_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Battle columns search indexes or filters on
+BATTLE_INDEXED = (
+    "title",
+    "description",
+    "language",
+    "difficulty",
+    "tags",
+    "visibility",
+)
+
+
+@event.listens_for(Battle, "after_insert")
+@event.listens_for(Battle, "after_delete")
+def _record_battle_change(mapper, connection, target):
+    """Bump the battles version in the same transaction as the write itself."""
+    connection.execute(
+        BattleChange.__table__.insert().values(
+            battle_id=target.id, created_at=datetime.utcnow()
+        )
+    )
+
+
+@event.listens_for(Battle, "after_update")
+def _record_battle_edit(mapper, connection, target):
+    """Joins, submissions and votes do not change what search finds."""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in BATTLE_INDEXED):
+        _record_battle_change(mapper, connection, target)
+
+
 class BattleVote(db.Model):
     __tablename__ = "battle_votes"
     id = db.Column(db.Integer, primary_key=True)
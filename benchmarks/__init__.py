@@ -0,0 +1,4 @@
+"""
+Offline benchmarks. Run from the repository root, e.g.:
+    python -m benchmarks.search_engines --posts 20000
+"""
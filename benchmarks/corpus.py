@@ -0,0 +1,122 @@
+"""
+Reproducible synthetic posts for search benchmarks.
+"""
+
+import random
+import time
+from itertools import accumulate
+
+EN_WORDS = (
+    "python flask django rust async await memory cache index query tree graph "
+    "heap sort merge quick binary search parser lexer token vector matrix "
+    "thread lock queue stack list dict set string number float integer file "
+    "stream socket server client request response database table column row "
+    "recursion iteration closure decorator generator class object method "
+    "function module package import error exception test benchmark profile "
+    "fast slow simple clean refactor review feedback performance security"
+).split()
+UK_WORDS = (
+    "пошук дерево масив рядок число функція клас модуль помилка тест швидко "
+    "повільно пам'ять кеш запит відповідь сервер клієнт база таблиця код"
+).split()
+TAGS = (
+    "python rust go javascript typescript java cpp algorithms datastructures "
+    "web backend frontend async performance security testing devops ml"
+).split()
+LANGUAGES = "python javascript rust go java cpp csharp".split()
+FEEDBACK = "code_quality performance architecture security".split()
+
+
+SYLLABLES = "ba ko ri mu te sa lo vi ne da pu gi ze ha fo".split()
+
+
+class _Vocabulary:
+    """
+    Real words first, then made-up ones, drawn with Zipf-like frequencies so
+    a few terms are in most posts and most terms are rare, as in real text.
+    """
+
+    def __init__(self, rng: random.Random, size: int = 20000):
+        words = EN_WORDS + UK_WORDS
+        seen = set(words)
+        while len(words) < size:
+            word = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        self.words = words
+        self.cum_weights = list(accumulate(1.0 / (r + 10) for r in range(size)))
+
+    def sample(self, rng: random.Random, k: int) -> list[str]:
+        words = rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+        # some camelCase identifiers, as in code-heavy posts
+        for i in range(0, k, 10):
+            if rng.random() < 0.5:
+                words[i] += rng.choice(EN_WORDS).capitalize()
+        return words
+
+
+def _identifier(rng: random.Random, vocab: _Vocabulary, camel: bool) -> str:
+    parts = [w for w in vocab.sample(rng, rng.randint(1, 3)) if w.isascii()] or ["x"]
+    if camel:
+        return parts[0].lower() + "".join(p.capitalize() for p in parts[1:])
+    return "_".join(parts).lower()
+
+
+def _code(rng: random.Random, vocab: _Vocabulary, language: str) -> str:
+    """A few lines of code-like text: definitions, calls and keywords."""
+    camel = language not in ("python", "rust")
+    keyword = (
+        "def" if language == "python" else "fn" if language == "rust" else "function"
+    )
+    lines = []
+    for _ in range(rng.randint(3, 40)):
+        name = _identifier(rng, vocab, camel)
+        args = ", ".join(
+            _identifier(rng, vocab, camel) for _ in range(rng.randint(0, 3))
+        )
+        if rng.random() < 0.2:
+            lines.append(f"{keyword} {name}({args}):")
+        else:
+            lines.append(f"    return {name}({args}) if {args or 'self'} else None")
+    return "\n".join(lines)
+
+
+def generate_posts(
+    n: int, seed: int = 42, now: int | None = None, code: bool = False
+) -> dict[str, dict]:
+    """
+    ``n`` posts in the ``search._load_posts_for_index`` format, created
+    evenly over the two years before ``now`` (default: the current time),
+    with a ``code`` field when ``code`` is set.
+    """
+    rng = random.Random(seed)
+    # filter fields and code come from their own streams, so the texts stay
+    # the same
+    meta_rng = random.Random(seed + 1)
+    code_rng = random.Random(seed + 2)
+    vocab = _Vocabulary(random.Random(0))
+    n_users = max(1, n // 20)
+    span = 2 * 365 * 86400
+    now = int(time.time()) if now is None else now
+    posts = {}
+    for i in range(1, n + 1):
+        posts[str(i)] = {
+            "title": " ".join(vocab.sample(rng, rng.randint(2, 8))).capitalize(),
+            "description": " ".join(vocab.sample(rng, rng.randint(10, 60))),
+            "tags": rng.sample(TAGS, rng.randint(0, 4)),
+            "language": meta_rng.choice(LANGUAGES),
+            # a few prolific authors, many occasional ones
+            "user": f"user{int(n_users ** meta_rng.random())}",
+            "feedback": meta_rng.sample(FEEDBACK, meta_rng.randint(0, 2)),
+            "created": now - span + span * i // n,
+        }
+        if code:
+            posts[str(i)]["code"] = _code(code_rng, vocab, posts[str(i)]["language"])
+    return posts
+
+
+def generate_queries(n: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    vocab = _Vocabulary(random.Random(0))
+    return [" ".join(vocab.sample(rng, rng.randint(1, 3))) for _ in range(n)]
@@ -0,0 +1,310 @@
+"""
+A small hand-labelled relevance set: posts with realistic titles and
+descriptions, mixed into a synthetic corpus as the needles, and queries
+with the posts a reader would want for them, graded 2 (what they were
+looking for) or 1 (related). Posts not listed for a query count as 0.
+
+The synthetic posts share the labelled posts' vocabulary (python, cache,
+sort, ...), so the larger the corpus, the more they compete for the top
+ranks. Scores are the usual graded measures over the top ``K`` results.
+"""
+
+import math
+
+# results a query is judged on
+K = 10
+# labelled post ids start here, after any synthetic corpus
+FIRST_ID = 10**9
+
+_POSTS = [
+    # 0: sorting
+    (
+        "TimSort from scratch in Python",
+        "Implementing Tim Sort: natural runs, galloping mode and the merge "
+        "stack invariants, compared with the built-in sorted().",
+        ["python", "algorithms"],
+        "python",
+    ),
+    (
+        "Merge sort in Rust without allocations",
+        "A bottom-up merge sort over slices that reuses one scratch buffer. "
+        "Is the unsafe block in the merge step sound?",
+        ["rust", "algorithms"],
+        "rust",
+    ),
+    (
+        "Choosing a pivot for quick sort",
+        "Median-of-three against a random pivot on sorted and reversed input; "
+        "the worst case still shows up on many equal keys.",
+        ["algorithms", "performance"],
+        "cpp",
+    ),
+    # 3: async
+    (
+        "Understanding the asyncio event loop",
+        "How coroutines, tasks and futures are scheduled by the event loop, "
+        "and why a blocking call freezes every other task.",
+        ["python", "async"],
+        "python",
+    ),
+    (
+        "async/await in JavaScript without callback hell",
+        "Rewriting a promise chain with async functions and await, with error "
+        "handling through try/catch.",
+        ["javascript", "async"],
+        "javascript",
+    ),
+    (
+        "Thread pool or asyncio for HTTP requests?",
+        "Benchmarks of concurrent.futures against an asyncio client for a few "
+        "thousand requests to the same server.",
+        ["python", "performance"],
+        "python",
+    ),
+    # 6: caching
+    (
+        "An LRU cache decorator with expiry",
+        "Like functools.lru_cache, but entries expire after a timeout. Review "
+        "the locking around the ordered dict, please.",
+        ["python", "performance"],
+        "python",
+    ),
+    (
+        "Redis cache invalidation for user profiles",
+        "When a profile changes, which keys to delete, and how to avoid a "
+        "stampede of database queries right after.",
+        ["backend", "performance"],
+        "go",
+    ),
+    (
+        "queryCache: memoizing database results per request",
+        "A QueryCache class keyed on the SQL text and its parameters, cleared "
+        "at the end of every request.",
+        ["backend", "python"],
+        "python",
+    ),
+    # 9: parsing
+    (
+        "parseJson that reports the line of an error",
+        "A small recursive-descent JSON parser in TypeScript whose parseJson "
+        "throws errors with line and column.",
+        ["typescript", "web"],
+        "javascript",
+    ),
+    (
+        "Faster json_parse for big log files",
+        "Streaming JSON lines instead of loading the file; the json_parse "
+        "helper now keeps memory flat.",
+        ["python", "performance"],
+        "python",
+    ),
+    (
+        "XML parser with namespaces",
+        "Handling prefixed element names and default namespaces in a SAX "
+        "style parser.",
+        ["java", "web"],
+        "java",
+    ),
+    # 12: Ukrainian
+    (
+        "Швидкий пошук у бінарному дереві",
+        "Пошук, вставка і видалення у бінарному дереві пошуку; як дерево "
+        "вироджується у список на відсортованих даних.",
+        ["algorithms", "datastructures"],
+        "cpp",
+    ),
+    (
+        "Кешування запитів до бази даних",
+        "Кеш результатів запитів у пам'яті сервера: коли його скидати і "
+        "скільки пам'яті він займає.",
+        ["backend", "performance"],
+        "python",
+    ),
+    (
+        "Binary search tree insert and delete",
+        "Deleting a node with two children by swapping in its successor; "
+        "the tree is not balanced yet.",
+        ["algorithms", "datastructures"],
+        "java",
+    ),
+    # 15: memory
+    (
+        "Fighting the Rust borrow checker",
+        "A graph with parent pointers: Rc<RefCell<Node>> against indices into "
+        "a Vec, and which one leaks memory.",
+        ["rust", "datastructures"],
+        "rust",
+    ),
+    (
+        "Smart pointers and memory leaks in C++",
+        "shared_ptr cycles leak; weak_ptr breaks them. A review of my "
+        "observer pattern.",
+        ["cpp", "security"],
+        "cpp",
+    ),
+    # 17: web frameworks
+    (
+        "Flask blueprints with login required",
+        "Splitting an app into blueprints and protecting routes with a "
+        "login_required decorator and sessions.",
+        ["python", "web"],
+        "python",
+    ),
+    (
+        "Django ORM: N+1 queries in a list view",
+        "select_related and prefetch_related turned 200 queries into 3 on the "
+        "orders page.",
+        ["python", "backend"],
+        "python",
+    ),
+    (
+        "SQLAlchemy joinedload fixes an N+1 problem",
+        "Loading the author of every post in the feed with one query instead "
+        "of one per post.",
+        ["python", "backend"],
+        "python",
+    ),
+    # 20: graphs
+    (
+        "Dijkstra's shortest path with a binary heap",
+        "heapq-based Dijkstra on a weighted graph, with lazy deletion of stale "
+        "queue entries.",
+        ["algorithms", "python"],
+        "python",
+    ),
+    (
+        "Breadth-first search on a grid",
+        "BFS with a deque to find the fewest moves through a maze.",
+        ["algorithms"],
+        "go",
+    ),
+    (
+        "A* pathfinding for a tile game",
+        "A* with a Manhattan heuristic; the path is right but the search "
+        "visits too many tiles.",
+        ["algorithms", "javascript"],
+        "javascript",
+    ),
+    # 23: security
+    (
+        "Preventing SQL injection with parameterized queries",
+        "Replacing string formatting in raw SQL with bound parameters, and "
+        "where the ORM still lets injection through.",
+        ["security", "backend"],
+        "python",
+    ),
+    (
+        "Escaping user input against XSS in templates",
+        "Autoescaping in Jinja templates and the |safe filter that broke it.",
+        ["security", "web"],
+        "python",
+    ),
+    # 25: lexers
+    (
+        "Writing a lexer in Go",
+        "A hand-written lexer emitting tokens over a channel, with state "
+        "functions instead of a big switch.",
+        ["go"],
+        "go",
+    ),
+    (
+        "Regex tokenizer for a calculator",
+        "Splitting arithmetic expressions into tokens with one regular "
+        "expression and named groups.",
+        ["python"],
+        "python",
+    ),
+    # 27: testing
+    (
+        "pytest fixtures for a database",
+        "A session-scoped fixture creates the schema; each test runs in a "
+        "transaction that is rolled back.",
+        ["python", "testing"],
+        "python",
+    ),
+    (
+        "Property-based testing with Hypothesis",
+        "Generating inputs for a sort function and shrinking the failing " "examples.",
+        ["python", "testing"],
+        "python",
+    ),
+    # 29: profiling
+    (
+        "Profiling a slow Python script with cProfile",
+        "Reading cProfile output, sorting by cumulative time, and the one "
+        "function that was called a million times.",
+        ["python", "performance"],
+        "python",
+    ),
+    (
+        "Vectorizing a loop with numpy",
+        "Replacing a Python loop over rows with numpy broadcasting made it 40 "
+        "times faster.",
+        ["python", "performance", "ml"],
+        "python",
+    ),
+]
+
+# query -> {post index in _POSTS: grade}
+_JUDGEMENTS = {
+    "timsort": {0: 2, 1: 1},
+    "merge sort rust": {1: 2, 0: 1},
+    "quicksort pivot": {2: 2},
+    "asyncio event loop": {3: 2, 5: 1},
+    "async await javascript": {4: 2, 3: 1},
+    "lru cache": {6: 2, 7: 1, 8: 1},
+    "queryCache": {8: 2, 6: 1},
+    "parse json": {9: 2, 10: 2},
+    "кеш запитів": {13: 2, 7: 1, 8: 1},
+    "пошук у дереві": {12: 2, 14: 1},
+    "binary search tree": {14: 2, 12: 1},
+    "rust borrow checker memory": {15: 2, 16: 1},
+    "n+1 queries orm": {18: 2, 19: 2},
+    "shortest path": {20: 2, 22: 1, 21: 1},
+    "sql injection": {23: 2},
+    "xss escaping templates": {24: 2},
+    "lexer tokens": {25: 2, 26: 1},
+    "pytest fixtures": {27: 2, 28: 1},
+    "profiling python performance": {29: 2, 30: 1},
+}
+
+
+def labelled_posts(created: int) -> dict[str, dict]:
+    """The labelled posts, in the ``generate_posts`` format."""
+    posts = {}
+    for i, (title, description, tags, language) in enumerate(_POSTS):
+        posts[str(FIRST_ID + i)] = {
+            "title": title,
+            "description": description,
+            "tags": tags,
+            "language": language,
+            "user": "labelled",
+            "feedback": [],
+            "created": created,
+        }
+    return posts
+
+
+def judgements() -> dict[str, dict[str, int]]:
+    """``{query: {post id: grade}}``."""
+    return {
+        query: {str(FIRST_ID + i): grade for i, grade in grades.items()}
+        for query, grades in _JUDGEMENTS.items()
+    }
+
+
+def _dcg(grades) -> float:
+    return sum((2**g - 1) / math.log2(rank + 2) for rank, g in enumerate(grades))
+
+
+def score(ranked: list[str], grades: dict[str, int], k: int = K) -> dict:
+    """nDCG, reciprocal rank and recall of the top ``k`` ``ranked`` post ids."""
+    top = [grades.get(pid, 0) for pid in ranked[:k]]
+    ideal = _dcg(sorted(grades.values(), reverse=True)[:k])
+    first = next((rank for rank, g in enumerate(top) if g > 0), None)
+    found = sum(1 for g in top if g > 0)
+    return {
+        "ndcg": _dcg(top) / ideal if ideal else 0.0,
+        "mrr": 1.0 / (first + 1) if first is not None else 0.0,
+        "recall": found / len(grades) if grades else 0.0,
+    }
@@ -0,0 +1,70 @@
+"""
+Snapshot build time with 1, 2, 4, ... worker processes, up to the number of
+cores and at least 4: speedup over the serial build, and whether the
+snapshot came out the same as the serial one (it must). Rows with more
+workers than cores are marked; they show the overhead, not scaling.
+    python -m benchmarks.search_build --sizes 100000 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from app.main.search_index import DEFAULT_PARAMS, build_snapshot
+from benchmarks.corpus import generate_posts
+
+
+def _same(a, b) -> bool:
+    for key, value in a.arrays.items():
+        other = b.arrays[key]
+        if isinstance(value, np.ndarray):
+            if not np.array_equal(value, other):
+                return False
+        elif value != other:
+            return False
+    skip = ("build_seconds",)
+    return {k: v for k, v in a.meta.items() if k not in skip} == {
+        k: v for k, v in b.meta.items() if k not in skip
+    }
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[w for w in (1, 2, 4, 8, 16, 32) if w <= max(cores, 4)],
+    )
+    parser.add_argument("--code", action="store_true", help="index code as well")
+    args = parser.parse_args()
+    weights = dict(DEFAULT_PARAMS["weights"])
+    if args.code:
+        weights["code"] = 1.0
+
+    print(f"{cores} cores")
+    print(
+        f"{'posts':>8} {'workers':>7} {'build s':>8} {'speedup':>7} "
+        f"{'per core':>8} {'same':>5}"
+    )
+    for size in args.sizes:
+        posts = generate_posts(size, code=args.code)
+        serial = None
+        for workers in args.workers:
+            snap = build_snapshot(posts, workers=workers, weights=weights)
+            seconds = snap.meta["build_seconds"]
+            if serial is None:
+                serial = snap
+            speedup = serial.meta["build_seconds"] / seconds
+            print(
+                f"{size:>8} {workers:>7} {seconds:>8.1f} {speedup:>7.2f} "
+                f"{speedup / workers:>8.2f} {'yes' if _same(serial, snap) else 'NO':>5}"
+                + ("  (more workers than cores)" if workers > cores else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
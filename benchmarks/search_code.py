@@ -0,0 +1,59 @@
+"""
+Cost of indexing the code of posts: build time, snapshot size and postings
+per field with and without the code field, and query latency on identifier
+words. Posts are streamed into the build one at a time, as from the database.
+    python -m benchmarks.search_code --sizes 20000 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.main.search_index import DEFAULT_PARAMS, SearchIndex, build_snapshot
+from benchmarks.corpus import generate_posts, generate_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--code-weight", type=float, default=1.0)
+    args = parser.parse_args()
+    queries = generate_queries(args.queries)
+
+    print(f"{args.queries} queries; latency in ms")
+    print(
+        f"{'posts':>8} {'code':>5} {'build s':>8} {'MB':>7} {'postings':>10} "
+        f"{'code %':>7} {'p50':>6} {'p95':>6}"
+    )
+    for size in args.sizes:
+        posts = generate_posts(size, code=True)
+        for with_code in (False, True):
+            weights = dict(DEFAULT_PARAMS["weights"])
+            if with_code:
+                weights["code"] = args.code_weight
+            snap = build_snapshot(
+                ((pid, post) for pid, post in posts.items()), weights=weights
+            )
+            index = SearchIndex(snap)
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                index.search(q, top_k=20)
+                latencies.append(time.perf_counter() - start)
+            p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+
+            postings = snap.meta["field_postings"]
+            total = sum(postings.values())
+            print(
+                f"{size:>8} {'yes' if with_code else 'no':>5} "
+                f"{snap.meta['build_seconds']:>8.1f} "
+                f"{snap.nbytes() / 2**20:>7.1f} {total:>10} "
+                f"{100 * postings.get('code', 0) / total:>7.1f} "
+                f"{p50:>6.2f} {p95:>6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
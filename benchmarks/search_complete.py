@@ -0,0 +1,63 @@
+"""
+Autocomplete latency of the username/tag prefix index: lookups for prefixes
+of 1 to 4 characters (the first keystrokes hit the widest ranges), and the
+cost of keeping it current (re-ranking an entry) at growing sizes.
+    python -m benchmarks.search_complete --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.main.search_complete import PrefixIndex
+from benchmarks.corpus import SYLLABLES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{args.lookups} lookups per row; latency in microseconds")
+    print(
+        f"{'entries':>8} {'build s':>8} {'prefix':>6} {'p50':>7} {'p95':>7} "
+        f"{'p99':>7} {'update':>7}"
+    )
+    for size in args.sizes:
+        rng = random.Random(3)
+        index = PrefixIndex()
+        start = time.perf_counter()
+        names = []
+        for i in range(size):
+            name = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 5))) + str(i)
+            names.append(name)
+            # a few popular entries, most with little
+            index.set(i, name, int(1000 * rng.paretovariate(1.2)))
+        built = time.perf_counter() - start
+
+        for length in (1, 2, 3, 4):
+            prefixes = [rng.choice(names)[:length] for _ in range(args.lookups)]
+            latencies, updates = [], []
+            for i, prefix in enumerate(prefixes):
+                if i % 10 == 0:
+                    # a post or points change now and then drops cached ranges
+                    entry = rng.randrange(size)
+                    t = time.perf_counter()
+                    index.set(entry, names[entry], rng.randint(0, 10**6))
+                    updates.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                index.complete(prefix, 8)
+                latencies.append(time.perf_counter() - t)
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1e6, [50, 95, 99])
+            update = np.percentile(np.array(updates) * 1e6, 50)
+            print(
+                f"{size:>8} {built:>8.1f} {length:>6} {p50:>7.1f} {p95:>7.1f} "
+                f"{p99:>7.1f} {update:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
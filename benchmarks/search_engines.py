@@ -0,0 +1,68 @@
+"""
+Memory and latency comparison of the search engines:
+    okapi  app.main.search_engine (rank_bm25)
+    bm25   app.main.search_index (in-house, array-backed)
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.main import search_engine, search_index
+from benchmarks.corpus import generate_posts, generate_queries
+
+ENGINES = {"okapi": search_engine, "bm25": search_index}
+
+
+def run_engine(engine, posts: dict, queries: list[str], top_k: int) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    engine.build_index(posts)
+    build_s = time.perf_counter() - start
+
+    # second build under tracemalloc, which slows allocations down too much to
+    # time the first one
+    gc.collect()
+    tracemalloc.start()
+    built = engine.build_index(posts)
+    gc.collect()
+    # everything still allocated after the build is held by the index
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        engine.search(q, *built, top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+    lat_ms = np.array(latencies) * 1000
+
+    return {
+        "build_s": round(build_s, 3),
+        "index_mb": round(index_bytes / 2**20, 1),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--engines", default="okapi,bm25")
+    args = parser.parse_args()
+
+    posts = generate_posts(args.posts)
+    queries = generate_queries(args.queries)
+    print(f"{args.posts} posts, {args.queries} queries, top_k={args.top_k}")
+    for name in args.engines.split(","):
+        result = run_engine(ENGINES[name], posts, queries, args.top_k)
+        print(f"{name:>6}: " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
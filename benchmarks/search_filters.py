@@ -0,0 +1,63 @@
+"""
+Latency of filtered queries (``lang:``, ``tag:``, ``user:``, ``age:``)
+against the same queries without filters, at growing corpus sizes. Filters
+are resolved to slot sets before scoring, so the more selective they are, the
+less of the query's postings is scored. The "facets" column is the plain
+query through ``search_facets``: the same top k plus facet counts.
+    python -m benchmarks.search_filters --sizes 20000 100000 500000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.main.search_index import SearchIndex, build_snapshot
+from benchmarks.corpus import LANGUAGES, TAGS, generate_posts, generate_queries
+
+
+def _percentiles(latencies: list[float]) -> str:
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+    return f"{p50:.2f}/{p95:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000, 500000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    queries = generate_queries(args.queries)
+    suffixes = {
+        "plain": [""] * len(queries),
+        "lang": [f" lang:{rng.choice(LANGUAGES)}" for _ in queries],
+        "tag": [f" tag:{rng.choice(TAGS)}" for _ in queries],
+        "lang+tag": [
+            f" lang:{rng.choice(LANGUAGES)} tag:{rng.choice(TAGS)}" for _ in queries
+        ],
+        "user": [f" user:user{rng.randint(1, 50)}" for _ in queries],
+        "age": [" age:month"] * len(queries),
+        "facets": [""] * len(queries),
+    }
+
+    print(f"p50/p95 latency (ms), {args.queries} queries, top_k={args.top_k}")
+    print(f"{'posts':>8} " + " ".join(f"{name:>12}" for name in suffixes))
+    for size in args.sizes:
+        index = SearchIndex(build_snapshot(generate_posts(size)))
+        row = []
+        for name, suffix in suffixes.items():
+            search = index.search_facets if name == "facets" else index.search
+            latencies = []
+            for q, s in zip(queries, suffix):
+                start = time.perf_counter()
+                search(q + s, top_k=args.top_k)
+                latencies.append(time.perf_counter() - start)
+            row.append(_percentiles(latencies))
+        print(f"{size:>8} " + " ".join(f"{cell:>12}" for cell in row))
+
+
+if __name__ == "__main__":
+    main()
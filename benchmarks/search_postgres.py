@@ -0,0 +1,121 @@
+"""
+Parity and latency of the Postgres full-text backend against the in-house
+BM25F engine, on the same synthetic posts. Needs a PostgreSQL database; the
+posts go to a scratch table, dropped afterwards:
+    python -m benchmarks.search_postgres --dsn postgresql://user:pw@localhost/db
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from app.main.search_index import SearchIndex, build_snapshot
+from app.main.search_postgres import SEARCH_VECTOR, search_sql
+from benchmarks.corpus import generate_posts, generate_queries
+
+TABLE = "bench_search_posts"
+
+
+def _load(conn, posts: dict) -> None:
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    conn.execute(
+        text(
+            f"""
+            CREATE TABLE {TABLE} (
+                id integer PRIMARY KEY,
+                title text NOT NULL,
+                description text NOT NULL,
+                tags text,
+                visibility text NOT NULL DEFAULT 'public',
+                search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED
+            )
+            """
+        )
+    )
+    rows = [
+        {
+            "id": int(pid),
+            "title": p["title"],
+            "description": p["description"],
+            # stored like Post.tags: "python, flask"
+            "tags": ", ".join(p["tags"]),
+        }
+        for pid, p in posts.items()
+    ]
+    conn.execute(
+        text(
+            f"INSERT INTO {TABLE} (id, title, description, tags) "
+            "VALUES (:id, :title, :description, :tags)"
+        ),
+        rows,
+    )
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING gin (search_vector)"))
+    conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+def _percentiles(latencies: list[float]) -> str:
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f"p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch table")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+
+    posts = generate_posts(args.posts)
+    queries = generate_queries(args.queries)
+    index = SearchIndex(build_snapshot(posts))
+    engine = create_engine(args.dsn)
+
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        _load(conn, posts)
+        print(f"{args.posts} posts loaded in {time.perf_counter() - start:.1f}s")
+
+    sql = search_sql(TABLE)
+    timings: dict[str, list[float]] = {"bm25": [], "postgres": []}
+    overlap_10, overlap_k = [], []
+    try:
+        with engine.connect() as conn:
+            for q in queries:
+                start = time.perf_counter()
+                ours = [int(pid) for pid, _ in index.search(q, top_k=args.top_k)]
+                timings["bm25"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                rows = conn.execute(sql, {"query": q, "limit": args.top_k})
+                theirs = [row.id for row in rows]
+                timings["postgres"].append(time.perf_counter() - start)
+
+                # share of one engine's top posts that the other one also ranks
+                for k, acc in ((10, overlap_10), (args.top_k, overlap_k)):
+                    if ours[:k] or theirs[:k]:
+                        common = set(ours[:k]) & set(theirs[:k])
+                        acc.append(len(common) / max(len(ours[:k]), len(theirs[:k])))
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+    print(f"{args.queries} queries, top_k={args.top_k}")
+    print(
+        f"overlap@10={np.mean(overlap_10):.2f} "
+        f"overlap@{args.top_k}={np.mean(overlap_k):.2f}"
+    )
+    for name, latencies in timings.items():
+        print(f"{name:>8}: {_percentiles(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Spelling correction of misspelled query words: latency of the delete-index
+lookup, how often the intended word is among the corrections (and first),
+and the size of the delete index, at growing corpus sizes. Typos are one
+random edit (delete, insert, substitute or swap) of a vocabulary word.
+    python -m benchmarks.search_spell --sizes 20000 100000
+"""
+
+import argparse
+import random
+import string
+import time
+
+import numpy as np
+
+from app.main.search_index import SearchIndex, build_snapshot
+from app.main.search_spell import MAX_EXPANSIONS, is_word
+from benchmarks.corpus import generate_posts
+
+
+def _typo(rng: random.Random, word: str) -> str:
+    i = rng.randrange(len(word))
+    edit = rng.choice(("delete", "insert", "substitute", "swap"))
+    if edit == "delete":
+        return word[:i] + word[i + 1 :]
+    if edit == "insert":
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+    if edit == "substitute":
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1 :]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--typos", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{args.typos} typos per row; latency in ms")
+    print(
+        f"{'posts':>8} {'words':>8} {'deletes':>9} {'MB':>6} {'edits':>5} "
+        f"{'p50':>6} {'p95':>6} {'p99':>6} {'found':>6} {'first':>6}"
+    )
+    for size in args.sizes:
+        snap = build_snapshot(generate_posts(size))
+        index = SearchIndex(snap)
+        vocabulary = snap.arrays["spell_terms"]
+        # misspell common words more often, as people do
+        pairs = [
+            (w, int(df))
+            for w, df in zip(vocabulary, snap.arrays["spell_df"])
+            if len(w) >= 5
+        ]
+        words, weights = [w for w, _ in pairs], [df for _, df in pairs]
+        vocabulary = set(vocabulary)
+        n_deletes = len(snap.arrays["spell_keys"]) + len(snap.arrays["spell_keys2"])
+        nbytes = sum(
+            snap.arrays[k].nbytes
+            for k in (
+                "spell_df",
+                "spell_keys",
+                "spell_ids",
+                "spell_keys2",
+                "spell_ids2",
+            )
+        )
+
+        for edits in (1, 2):
+            rng = random.Random(5)
+            cases = []
+            while len(cases) < args.typos:
+                word = typo = rng.choices(words, weights=weights)[0]
+                for _ in range(edits):
+                    typo = _typo(rng, typo)
+                if is_word(typo) and typo not in vocabulary:
+                    cases.append((word, typo))
+
+            latencies, found, first = [], 0, 0
+            for word, typo in cases:
+                start = time.perf_counter()
+                corrected = index._corrections([typo]).get(typo, [])
+                latencies.append(time.perf_counter() - start)
+                found += word in corrected[:MAX_EXPANSIONS]
+                first += corrected[:1] == [word]
+
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+            print(
+                f"{size:>8} {len(vocabulary):>8} {n_deletes:>9} "
+                f"{nbytes / 2**20:>6.1f} {edits:>5} "
+                f"{p50:>6.3f} {p95:>6.3f} {p99:>6.3f} "
+                f"{found / len(cases):>6.2f} {first / len(cases):>6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
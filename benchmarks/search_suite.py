@@ -0,0 +1,282 @@
+"""
+Search benchmark and relevance regression suite, written as JSON so runs
+can be compared:
+    python -m benchmarks.search_suite --sizes 1000 10000 100000 --out new.json
+    python -m benchmarks.search_suite --sizes 1000000 --engines bm25
+    python -m benchmarks.search_suite --baseline old.json --out new.json
+
+For each corpus size (``corpus.generate_posts`` plus the labelled posts of
+``relevance``) it measures:
+    tokenize  throughput and per-document latency of ``tokenize``
+    okapi     app.main.search_engine (rank_bm25)
+    bm25      app.main.search_index (in-house, array-backed)
+the engines' ``build_index`` time, the memory the index holds afterwards,
+the peak RSS of the build, ``search`` latency percentiles over generated
+queries, and nDCG / MRR / recall of the labelled queries.
+
+Every measurement runs in a fresh process, so its peak RSS is its own.
+With ``--baseline``, relevance that dropped by more than ``--tolerance``
+is reported and the exit status is 1: an engine change must not hurt it.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+
+from app.main import search_engine, search_index
+from benchmarks import relevance
+from benchmarks.corpus import generate_posts, generate_queries
+
+ENGINES = {"okapi": search_engine, "bm25": search_index}
+# queries run before timing, so lazy setup is not measured
+WARMUP = 20
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _rss_mb() -> float | None:
+    """Resident memory of this process now (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _peak_rss_mb() -> float | None:
+    """Highest resident memory of this process so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _round(value, digits: int = 3):
+    return None if value is None else round(value, digits)
+
+
+def _percentiles(latencies: list[float], scale: float) -> dict:
+    p50, p95, p99 = np.percentile(np.array(latencies) * scale, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+
+def _corpus(size: int) -> dict[str, dict]:
+    # a fixed clock, so every process generates the same posts
+    now = 1_700_000_000
+    posts = generate_posts(size, now=now)
+    posts.update(relevance.labelled_posts(created=now))
+    return posts
+
+
+def run_tokenize(size: int) -> dict:
+    posts = _corpus(size)
+    texts = [f"{p['title']}\n{p['description']}" for p in posts.values()]
+    del posts
+    gc.collect()
+
+    latencies = []
+    tokens = 0
+    started = time.perf_counter()
+    for text in texts:
+        start = time.perf_counter()
+        tokens += len(search_engine.tokenize(text))
+        latencies.append(time.perf_counter() - start)
+    total_s = time.perf_counter() - started
+    chars = sum(len(t) for t in texts)
+    return {
+        "docs": len(texts),
+        "tokens": tokens,
+        "total_s": round(total_s, 3),
+        "docs_per_s": round(len(texts) / total_s),
+        "mchars_per_s": round(chars / total_s / 1e6, 2),
+        "latency_us": _percentiles(latencies, 1e6),
+        "peak_rss_mb": _round(_peak_rss_mb(), 1),
+    }
+
+
+def run_engine(name: str, size: int, n_queries: int, top_k: int) -> dict:
+    engine = ENGINES[name]
+    posts = _corpus(size)
+    queries = generate_queries(n_queries)
+    gc.collect()
+    rss_before = _rss_mb()
+
+    start = time.perf_counter()
+    built = engine.build_index(posts)
+    build_s = time.perf_counter() - start
+    gc.collect()
+    rss_after, peak = _rss_mb(), _peak_rss_mb()
+
+    for q in queries[:WARMUP]:
+        engine.search(q, *built, top_k=top_k)
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        engine.search(q, *built, top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+
+    per_query = {}
+    for query, grades in relevance.judgements().items():
+        ranked = [pid for pid, _score in engine.search(query, *built, top_k=top_k)]
+        per_query[query] = {
+            k: round(v, 4) for k, v in relevance.score(ranked, grades).items()
+        }
+    means = {
+        k: round(float(np.mean([s[k] for s in per_query.values()])), 4)
+        for k in ("ndcg", "mrr", "recall")
+    }
+
+    held = None if rss_before is None else rss_after - rss_before
+    grown = None if rss_before is None or peak is None else peak - rss_before
+    return {
+        "build_s": round(build_s, 3),
+        # still resident after the build: the index, plus allocator slack
+        "index_mb": _round(held, 1),
+        # peak growth during the build, over the corpus already in memory
+        "build_rss_mb": _round(grown, 1),
+        "peak_rss_mb": _round(peak, 1),
+        "latency_ms": _percentiles(latencies, 1000),
+        "qps": round(len(latencies) / sum(latencies)),
+        "relevance": {**means, "queries": per_query},
+    }
+
+
+def _isolated(fn, *args):
+    """``fn(*args)`` in a new process, so peak RSS is measured from scratch."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(baseline: dict, result: dict, tolerance: float) -> list[str]:
+    """Relevance drops of more than ``tolerance`` against ``baseline``."""
+    old_runs = {run["size"]: run for run in baseline.get("runs", [])}
+    drops = []
+    for run in result["runs"]:
+        old = old_runs.get(run["size"])
+        if old is None:
+            continue
+        for name, stats in run["engines"].items():
+            old_stats = old["engines"].get(name)
+            if old_stats is None:
+                continue
+            new_rel, old_rel = stats["relevance"], old_stats["relevance"]
+            for metric in ("ndcg", "mrr", "recall"):
+                if new_rel[metric] < old_rel[metric] - tolerance:
+                    drops.append(
+                        f"{name} @ {run['size']}: {metric} "
+                        f"{old_rel[metric]:.4f} -> {new_rel[metric]:.4f}"
+                    )
+            for query, scores in new_rel["queries"].items():
+                before = old_rel["queries"].get(query)
+                if before and scores["ndcg"] < before["ndcg"] - tolerance:
+                    drops.append(
+                        f"{name} @ {run['size']}: {query!r} ndcg "
+                        f"{before['ndcg']:.4f} -> {scores['ndcg']:.4f}"
+                    )
+    return drops
+
+
+def _print_run(run: dict, baseline_run: dict | None) -> None:
+    tok = run["tokenize"]
+    print(
+        f"{run['size']:>8} tokenize: {tok['docs_per_s']} docs/s "
+        f"{tok['mchars_per_s']} Mchars/s p99={tok['latency_us']['p99']}us"
+    )
+    for name, stats in run["engines"].items():
+        lat, rel = stats["latency_ms"], stats["relevance"]
+        line = (
+            f"{'':>8} {name:>8}: build={stats['build_s']}s "
+            f"index={stats['index_mb']}MB peak={stats['peak_rss_mb']}MB "
+            f"p50/p95/p99={lat['p50']}/{lat['p95']}/{lat['p99']}ms "
+            f"ndcg={rel['ndcg']} mrr={rel['mrr']} recall={rel['recall']}"
+        )
+        old = (baseline_run or {}).get("engines", {}).get(name)
+        if old:
+            ratio = lat["p95"] / old["latency_ms"]["p95"]
+            change = rel["ndcg"] - old["relevance"]["ndcg"]
+            line += f" (p95 x{ratio:.2f}, ndcg {change:+.4f})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--engines", default="okapi,bm25")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=relevance.K)
+    parser.add_argument("--out", default="search-suite.json")
+    parser.add_argument("--baseline", help="an earlier --out file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.01)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    baseline_runs = {r["size"]: r for r in (baseline or {}).get("runs", [])}
+
+    result = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "queries": args.queries,
+            "top_k": args.top_k,
+        },
+        "runs": [],
+    }
+    for size in args.sizes:
+        run = {"size": size, "tokenize": _isolated(run_tokenize, size), "engines": {}}
+        for name in args.engines.split(","):
+            run["engines"][name] = _isolated(
+                run_engine, name, size, args.queries, args.top_k
+            )
+        result["runs"].append(run)
+        _print_run(run, baseline_runs.get(size))
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"written to {args.out}")
+
+    if baseline is not None:
+        drops = compare(baseline, result, args.tolerance)
+        for drop in drops:
+            print(f"relevance dropped: {drop}")
+        if drops:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
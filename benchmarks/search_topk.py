@@ -0,0 +1,70 @@
+"""
+Top-k retrieval with MaxScore pruning against exhaustive scoring, on the
+same index: checks that both rank the same posts and compares latencies.
+    python -m benchmarks.search_topk --posts 500000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.main.search_index import SearchIndex, build_snapshot
+from benchmarks.corpus import generate_posts, generate_queries
+
+
+def _percentiles(latencies: list[float]) -> str:
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f"p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument(
+        "--updates",
+        type=int,
+        default=1000,
+        help="posts replaced after the build, to exercise the mutable layer",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    posts = generate_posts(args.posts)
+    index = SearchIndex(build_snapshot(posts))
+    print(f"{args.posts} posts indexed in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(1)
+    replacements = generate_posts(args.updates, seed=2)
+    for pid, post in zip(rng.sample(list(posts), args.updates), replacements.values()):
+        index.add(pid, post)
+
+    queries = generate_queries(args.queries)
+    timings: dict[bool, list[float]] = {True: [], False: []}
+    mismatches = 0
+    for q in queries:
+        results = {}
+        for prune in (False, True):
+            start = time.perf_counter()
+            results[prune] = index.search(q, top_k=args.top_k, prune=prune)
+            timings[prune].append(time.perf_counter() - start)
+
+        exact, pruned = results[False], results[True]
+        same = [pid for pid, _ in exact] == [pid for pid, _ in pruned] and np.allclose(
+            [s for _, s in exact], [s for _, s in pruned]
+        )
+        if not same:
+            mismatches += 1
+            print(f"mismatch: {q!r}")
+
+    print(f"{args.queries} queries, top_k={args.top_k}, {mismatches} mismatches")
+    print(f"exhaustive: {_percentiles(timings[False])}")
+    print(f"  maxscore: {_percentiles(timings[True])}")
+
+
+if __name__ == "__main__":
+    main()
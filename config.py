@@ -11,6 +11,7 @@ load_dotenv()
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
@@ -24,3 +25,50 @@ class Config:
     UPLOAD_PROFILE_FOLDER = os.path.join(BASE_DIR, "app", "static", "profile_pics")
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB
     EMAIL_API_KEY = os.environ.get("EMAIL_API_KEY")
+
+    # "bm25": in-house incremental engine, "okapi": rank_bm25 reference engine,
+    # "postgres": full-text search in the database (PostgreSQL only)
+    SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "bm25")
+    # Shared on-disk search index snapshots; set to "" for per-worker indexes
+    SEARCH_INDEX_DIR = os.environ.get(
+        "SEARCH_INDEX_DIR", os.path.join(BASE_DIR, "instance", "search_index")
+    )
+    # "bm25f": per-field length normalization, "bm25": one weighted bag of words
+    SEARCH_SCORING = os.environ.get("SEARCH_SCORING", "bm25f")
+    # Relevance weight of every indexed field; changes trigger a reindex
+    SEARCH_FIELD_WEIGHTS = {
+        "title": float(os.environ.get("SEARCH_WEIGHT_TITLE", 3)),
+        "description": float(os.environ.get("SEARCH_WEIGHT_DESCRIPTION", 1)),
+        "tags": float(os.environ.get("SEARCH_WEIGHT_TAGS", 4)),
+    }
+    # Weight of the code of posts, split into identifiers; 0 leaves it out
+    SEARCH_WEIGHT_CODE = float(os.environ.get("SEARCH_WEIGHT_CODE", 0))
+    # Processes tokenizing posts while a snapshot is built; 1 builds serially,
+    # as the builds requests start should. `flask build-search-index` takes
+    # its own --workers (default: one per core)
+    SEARCH_BUILD_WORKERS = int(os.environ.get("SEARCH_BUILD_WORKERS", 1))
+    # Per-worker cache of search results, dropped whenever the index changes
+    SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 1024))
+    SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 300))
+    # Seconds between checks of the autocomplete index for new posts and users
+    SEARCH_COMPLETE_SYNC = float(os.environ.get("SEARCH_COMPLETE_SYNC", 1))
+    # Per-worker cache of the affinity profiles of the recommended feed; this
+    # worker's writes drop a profile at once, other workers' within the TTL
+    RECOMMEND_PROFILE_CACHE_SIZE = int(
+        os.environ.get("RECOMMEND_PROFILE_CACHE_SIZE", 4096)
+    )
+    RECOMMEND_PROFILE_CACHE_TTL = int(os.environ.get("RECOMMEND_PROFILE_CACHE_TTL", 60))
+    # Score of the recommended feed's signals (app.main.recommend): posts in
+    # the user's languages, sharing their tags, engagement up to a cap, posted
+    # in the last 3 or 7 days, and the user's own posts
+    RECOMMEND_WEIGHTS = {
+        "language": float(os.environ.get("RECOMMEND_WEIGHT_LANGUAGE", 40)),
+        "tags": float(os.environ.get("RECOMMEND_WEIGHT_TAGS", 30)),
+        "engagement_cap": float(os.environ.get("RECOMMEND_ENGAGEMENT_CAP", 50)),
+        "recent_3d": float(os.environ.get("RECOMMEND_WEIGHT_RECENT_3D", 25)),
+        "recent_7d": float(os.environ.get("RECOMMEND_WEIGHT_RECENT_7D", 10)),
+        "own_post": float(os.environ.get("RECOMMEND_WEIGHT_OWN_POST", -15)),
+    }
+    # Posts each candidate source (recent, top, languages, tags) contributes
+    # to the recommended feed; deeper pages than they fill are not served
+    RECOMMEND_CANDIDATES = int(os.environ.get("RECOMMEND_CANDIDATES", 200))
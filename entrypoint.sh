@@ -21,5 +21,9 @@ done
 
 flask db upgrade
 
+# Publish the search index snapshot once, so workers start without building it
+echo "Building search index..."
+flask build-search-index
+
 echo "Starting Flask..."
 exec gunicorn --workers 5 --bind 0.0.0.0:5000 --access-logfile - --error-logfile - --log-level info run:app
@@ -0,0 +1,24 @@
+"""add an index for the language candidates of the recommended feed
+
+Revision ID: 2c7e94b0d5a1
+Revises: f3a9c5d18e64
+Create Date: 2026-10-18 23:05:48.190372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e94b0d5a1'
+down_revision = 'f3a9c5d18e64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_visibility_language_created_at', 'posts', ['visibility', 'language', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_posts_visibility_language_created_at', table_name='posts')
@@ -0,0 +1,37 @@
+"""add reaction_count and comment_count to posts
+
+Revision ID: 3e8f1b6c7a42
+Revises: 9c27e4d1a5b8
+Create Date: 2026-10-18 09:26:53.207415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8f1b6c7a42'
+down_revision = '9c27e4d1a5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reaction_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill; `flask recount-engagement --check` verifies them later
+    op.execute(
+        'UPDATE posts SET '
+        'reaction_count = (SELECT count(*) FROM reactions WHERE reactions.post_id = posts.id), '
+        'comment_count = (SELECT count(*) FROM comments WHERE comments.post_id = posts.id)'
+    )
+    op.create_index('ix_posts_engagement', 'posts', [sa.text('(reaction_count * 5 + comment_count * 10) DESC'), sa.text('created_at DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_posts_engagement', table_name='posts')
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('reaction_count')
@@ -0,0 +1,29 @@
+"""add related_posts for the "more like this" panel
+
+Revision ID: 5f0d83b2c914
+Revises: e2a9c4f61b37
+Create Date: 2026-10-17 23:18:07.442615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0d83b2c914'
+down_revision = 'e2a9c4f61b37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('related_posts',
+    sa.Column('post_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('related_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('post_id', 'related_id')
+    )
+
+
+def downgrade():
+    op.drop_table('related_posts')
@@ -0,0 +1,33 @@
+"""add indexes for keyset pagination of the feed and battles
+
+Revision ID: 7a1d93c5e0f6
+Revises: 3e8f1b6c7a42
+Create Date: 2026-10-18 11:04:37.918263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1d93c5e0f6'
+down_revision = '3e8f1b6c7a42'
+branch_labels = None
+depends_on = None
+
+ENGAGEMENT = '(reaction_count * 5 + comment_count * 10)'
+
+
+def upgrade():
+    # pages compare (key, ..., id) rows: every index ends with the id
+    op.drop_index('ix_posts_engagement', table_name='posts')
+    op.create_index('ix_posts_engagement', 'posts', ['visibility', sa.text(ENGAGEMENT), 'created_at', 'id'], unique=False)
+    op.create_index('ix_posts_visibility_created_at', 'posts', ['visibility', 'created_at', 'id'], unique=False)
+    op.create_index('ix_battles_visibility_created_at', 'battles', ['visibility', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_battles_visibility_created_at', table_name='battles')
+    op.drop_index('ix_posts_visibility_created_at', table_name='posts')
+    op.drop_index('ix_posts_engagement', table_name='posts')
+    op.create_index('ix_posts_engagement', 'posts', [sa.text(f'{ENGAGEMENT} DESC'), sa.text('created_at DESC')], unique=False)
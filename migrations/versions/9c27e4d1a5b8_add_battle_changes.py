@@ -0,0 +1,29 @@
+"""add battle_changes for the battles search index
+
+Revision ID: 9c27e4d1a5b8
+Revises: 5f0d83b2c914
+Create Date: 2026-10-17 23:52:41.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c27e4d1a5b8'
+down_revision = '5f0d83b2c914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('battle_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('battle_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('battle_changes')
@@ -0,0 +1,29 @@
+"""add post_changes log for incremental search index
+
+Revision ID: b7e41c2d9f03
+Revises: 4558e966e0a1
+Create Date: 2026-10-17 10:12:44.381920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e41c2d9f03'
+down_revision = '4558e966e0a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('post_changes')
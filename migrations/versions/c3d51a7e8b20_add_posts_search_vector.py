@@ -0,0 +1,41 @@
+"""add generated tsvector column and GIN index on posts
+
+Revision ID: c3d51a7e8b20
+Revises: b7e41c2d9f03
+Create Date: 2026-10-17 16:40:12.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d51a7e8b20'
+down_revision = 'b7e41c2d9f03'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def upgrade():
+    # Full-text search is Postgres only; other databases use the in-process
+    # search engines
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True), nullable=True))
+        batch_op.create_index('ix_posts_search_vector', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_search_vector', postgresql_using='gin')
+        batch_op.drop_column('search_vector')
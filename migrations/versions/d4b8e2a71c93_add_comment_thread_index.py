@@ -0,0 +1,26 @@
+"""add an index for paging through the comments of a post
+
+Revision ID: d4b8e2a71c93
+Revises: 7a1d93c5e0f6
+Create Date: 2026-10-18 15:22:09.417530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b8e2a71c93'
+down_revision = '7a1d93c5e0f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_post_created_at', ['post_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_post_created_at')
@@ -0,0 +1,29 @@
+"""add user_changes log for incremental autocomplete
+
+Revision ID: e2a9c4f61b37
+Revises: c3d51a7e8b20
+Create Date: 2026-10-17 22:04:51.208734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c4f61b37'
+down_revision = 'c3d51a7e8b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_changes')
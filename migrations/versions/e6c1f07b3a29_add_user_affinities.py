@@ -0,0 +1,78 @@
+"""add user_affinities for the recommended feed
+
+Revision ID: e6c1f07b3a29
+Revises: d4b8e2a71c93
+Create Date: 2026-10-18 17:41:52.603118
+
+"""
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6c1f07b3a29'
+down_revision = 'd4b8e2a71c93'
+branch_labels = None
+depends_on = None
+
+# app.main.affinity as of this revision
+WEIGHTS = {'posts': 3, 'comments': 2, 'reactions': 1}
+NAME_LENGTH = 50
+CHUNK = 1000
+
+
+def _names(language, tags):
+    names = []
+    language = (language or '').strip().lower()
+    if language and len(language) <= NAME_LENGTH:
+        names.append(('language', language))
+    for tag in (tags or '').split(','):
+        tag = tag.strip().lower()
+        if tag and len(tag) <= NAME_LENGTH and ('tag', tag) not in names:
+            names.append(('tag', tag))
+    return names
+
+
+def upgrade():
+    op.create_table('user_affinities',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'kind', 'name')
+    )
+
+    # backfill from the posts, comments and reactions so far
+    bind = op.get_bind()
+    weights = Counter()
+    for table, weight in WEIGHTS.items():
+        if table == 'posts':
+            query = 'SELECT user_id, language, tags FROM posts'
+        else:
+            query = (
+                f'SELECT {table}.user_id, posts.language, posts.tags FROM {table} '
+                f'JOIN posts ON posts.id = {table}.post_id'
+            )
+        for user_id, language, tags in bind.execute(sa.text(query)):
+            for kind, name in _names(language, tags):
+                weights[(user_id, kind, name)] += weight
+
+    affinities = sa.table('user_affinities',
+        sa.column('user_id', sa.Integer()),
+        sa.column('kind', sa.String()),
+        sa.column('name', sa.String()),
+        sa.column('weight', sa.Integer()),
+    )
+    rows = [
+        {'user_id': user_id, 'kind': kind, 'name': name, 'weight': weight}
+        for (user_id, kind, name), weight in weights.items()
+    ]
+    for start in range(0, len(rows), CHUNK):
+        op.bulk_insert(affinities, rows[start:start + CHUNK])
+
+
+def downgrade():
+    op.drop_table('user_affinities')
@@ -0,0 +1,86 @@
+"""add tags, post_tags and battle_tags
+
+Revision ID: f3a9c5d18e64
+Revises: e6c1f07b3a29
+Create Date: 2026-10-18 20:13:26.884590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c5d18e64'
+down_revision = 'e6c1f07b3a29'
+branch_labels = None
+depends_on = None
+
+# app.main.tags as of this revision
+TAG_LENGTH = 50
+CHUNK = 1000
+
+
+def _split_tags(tags):
+    names = []
+    for tag in (tags or '').split(','):
+        tag = tag.strip().lower()
+        if tag and len(tag) <= TAG_LENGTH and tag not in names:
+            names.append(tag)
+    return names
+
+
+def upgrade():
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('post_tags',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'tag_id')
+    )
+    op.create_table('battle_tags',
+    sa.Column('battle_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['battle_id'], ['battles.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.PrimaryKeyConstraint('battle_id', 'tag_id')
+    )
+
+    # backfill from the tag strings; the indexes are built afterwards
+    bind = op.get_bind()
+    links = {'post_tags': [], 'battle_tags': []}
+    names = {}
+    for table, link, column in (('posts', 'post_tags', 'post_id'), ('battles', 'battle_tags', 'battle_id')):
+        for item_id, tags in bind.execute(sa.text(f'SELECT id, tags FROM {table}')):
+            for name in _split_tags(tags):
+                tag_id = names.setdefault(name, len(names) + 1)
+                links[link].append({column: item_id, 'tag_id': tag_id})
+
+    tags = sa.table('tags', sa.column('id', sa.Integer()), sa.column('name', sa.String()))
+    rows = [{'id': tag_id, 'name': name} for name, tag_id in names.items()]
+    for start in range(0, len(rows), CHUNK):
+        op.bulk_insert(tags, rows[start:start + CHUNK])
+    for link, column in (('post_tags', 'post_id'), ('battle_tags', 'battle_id')):
+        table = sa.table(link, sa.column(column, sa.Integer()), sa.column('tag_id', sa.Integer()))
+        rows = links[link]
+        for start in range(0, len(rows), CHUNK):
+            op.bulk_insert(table, rows[start:start + CHUNK])
+    if bind.dialect.name == 'postgresql' and names:
+        # ids were given explicitly: move the sequence past them
+        op.execute("SELECT setval(pg_get_serial_sequence('tags', 'id'), (SELECT max(id) FROM tags))")
+
+    op.create_index('ix_post_tags_tag_id', 'post_tags', ['tag_id', 'post_id'], unique=False)
+    op.create_index('ix_battle_tags_tag_id', 'battle_tags', ['tag_id', 'battle_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_battle_tags_tag_id', table_name='battle_tags')
+    op.drop_index('ix_post_tags_tag_id', table_name='post_tags')
+    op.drop_table('battle_tags')
+    op.drop_table('post_tags')
+    op.drop_table('tags')
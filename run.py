@@ -2,9 +2,10 @@
 Runner
 """
 
-from os import environ
+from os import cpu_count, environ
 from time import sleep
 
+import click
 import requests
 from app import create_app
 from app.models import Comment, Reaction, User
@@ -189,6 +190,69 @@ def make_admin():
         print(f"Failed to promote user: {e}")
 
 
+@app.cli.command("recount-engagement")
+@click.option("--check", is_flag=True, help="Only report posts whose counts are off.")
+def recount_engagement(check):
+    """Verify (and fix) the reaction and comment counts stored on posts."""
+    from app import db
+    from app.main.engagement import drifted, recount
+
+    rows = drifted()
+    for post_id, reaction_count, reactions, comment_count, comments in rows[:20]:
+        print(
+            f"Post {post_id}: {reaction_count} reactions counted, {reactions} found; "
+            f"{comment_count} comments counted, {comments} found."
+        )
+    if not rows:
+        print("Engagement counts are exact.")
+        return
+    if check:
+        print(f"{len(rows)} posts have wrong engagement counts.")
+        raise SystemExit(1)
+
+    try:
+        recount(post_id for post_id, *_counts in rows)
+        db.session.commit()
+        current_app.logger.info(f"Engagement counts fixed for {len(rows)} posts.")
+        print(f"Engagement counts fixed for {len(rows)} posts.")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error recounting engagement: {e}")
+        print(f"Error recounting engagement: {e}")
+
+
+@app.cli.command("build-search-index")
+@click.option(
+    "--workers",
+    type=int,
+    default=lambda: cpu_count() or 1,
+    show_default="one per core",
+    help="Processes tokenizing posts; 1 builds serially.",
+)
+def build_search_index(workers):
+    """Build the search indexes (and publish the shared snapshots, if enabled)."""
+    from app.main.search import get_index, snapshot_report
+    from app.main.search_query import DOC_TYPES
+
+    # only here: builds started by requests keep SEARCH_BUILD_WORKERS
+    current_app.config["SEARCH_BUILD_WORKERS"] = workers
+    for kind in DOC_TYPES:
+        index = get_index(force_rebuild=True, kind=kind)
+        current_app.logger.info(f"Search index built with {len(index)} {kind}s.")
+        print(f"Search index built with {len(index)} {kind}s.")
+        print(f"Snapshot: {snapshot_report(index.base, kind)}")
+
+
+@app.cli.command("build-related-posts")
+def build_related_posts():
+    """Precompute the "more like this" posts shown on every post page."""
+    from app.main.search import rebuild_related_posts
+
+    rows = rebuild_related_posts()
+    current_app.logger.info(f"Related posts rebuilt: {rows} rows.")
+    print(f"Related posts rebuilt: {rows} rows.")
+
+
 if __name__ == "__main__":
     debug_mode = environ.get("FLASK_DEBUG", "False").lower() == "true"
     app.run(host="0.0.0.0", debug=debug_mode)